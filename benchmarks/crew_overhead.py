@@ -0,0 +1,63 @@
+"""
+Measures the per-request CPU/allocation overhead of building the CrewAI objects,
+comparing a fresh Tool + Agent + Task + Crew per request against checking a ready
+crew out of CREW_POOL. No LLM or network calls are made.
+
+Usage:
+    python benchmarks/crew_overhead.py [--requests 200]
+"""
+import os
+import sys
+import time
+import argparse
+import statistics
+from pathlib import Path
+
+project_root = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(project_root / "src"))
+
+# Construction never reaches the network, so placeholder keys are enough to import the app
+for key in ("EXCHANGE_RATE_API_KEY", "GROQ_API_KEY", "OPENAI_API_KEY", "SERPER_API_KEY", "GOOGLE_API_KEY"):
+    os.environ.setdefault(key, "benchmark-placeholder")
+
+import currency_converter_app as app  # noqa: E402
+
+
+def time_per_call(fn, n: int) -> list:
+    samples = []
+    for _ in range(n):
+        start = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - start) * 1000)
+    return samples
+
+
+def build_per_request():
+    # What get_currency_conversion_response did before pooling: new tool, agent, task and crew
+    app.CurrencyConverterTool()
+    app.build_currency_crew()
+
+
+def checkout_pooled():
+    with app.CREW_POOL.acquire():
+        pass
+
+
+def report(label: str, samples: list) -> None:
+    ordered = sorted(samples)
+    p95 = ordered[int(0.95 * (len(ordered) - 1))]
+    print(f"{label:<28} mean {statistics.mean(samples):8.3f} ms   p50 {statistics.median(samples):8.3f} ms   p95 {p95:8.3f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=200)
+    args = parser.parse_args()
+
+    checkout_pooled()  # warm the pool so the first checkout is not counted as a build
+    report("per-request construction", time_per_call(build_per_request, args.requests))
+    report("pooled crew checkout", time_per_call(checkout_pooled, args.requests))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,73 @@
+"""
+Measures the cold-start cost of `import currency_converter_app` in fresh interpreters and
+checks that crewai and litellm stay unloaded until the agent or LLM parser is first used.
+Exits non-zero when the median import time exceeds --max-seconds or a heavy module is
+loaded eagerly, so it can run as a regression check.
+
+Usage:
+    python benchmarks/import_time.py [--runs 5] [--max-seconds 1.5]
+"""
+import os
+import sys
+import json
+import argparse
+import statistics
+import subprocess
+from pathlib import Path
+
+project_root = Path(__file__).resolve().parent.parent
+
+HEAVY_MODULES = ("crewai", "litellm")
+
+# Runs in the child: time the import and report which heavy modules it pulled in
+PROBE = """
+import sys, json, time
+start = time.perf_counter()
+import currency_converter_app
+seconds = time.perf_counter() - start
+eager = [name for name in {heavy!r} if name in sys.modules]
+start = time.perf_counter()
+currency_converter_app.build_currency_crew()
+print(json.dumps({{"import": seconds, "eager": eager, "first_crew": time.perf_counter() - start}}))
+"""
+
+
+def probe(env) -> dict:
+    result = subprocess.run(
+        [sys.executable, "-c", PROBE.format(heavy=HEAVY_MODULES)],
+        cwd=project_root / "src", env=env, capture_output=True, text=True, check=True,
+    )
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--max-seconds", type=float, default=1.5, help="fail when the median import takes longer")
+    args = parser.parse_args()
+
+    env = dict(os.environ)
+    # Importing never reaches the network, so placeholder keys are enough
+    for key in ("EXCHANGE_RATE_API_KEY", "GROQ_API_KEY"):
+        env.setdefault(key, "benchmark-placeholder")
+    env.setdefault("LITELLM_LOCAL_MODEL_COST_MAP", "True")
+
+    samples = [probe(env) for _ in range(args.runs)]
+    imports = [sample["import"] * 1000 for sample in samples]
+    crews = [sample["first_crew"] * 1000 for sample in samples]
+    eager = sorted({name for sample in samples for name in sample["eager"]})
+
+    print(f"import currency_converter_app   median {statistics.median(imports):8.1f} ms   max {max(imports):8.1f} ms")
+    print(f"first crew (loads crewai)       median {statistics.median(crews):8.1f} ms   max {max(crews):8.1f} ms")
+    failures = []
+    if eager:
+        failures.append(f"imported eagerly: {', '.join(eager)}")
+    if statistics.median(imports) > args.max_seconds * 1000:
+        failures.append(f"median import exceeds {args.max_seconds:g}s")
+    for failure in failures:
+        print(f"REGRESSION: {failure}")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
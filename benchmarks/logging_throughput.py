@@ -0,0 +1,152 @@
+"""
+Measures how request logging affects throughput. Direct-mode conversions run from
+concurrent threads with three logger setups: a synchronous handler at DEBUG (every
+diagnostic line written inline, as the old print calls did), the default queued handler
+at INFO, and production mode (queued, WARNING). A second comparison runs the insight
+crew against a canned LLM with verbose agent traces on and off.
+Rates are seeded in memory and the LLM is faked, so no network calls are made.
+Log output goes to a temporary file; --sink-latency-ms adds a delay per write to model
+a slow terminal or log shipper.
+
+Usage:
+    python benchmarks/logging_throughput.py [--requests 2000] [--threads 8] [--rounds 3] [--sink-latency-ms 0]
+                                              [--agent-requests 50]
+"""
+import os
+import sys
+import time
+import logging
+import argparse
+import tempfile
+import contextlib
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+project_root = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(project_root / "src"))
+
+# Rates are seeded and the LLM is faked, so placeholder keys are enough to import the app
+for key in ("EXCHANGE_RATE_API_KEY", "GROQ_API_KEY", "OPENAI_API_KEY", "SERPER_API_KEY", "GOOGLE_API_KEY"):
+    os.environ.setdefault(key, "benchmark-placeholder")
+os.environ.setdefault("LITELLM_LOCAL_MODEL_COST_MAP", "True")
+os.environ["RATE_ARCHIVE_DIR"] = ""  # Keep the benchmark from writing rate archives
+os.environ.pop("SHARED_RATE_STORE_DIR", None)
+
+import currency_converter_app as app  # noqa: E402
+from crewai import BaseLLM  # noqa: E402
+
+QUERIES = ["convert 100 USD to EUR", "250 GBP to JPY", "how much is 75.5 EUR in CAD", "1200 JPY to USD"]
+
+
+class CannedLLM(BaseLLM):
+    """Answers every agent turn with a final answer, so a kickoff costs only CrewAI's own work."""
+
+    def __init__(self):
+        super().__init__(model="benchmark-canned")
+
+    def call(self, messages, tools=None, callbacks=None, available_functions=None, **kwargs):
+        return "Thought: I now know the final answer\nFinal Answer: 100 USD is 92 EUR."
+
+    def supports_function_calling(self):
+        return False
+
+    def supports_stop_words(self):
+        return False
+
+    def get_context_window_size(self):
+        return 8192
+
+
+class SlowSink:
+    """File wrapper that blocks for `latency` seconds on every write."""
+
+    def __init__(self, stream, latency: float):
+        self.stream = stream
+        self.latency = latency
+
+    def write(self, text):
+        if self.latency:
+            time.sleep(self.latency)
+        return self.stream.write(text)
+
+    def flush(self):
+        self.stream.flush()
+
+
+def seed_rates() -> None:
+    now = time.time()
+    rates = {"USD": 1.0, "EUR": 0.92, "GBP": 0.79, "JPY": 151.2, "CAD": 1.36}
+    app.RATE_CACHE._store(app.ANCHOR_CURRENCY, rates, now + 3600, now)
+
+
+def direct_throughput(requests: int, threads: int) -> float:
+    def one(i):
+        app.get_currency_conversion_response(QUERIES[i % len(QUERIES)], mode="direct")
+
+    with ThreadPoolExecutor(max_workers=threads) as pool:
+        start = time.perf_counter()
+        list(pool.map(one, range(requests)))
+    return requests / (time.perf_counter() - start)
+
+
+def use_synchronous_logging(sink, level: str) -> None:
+    handler = logging.StreamHandler(sink)
+    handler.setFormatter(logging.Formatter(app.LOG_FORMAT))
+    app.configure_logging(level)
+    app.logger.handlers = [handler]  # Write inline on the request thread instead of through the queue
+
+
+def agent_ms_per_request(requests: int, verbose: bool) -> float:
+    app.AGENT_VERBOSE = verbose
+    app.GROQ_AGENT_MODEL = CannedLLM()
+    crew = app.build_currency_crew()
+    inputs = app.task_inputs({"amount": 100.0, "from_currency": "USD", "to_currency": "EUR"})
+    crew.kickoff(inputs=inputs)  # first kickoff pays one-off CrewAI setup
+    start = time.perf_counter()
+    for _ in range(requests):
+        crew.kickoff(inputs=inputs)
+    return (time.perf_counter() - start) * 1000 / requests
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--threads", type=int, default=8)
+    parser.add_argument("--rounds", type=int, default=3, help="direct-mode rounds per setup; the best is reported")
+    parser.add_argument("--sink-latency-ms", type=float, default=0.0)
+    parser.add_argument("--agent-requests", type=int, default=50)
+    args = parser.parse_args()
+
+    seed_rates()
+    with tempfile.TemporaryFile("w") as log_file:
+        sink = SlowSink(log_file, args.sink_latency_ms / 1000)
+        app.configure_logging("WARNING", logging.StreamHandler(sink))
+        direct_throughput(50, args.threads)  # warm up parse cache and formatting paths
+        setups = {
+            "sync": lambda: use_synchronous_logging(sink, "DEBUG"),
+            "queued": lambda: app.configure_logging("INFO", logging.StreamHandler(sink)),
+            "production": lambda: app.configure_logging("WARNING", logging.StreamHandler(sink)),
+        }
+        best = dict.fromkeys(setups, 0.0)
+        for _ in range(args.rounds):  # Interleave setups so drift in machine load hits all of them
+            for name, setup in setups.items():
+                setup()
+                best[name] = max(best[name], direct_throughput(args.requests, args.threads))
+
+        # Verbose agent traces go to stdout; send them to the sink so only their cost is measured
+        with contextlib.redirect_stdout(sink):
+            verbose_ms = agent_ms_per_request(args.agent_requests, verbose=True)
+            quiet_ms = agent_ms_per_request(args.agent_requests, verbose=False)
+
+    print(f"direct mode, {args.threads} threads, {args.requests} requests, "
+          f"{args.sink_latency_ms:g} ms per log write")
+    print(f"  synchronous DEBUG logging   {best['sync']:10.0f} req/s")
+    print(f"  queued INFO logging         {best['queued']:10.0f} req/s")
+    print(f"  production (queued WARNING) {best['production']:10.0f} req/s")
+    print(f"insight crew with a canned LLM, {args.agent_requests} requests")
+    print(f"  verbose agent traces        {verbose_ms:10.2f} ms/request")
+    print(f"  production (verbose off)    {quiet_ms:10.2f} ms/request")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,216 @@
+"""
+Local stand-ins for the app's two upstream services, so benchmarks spend no API quota:
+
+* StubExchangeRateAPI: an HTTP server speaking ExchangeRate-API's `/latest/` and `/history/`
+  routes, with configurable latency, jitter, error rate and request quota.
+* FakeCompletion: a drop-in for litellm's completion/acompletion that returns canned parser
+  JSON after a configurable delay.
+* CannedLLM: a CrewAI LLM that answers every agent turn with a final answer.
+"""
+import json
+import random
+import re
+import threading
+import time
+import asyncio
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from types import SimpleNamespace
+from typing import Any, Dict, Optional
+
+# Units of each currency per US dollar
+STUB_RATES = {
+    "USD": 1.0, "EUR": 0.92, "GBP": 0.79, "JPY": 151.2, "CAD": 1.36, "AUD": 1.52,
+    "CHF": 0.88, "CNY": 7.24, "INR": 83.4, "NGN": 1480.0, "ZAR": 18.6, "MXN": 17.1,
+}
+
+
+class StubExchangeRateAPI:
+    """
+    Serves rate tables for STUB_RATES on 127.0.0.1. Each request sleeps `latency_ms` plus up to
+    `jitter_ms`; a fraction `error_rate` of requests gets an HTTP 503 instead. With `quota_rps`
+    set, requests beyond that many per second get a 429 with `Retry-After: 1`.
+    Use `base_url` as EXCHANGE_RATE_API_BASE_URL.
+    """
+
+    def __init__(self, latency_ms: float = 0.0, jitter_ms: float = 0.0, error_rate: float = 0.0, seed: int = 0,
+                 quota_rps: float = 0.0):
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.error_rate = error_rate
+        self.quota_rps = quota_rps
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self._quota = quota_rps
+        self._quota_updated = time.monotonic()
+        self.requests = 0
+        self.errors = 0
+        self.throttled = 0
+        self._server = ThreadingHTTPServer(("127.0.0.1", 0), self._handler_class())
+        self._server.daemon_threads = True
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def base_url(self) -> str:
+        return f"http://127.0.0.1:{self._server.server_port}/v6"
+
+    def start(self) -> "StubExchangeRateAPI":
+        self._thread = threading.Thread(target=self._server.serve_forever, name="stub-exchangerate-api", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self._server.shutdown()
+        self._server.server_close()
+
+    def stats(self) -> Dict[str, Any]:
+        return {"requests": self.requests, "errors": self.errors, "throttled": self.throttled,
+                "latency_ms": self.latency_ms, "jitter_ms": self.jitter_ms, "error_rate": self.error_rate,
+                "quota_rps": self.quota_rps}
+
+    def _over_quota(self) -> bool:
+        if not self.quota_rps:
+            return False
+        now = time.monotonic()
+        self._quota = min(self.quota_rps, self._quota + (now - self._quota_updated) * self.quota_rps)
+        self._quota_updated = now
+        if self._quota < 1:
+            return True
+        self._quota -= 1
+        return False
+
+    def _plan(self) -> "tuple[float, int]":
+        """(delay in seconds, HTTP status: 200, 429 over quota or 503 injected error) for the next request."""
+        with self._lock:
+            self.requests += 1
+            if self._over_quota():
+                self.throttled += 1
+                return 0.0, 429
+            delay = (self.latency_ms + self._random.uniform(0, self.jitter_ms)) / 1000
+            fail = self._random.random() < self.error_rate
+            if fail:
+                self.errors += 1
+        return delay, 503 if fail else 200
+
+    def _payload(self, path: str) -> Dict[str, Any]:
+        parts = path.strip("/").split("/")
+        if "latest" in parts:
+            base = parts[parts.index("latest") + 1].upper()
+        else:
+            base = parts[parts.index("history") + 1].upper()
+        if base not in STUB_RATES:
+            return {"result": "error", "error-type": "unsupported-code"}
+        return {
+            "result": "success", "base_code": base, "time_next_update_unix": int(time.time()) + 3600,
+            "conversion_rates": {code: rate / STUB_RATES[base] for code, rate in STUB_RATES.items()},
+        }
+
+    def _handler_class(self):
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"  # keep-alive, like the real API
+
+            def log_message(self, *args):
+                pass
+
+            def do_GET(self):
+                delay, status = stub._plan()
+                if delay:
+                    time.sleep(delay)
+                if status == 429:
+                    body = b'{"result": "error", "error-type": "rate-limited"}'
+                elif status == 503:
+                    body = b'{"result": "error", "error-type": "service-unavailable"}'
+                else:
+                    try:
+                        body, status = json.dumps(stub._payload(self.path)).encode(), 200
+                    except (ValueError, IndexError):
+                        body, status = b'{"result": "error", "error-type": "malformed-request"}', 404
+                self.send_response(status)
+                if status == 429:
+                    self.send_header("Retry-After", "1")
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+        return Handler
+
+
+# Parser replies for the benchmark's natural-language queries, keyed by lower-cased query
+CANNED_PARSES = {
+    "what would a hundred quid get me in euros": {"amount": 100, "from_currency": "GBP", "to_currency": "EUR"},
+    "i need to send fifty bucks to someone in lagos": {"amount": 50, "from_currency": "USD", "to_currency": "NGN"},
+    "how many yen is two thousand aussie dollars": {"amount": 2000, "from_currency": "AUD", "to_currency": "JPY"},
+    "price of a 300 franc watch in rupees": {"amount": 300, "from_currency": "CHF", "to_currency": "INR"},
+}
+DEFAULT_PARSE = {"amount": 100, "from_currency": "USD", "to_currency": "EUR"}
+_QUERY_PATTERN = re.compile(r'User query: "(.*)"\s*JSON Output', re.DOTALL | re.IGNORECASE)
+
+
+class FakeCompletion:
+    """
+    Stands in for litellm.completion: sleeps `latency_ms`, then returns a litellm-shaped
+    response whose content is the canned parse for the query in the prompt.
+    `acall` is the acompletion counterpart.
+    """
+
+    def __init__(self, latency_ms: float = 0.0):
+        self.latency_ms = latency_ms
+        self.calls = 0
+        self._lock = threading.Lock()
+
+    def _response(self, messages) -> SimpleNamespace:
+        with self._lock:
+            self.calls += 1
+        prompt = messages[-1]["content"]
+        match = _QUERY_PATTERN.search(prompt)
+        query = match.group(1).strip().lower() if match else ""
+        content = json.dumps(CANNED_PARSES.get(query, DEFAULT_PARSE))
+        return SimpleNamespace(
+            choices=[SimpleNamespace(message=SimpleNamespace(content=content))],
+            usage=SimpleNamespace(prompt_tokens=len(prompt) // 4, completion_tokens=len(content) // 4),
+        )
+
+    def __call__(self, model: str = "", messages=(), **kwargs: Any) -> SimpleNamespace:
+        if self.latency_ms:
+            time.sleep(self.latency_ms / 1000)
+        return self._response(messages)
+
+    async def acall(self, model: str = "", messages=(), **kwargs: Any) -> SimpleNamespace:
+        if self.latency_ms:
+            await asyncio.sleep(self.latency_ms / 1000)
+        return self._response(messages)
+
+    def install(self, app) -> None:
+        """Routes the app's completion/acompletion wrappers to this fake."""
+        app.completion = self
+        app.acompletion = self.acall
+
+
+def canned_llm_class():
+    """CannedLLM, defined on demand because importing crewai takes seconds."""
+    from crewai import BaseLLM
+
+    class CannedLLM(BaseLLM):
+        """Answers every agent turn with a final answer, so a kickoff costs only CrewAI's own work."""
+
+        def __init__(self, latency_ms: float = 0.0):
+            super().__init__(model="benchmark-canned")
+            self.latency_ms = latency_ms
+
+        def call(self, messages, tools=None, callbacks=None, available_functions=None, **kwargs):
+            if self.latency_ms:
+                time.sleep(self.latency_ms / 1000)
+            return "Thought: I now know the final answer\nFinal Answer: 100 USD is 92.00 EUR at today's rates."
+
+        def supports_function_calling(self):
+            return False
+
+        def supports_stop_words(self):
+            return False
+
+        def get_context_window_size(self):
+            return 8192
+
+    return CannedLLM
@@ -0,0 +1,222 @@
+"""
+Offline benchmark suite. Runs the app's hot paths under concurrent load against local
+stand-ins (see offline_stubs.py): a stub ExchangeRate-API server with configurable latency
+and error rate, and a fake litellm completion backend returning canned parser JSON.
+
+Scenarios:
+    tool_run         CurrencyConverterTool._run over a mix of currency pairs
+    llm_parse        parse_query_with_llm on natural-language queries
+    response_direct  get_currency_conversion_response in direct mode (fast-path and LLM-parsed queries)
+    response_insight get_currency_conversion_response in insight mode, with a canned agent LLM
+    flask_convert    POST /convert on a local threaded werkzeug server
+
+Throughput and latency percentiles for every scenario are written as JSON to --output,
+so runs can be compared. --cold-rates expires rate tables at once, so every lookup
+reaches the stub API instead of the in-memory cache. --api-quota-rps makes the stub answer
+429 above that rate, to exercise the upstream scheduler's backoff; the scheduler's own
+limits are raised out of the way unless EXCHANGE_RATE_API_RATE_PER_SECOND or
+GROQ_RATE_PER_SECOND are set.
+
+Usage:
+    python benchmarks/offline_suite.py [--requests 400] [--concurrency 8] [--api-latency-ms 40]
+        [--api-jitter-ms 20] [--api-error-rate 0.0] [--api-quota-rps 0] [--llm-latency-ms 150] [--cold-rates]
+        [--scenarios tool_run,llm_parse,...] [--output benchmarks/results/offline.json]
+"""
+import os
+import sys
+import json
+import math
+import logging
+import time
+import argparse
+import platform
+import statistics
+import subprocess
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from pathlib import Path
+
+project_root = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(project_root / "src"))
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+
+from offline_stubs import CANNED_PARSES, STUB_RATES, FakeCompletion, StubExchangeRateAPI, canned_llm_class  # noqa: E402
+
+SCENARIOS = ("tool_run", "llm_parse", "response_direct", "response_insight", "flask_convert")
+FAST_PATH_QUERIES = ["convert 100 USD to EUR", "250 GBP to JPY", "how much is 75.5 EUR in CAD", "1200 JPY to USD"]
+LLM_QUERIES = list(CANNED_PARSES)
+PAIRS = [(a, b) for a in STUB_RATES for b in STUB_RATES if a != b]
+
+
+def percentile(sorted_values, fraction):
+    """Nearest-rank percentile, matching the app's piped-mode summary."""
+    return sorted_values[max(1, math.ceil(len(sorted_values) * fraction)) - 1]
+
+
+def run_load(call, requests, concurrency):
+    """Runs call(i) for i in range(requests) on `concurrency` threads. call returns True on success."""
+    latencies = [0.0] * requests
+    failures = [0]
+    lock = threading.Lock()
+
+    def one(i):
+        start = time.perf_counter()
+        try:
+            ok = call(i)
+        except Exception:
+            ok = False
+        latencies[i] = (time.perf_counter() - start) * 1000
+        if not ok:
+            with lock:
+                failures[0] += 1
+
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        started = time.perf_counter()
+        list(pool.map(one, range(requests)))
+        seconds = time.perf_counter() - started
+
+    ordered = sorted(latencies)
+    return {
+        "requests": requests, "errors": failures[0], "concurrency": concurrency, "seconds": round(seconds, 4),
+        "throughput_rps": round(requests / seconds, 2),
+        "latency_ms": {
+            "mean": round(statistics.mean(ordered), 3), "p50": round(percentile(ordered, 0.50), 3),
+            "p90": round(percentile(ordered, 0.90), 3), "p95": round(percentile(ordered, 0.95), 3),
+            "p99": round(percentile(ordered, 0.99), 3), "max": round(ordered[-1], 3),
+        },
+    }
+
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=project_root,
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=400, help="requests per scenario")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--api-latency-ms", type=float, default=40.0)
+    parser.add_argument("--api-jitter-ms", type=float, default=20.0)
+    parser.add_argument("--api-error-rate", type=float, default=0.0, help="fraction of stub API calls answered with 503")
+    parser.add_argument("--api-quota-rps", type=float, default=0.0, help="stub API requests per second before it answers 429")
+    parser.add_argument("--llm-latency-ms", type=float, default=150.0, help="delay of each fake completion")
+    parser.add_argument("--agent-latency-ms", type=float, default=300.0, help="delay of each canned agent LLM turn")
+    parser.add_argument("--cold-rates", action="store_true", help="expire rate tables immediately")
+    parser.add_argument("--scenarios", default=",".join(SCENARIOS))
+    parser.add_argument("--output", default=str(project_root / "benchmarks" / "results" /
+                                                f"offline-{datetime.now():%Y%m%d-%H%M%S}.json"))
+    args = parser.parse_args()
+    selected = [name.strip() for name in args.scenarios.split(",") if name.strip()]
+    unknown = sorted(set(selected) - set(SCENARIOS))
+    if unknown:
+        parser.error(f"unknown scenarios: {', '.join(unknown)}")
+
+    stub = StubExchangeRateAPI(args.api_latency_ms, args.api_jitter_ms, args.api_error_rate,
+                               quota_rps=args.api_quota_rps).start()
+    # The app reads its configuration at import, so point it at the stubs first
+    os.environ["EXCHANGE_RATE_API_BASE_URL"] = stub.base_url
+    for key in ("EXCHANGE_RATE_API_KEY", "GROQ_API_KEY"):
+        os.environ.setdefault(key, "benchmark-placeholder")
+    os.environ.setdefault("LITELLM_LOCAL_MODEL_COST_MAP", "True")
+    os.environ.setdefault("PRODUCTION_MODE", "true")  # quiet logs, no verbose agent traces
+    # The stubs have no real quota, so pacing would only measure the scheduler's configured rate
+    os.environ.setdefault("EXCHANGE_RATE_API_RATE_PER_SECOND", "100000")
+    os.environ.setdefault("EXCHANGE_RATE_API_BURST", "1000")
+    os.environ.setdefault("GROQ_RATE_PER_SECOND", "100000")
+    os.environ.setdefault("GROQ_BURST", "1000")
+    os.environ["RATE_ARCHIVE_DIR"] = ""
+    os.environ["RATE_REFRESH_ENABLED"] = "false"
+    os.environ.pop("SHARED_RATE_STORE_DIR", None)
+    os.environ.pop("TRACE_EXPORT_PATH", None)
+    if args.cold_rates:
+        os.environ["RATE_CACHE_TTL_SECONDS"] = "0"
+        os.environ["RATE_MAX_STALENESS_SECONDS"] = "0"
+
+    import currency_converter_app as app
+    import web_app
+
+    fake_completion = FakeCompletion(args.llm_latency_ms)
+    fake_completion.install(app)
+    is_error = web_app.is_error_response
+
+    def tool_run(i):
+        from_currency, to_currency = PAIRS[i % len(PAIRS)]
+        return not is_error(tool._run(100.0, from_currency, to_currency))
+
+    def llm_parse(i):
+        return app.parse_query_with_llm(LLM_QUERIES[i % len(LLM_QUERIES)]) is not None
+
+    def response(mode):
+        queries = FAST_PATH_QUERIES + LLM_QUERIES
+
+        def call(i):
+            return not is_error(app.get_currency_conversion_response(queries[i % len(queries)], mode=mode))
+        return call
+
+    def flask_convert(i):
+        if not hasattr(sessions, "session"):
+            sessions.session = requests_lib.Session()  # one keep-alive connection per load thread
+        queries = FAST_PATH_QUERIES + LLM_QUERIES
+        reply = sessions.session.post(server_url, json={"query": queries[i % len(queries)], "mode": "direct"}, timeout=30)
+        return reply.status_code == 200
+
+    results = {}
+    for name in selected:
+        if name == "tool_run":
+            tool = app.CurrencyConverterTool()  # imports crewai, outside the timed region
+            call = tool_run
+        elif name == "llm_parse":
+            call = llm_parse
+        elif name == "response_direct":
+            call = response("direct")
+        elif name == "response_insight":
+            app.GROQ_AGENT_MODEL = canned_llm_class()(args.agent_latency_ms)
+            app.GROQ_AGENT_SMALL_MODEL = app.GROQ_AGENT_MODEL  # route every agent run to the canned LLM
+            app.CREW_POOL = app.CrewPool(max_size=args.concurrency)
+            call = response("insight")
+        else:
+            import requests as requests_lib
+            from werkzeug.serving import make_server
+            logging.getLogger("werkzeug").setLevel(logging.WARNING)  # no access log line per request
+            logging.getLogger("currency_converter.web").setLevel(logging.ERROR)  # errors are counted instead
+            server = make_server("127.0.0.1", 0, web_app.create_app(), threaded=True)
+            threading.Thread(target=server.serve_forever, daemon=True).start()
+            server_url = f"http://127.0.0.1:{server.server_port}/convert"
+            sessions = threading.local()
+            call = flask_convert
+        api_calls, llm_calls = stub.requests, fake_completion.calls
+        results[name] = run_load(call, args.requests, args.concurrency)
+        results[name]["upstream_api_calls"] = stub.requests - api_calls
+        results[name]["llm_calls"] = fake_completion.calls - llm_calls
+        if name == "flask_convert":
+            server.shutdown()
+        latency = results[name]["latency_ms"]
+        print(f"{name:<17} {results[name]['throughput_rps']:9.1f} req/s   p50 {latency['p50']:8.2f} ms   "
+              f"p95 {latency['p95']:8.2f} ms   p99 {latency['p99']:8.2f} ms   errors {results[name]['errors']}")
+    stub.stop()
+
+    report = {
+        "timestamp": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "git_commit": git_commit(),
+        "python": platform.python_version(),
+        "cpu_count": os.cpu_count(),
+        "config": {key: value for key, value in vars(args).items() if key != "output"},
+        "stub_api": stub.stats(),
+        "upstream": [scheduler.stats() for scheduler in app.UPSTREAM_SCHEDULERS],
+        "llm_routing": app.MODEL_ROUTER.stats(),
+        "answer_cache": app.ANSWER_CACHE.stats() if app.ANSWER_CACHE is not None else None,
+        "scenarios": results,
+    }
+    output = Path(args.output)
+    output.parent.mkdir(parents=True, exist_ok=True)
+    output.write_text(json.dumps(report, indent=2) + "\n", encoding="utf-8")
+    print(f"Wrote {output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,70 +1,30 @@
 import os
-import re
-import sys
 import logging
 from pathlib import Path
 from dotenv import load_dotenv
 
-# Define log directory path
-LOGS_DIR = Path(__file__).parent.parent / 'logs'
-# Create logs directory if it doesn't exist
-LOGS_DIR.mkdir(parents=True, exist_ok=True)
+# A child of the app's logger, so these records share its queued handler once the app is loaded
+logger = logging.getLogger("currency_converter.config")
 
-# Configure logging before other imports
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.FileHandler(LOGS_DIR / 'config.log'),
-        logging.StreamHandler()
-    ]
-)
-logger = logging.getLogger(__name__)
+# Path configuration
+root_dir = Path(__file__).parent.parent.resolve()
+env_path = root_dir / '.env'
 
-try:
-    # Path configuration
-    root_dir = Path(__file__).parent.parent.resolve()
-    env_path = root_dir / '.env'
+# Attempt to load .env if it exists. If not, it will do nothing (deployments rely on the environment).
+load_dotenv(env_path)
+logger.debug(f"Loaded environment variables from {env_path}")
 
-    # Check for .env existence (optional for deployment, useful locally)
-    # if not env_path.exists():
-    #     logger.warning(f"No .env file found at {env_path}. Relying solely on system environment variables.")
-        # sys.exit(1) # DO NOT EXIT IN DEPLOYMENT IF FILE IS MISSING
+KNOWN_VARS = [
+    'OPENAI_API_KEY', 'SERPER_API_KEY', 'EXCHANGE_RATE_API_KEY', 'GOOGLE_API_KEY', 'GROQ_API_KEY'
+]
 
-    # Attempt to load .env if it exists. If not, it will do nothing.
-    load_dotenv(env_path)
-    logger.info(f"Loaded environment variables from {env_path}")
+# Export variables. A missing key is None; the app checks only the keys its response mode needs
+# (see check_config in currency_converter_app), so unused keys never block startup.
+OPENAI_API_KEY = os.getenv('OPENAI_API_KEY')
+SERPER_API_KEY = os.getenv('SERPER_API_KEY')
+EXCHANGE_RATE_API_KEY = os.getenv('EXCHANGE_RATE_API_KEY')
+GOOGLE_API_KEY = os.getenv('GOOGLE_API_KEY')
+GROQ_API_KEY = os.getenv('GROQ_API_KEY')
 
-    # Required environment variables
-    REQUIRED_VARS = [
-        'OPENAI_API_KEY', 'SERPER_API_KEY', 'EXCHANGE_RATE_API_KEY', 'GOOGLE_API_KEY', 'GROQ_API_KEY'
-    ]
 
-    # Load environment variables
-    config = {var: os.getenv(var) for var in REQUIRED_VARS}
-
-    missing_vars = [var for var in REQUIRED_VARS if config[var] is None]
-    if missing_vars:
-        logger.critical(f"Missing required environment variables: {', '.join(missing_vars)}")
-        sys.exit(1)
-
-    # Export variables
-    OPENAI_API_KEY = config['OPENAI_API_KEY']
-    SERPER_API_KEY = config['SERPER_API_KEY']
-    EXCHANGE_RATE_API_KEY = config['EXCHANGE_RATE_API_KEY']
-    GOOGLE_API_KEY = config['GOOGLE_API_KEY']
-    GROQ_API_KEY = config['GROQ_API_KEY']
-
-    sensitive_vars = ['OPENAI_API_KEY', 'SERPER_API_KEY', 'EXCHANGE_RATE_API_KEY', 'GOOGLE_API_KEY', 'GROQ_API_KEY']
-    for var in REQUIRED_VARS:
-        value = locals().get(var, '')
-        logged_value = f"{value[:2]}****{value[-2:]}" if var in sensitive_vars and len(value) > 4 else str(value)
-        logger.info(f"{var}: {logged_value}")
-
-    logger.info("Configuration loaded successfully")
-
-except Exception as e:
-    logger.critical(f"Configuration initialization failed: {str(e)}")
-    sys.exit(1)
-
-__all__ = REQUIRED_VARS
+__all__ = KNOWN_VARS
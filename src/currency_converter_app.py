@@ -1,16 +1,123 @@
 import os
 import sys
+import atexit
+import logging
+import re
 import json
+import asyncio
+import argparse
+import csv
+import io
+import itertools
+import weakref
+import time
+import uuid
+import bisect
+import heapq
+import math
+import random
+import mmap
+import queue
+import struct
+import tempfile
+import sqlite3
+import threading
+from array import array
+from collections import OrderedDict, deque
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor, as_completed, wait as wait_futures
+from datetime import date, datetime, timezone
+from email.utils import parsedate_to_datetime
+import contextvars
+from contextlib import contextmanager
+from logging.handlers import QueueHandler, QueueListener
 from pathlib import Path
-from typing import Type, Dict, Any, Optional
+from typing import TYPE_CHECKING, Type, Dict, Any, Optional, Tuple, Sequence, Union, List, Iterator, Callable, Hashable, Awaitable
 
+import httpx
 import requests
+from requests.adapters import HTTPAdapter
 from dotenv import load_dotenv
-from pydantic import BaseModel, Field, ValidationError
-from crewai import Agent, Task, Crew, Process
-from crewai.tools import BaseTool
-from litellm import completion, ServiceUnavailableError as LiteLLMServiceUnavailableError
-import litellm
+from pydantic import BaseModel, Field, ValidationError, field_validator
+
+if TYPE_CHECKING:  # crewai takes seconds to import, so at runtime it loads with the first crew
+    from crewai import Crew
+
+try:
+    import numpy as np
+except ImportError:  # NumPy is optional; the cross-rate engine falls back to array('d')
+    np = None
+
+try:
+    import fcntl
+except ImportError:  # Not available on Windows; shared-store writers then run uncoordinated
+    fcntl = None
+
+################ Logging ######################
+# Production mode turns off CrewAI's verbose agent/crew traces and raises the default log level
+PRODUCTION_MODE = os.getenv("PRODUCTION_MODE", "false").lower() == "true"
+LOG_LEVEL = os.getenv("LOG_LEVEL", "WARNING" if PRODUCTION_MODE else "INFO").upper()
+AGENT_VERBOSE = not PRODUCTION_MODE
+LOG_FORMAT = "%(asctime)s - %(name)s - %(levelname)s - %(message)s"
+
+logger = logging.getLogger("currency_converter")
+
+class _LazyQueueHandler(QueueHandler):
+    """
+    QueueHandler whose QueueListener (writing to `target`) starts on the first record it gets in
+    each process: importing the app starts no thread, and a forked child gets a listener of its own
+    instead of enqueueing into a copy of the parent's queue that nothing drains.
+    """
+
+    def __init__(self, target: logging.Handler) -> None:
+        super().__init__(queue.SimpleQueue())
+        self.target = target
+        self.listener: Optional[QueueListener] = None
+
+    def emit(self, record: logging.LogRecord) -> None:
+        if self.listener is None:  # Handler.handle holds self.lock here
+            self.listener = QueueListener(self.queue, self.target, respect_handler_level=True)
+            self.listener.start()
+        super().emit(record)
+
+    def stop(self) -> None:
+        if self.listener is not None:
+            self.listener.stop()  # Flushes whatever is still queued
+            self.listener = None
+
+    def after_fork(self) -> None:
+        self.queue = queue.SimpleQueue()
+        self.listener = None  # The parent's listener thread does not exist in the child
+
+_log_handler: Optional[_LazyQueueHandler] = None
+
+def configure_logging(level: str = LOG_LEVEL, handler: Optional[logging.Handler] = None) -> None:
+    """
+    Sends the app's log records through a QueueHandler, so request threads only enqueue them
+    and a background QueueListener formats and writes them (to stderr unless `handler` is given).
+    The listener starts with the first record; calling this again stops the previous one.
+    """
+    global _log_handler
+    _stop_log_listener()
+    if handler is None:
+        handler = logging.StreamHandler(sys.stderr)
+        handler.setFormatter(logging.Formatter(LOG_FORMAT))
+    _log_handler = _LazyQueueHandler(handler)
+    logger.handlers = [_log_handler]
+    logger.setLevel(level)
+    logger.propagate = False  # Keep records off the root logger's synchronous handlers
+
+def _stop_log_listener() -> None:
+    if _log_handler is not None:
+        _log_handler.stop()
+
+def _reset_log_listener_after_fork() -> None:
+    if _log_handler is not None:
+        _log_handler.after_fork()
+
+configure_logging()
+atexit.register(_stop_log_listener)
+if hasattr(os, "register_at_fork"):  # POSIX only; spawned children re-import and configure afresh
+    os.register_at_fork(after_in_child=_reset_log_listener_after_fork)
 
 # Setup project root for module imports
 project_root = Path(__file__).resolve().parent.parent
@@ -21,11 +128,11 @@ if str(project_root) not in sys.path:
 try:
     if (project_root / ".env").exists():
         load_dotenv(dotenv_path=(project_root / ".env"))
-        print("Loaded environment variables from .env file")
+        logger.info("Loaded environment variables from .env file")
     else:
-        print(".env file not found at project root. Please ensure it exists.")
+        logger.warning(".env file not found at project root. Please ensure it exists.")
 except Exception as e:
-    print(f"Error loading .env file: {e}")
+    logger.error("Error loading .env file: %s", e)
 
 # Initialize API keys to None, then populate them
 EXCHANGE_RATE_API_KEY = None
@@ -47,9 +154,9 @@ try:
     EXCHANGE_RATE_API_KEY = APP_EXCHANGE_RATE_API_KEY
     GOOGLE_API_KEY = APP_GOOGLE_API_KEY
     GROQ_API_KEY = APP_GROQ_API_KEY
-    print("Successfully imported API keys from config.appconfig")
+    logger.info("Successfully imported API keys from config.appconfig")
 except ImportError:
-    print("Could not import from config.appconfig. Falling back to os.getenv for required keys.")
+    logger.warning("Could not import from config.appconfig. Falling back to os.getenv for required keys.")
     EXCHANGE_RATE_API_KEY = os.getenv("EXCHANGE_RATE_API_KEY")
     GROQ_API_KEY = os.getenv("GROQ_API_KEY")
     # Load others if needed by other parts of a larger system
@@ -57,189 +164,3590 @@ except ImportError:
     SERPER_API_KEY = os.getenv("SERPER_API_KEY")
     GOOGLE_API_KEY = os.getenv("GOOGLE_API_KEY")
 
-if not EXCHANGE_RATE_API_KEY:
-    sys.exit("Critical Error: EXCHANGE_RATE_API_KEY is not set. Please check .env or config/appconfig.py")
-if not GROQ_API_KEY:
-    sys.exit("Critical Error: GROQ_API_KEY is not set. Please check .env or config/appconfig.py")
+class ConfigError(RuntimeError):
+    """Raised by check_config() when a key the selected response mode needs is not set."""
+
+# Keys each response mode needs. Direct mode runs without GROQ_API_KEY, but then only
+# queries the fast-path parser understands are answered. The other keys are optional.
+REQUIRED_KEYS_BY_MODE = {
+    "direct": ("EXCHANGE_RATE_API_KEY",),
+    "insight": ("EXCHANGE_RATE_API_KEY", "GROQ_API_KEY"),
+    "auto": ("EXCHANGE_RATE_API_KEY", "GROQ_API_KEY"),
+}
+
+def check_config(mode: str) -> None:
+    """Raises ConfigError naming the keys `mode` needs that are missing; callers decide whether to exit."""
+    if mode not in REQUIRED_KEYS_BY_MODE:  # e.g. a RESPONSE_MODE typo, which argparse does not check
+        raise ConfigError(f"Unknown response mode '{mode}' (check RESPONSE_MODE). Expected one of: {', '.join(REQUIRED_KEYS_BY_MODE)}")
+    missing = [key for key in REQUIRED_KEYS_BY_MODE[mode] if not globals()[key]]
+    if missing:
+        raise ConfigError(f"{', '.join(missing)} not set (required for {mode} mode). Please check .env or config/appconfig.py")
+    if not GROQ_API_KEY:
+        logger.warning("GROQ_API_KEY is not set; queries the fast-path parser cannot read will not be answered.")
 
 # litellm.set_verbose = False # Keep false for cleaner output, true for debugging LiteLLM
 
+################ Lazy LLM Dependencies ######################
+# crewai and litellm take seconds to import. They load on first use (LLM parse, agent or
+# insight stream), so direct conversions, bulk workers and cold starts never pay for them.
+def _litellm():
+    import litellm
+    if not AGENT_VERBOSE:
+        # litellm prints "Give Feedback / Get Help" banners to stdout on errors; the app logs errors itself
+        litellm.suppress_debug_info = True
+    return litellm
+
+def completion(**kwargs: Any) -> Any:
+    """litellm.completion, importing litellm on first call."""
+    return _litellm().completion(**kwargs)
+
+async def acompletion(**kwargs: Any) -> Any:
+    """litellm.acompletion, importing litellm on first call."""
+    return await _litellm().acompletion(**kwargs)
+
+def is_llm_unavailable(error: BaseException) -> bool:
+    """
+    True for litellm's ServiceUnavailableError (if litellm was never imported, no LLM call raised it),
+    and for rate limiting the upstream scheduler could not wait out.
+    """
+    if isinstance(error, UpstreamBusyError) or rate_limit_retry_after(error) is not None:
+        return True
+    litellm = sys.modules.get("litellm")
+    return litellm is not None and isinstance(error, litellm.ServiceUnavailableError)
+
 ################ Class for input schema ######################
+# Upper bound on the amounts and on the target currencies a single query may list
+MAX_QUERY_ITEMS = int(os.getenv("MAX_QUERY_ITEMS", "32"))
+
 class CurrencyConverterInput(BaseModel):
-    amount: float = Field(..., description="The amount of money to convert.")
+    amount: Union[float, List[float]] = Field(..., description="The amount of money to convert, or a list of amounts.")
     from_currency: str = Field(..., description="The currency to convert from (e.g., 'USD').")
-    to_currency: str = Field(..., description="The currency to convert to (e.g., 'EUR').")
+    to_currency: Union[str, List[str]] = Field(
+        ..., description="The currency to convert to (e.g., 'EUR'), or a list of target currencies (e.g., ['EUR', 'GBP'])."
+    )
+    as_of: Optional[date] = Field(None, description="Date (YYYY-MM-DD) for a historical conversion; omit for the latest rates.")
 
-################## Class for actual tool ######################
-class CurrencyConverterTool(BaseTool):
-    name: str = "Currency Converter Tool"
-    description: str = "Converts an amount from one currency to another using the ExchangeRate API."
-    args_schema: Type[BaseModel] = CurrencyConverterInput
-    # The api_key for this tool will use the globally loaded EXCHANGE_RATE_API_KEY
+    @field_validator("amount", "to_currency")
+    @classmethod
+    def _check_list(cls, value: Any) -> Any:
+        """Bounds list lengths and collapses one-item lists, so single conversions keep their scalar shape."""
+        if not isinstance(value, list):
+            return value
+        if not value:
+            raise ValueError("must not be an empty list")
+        if len(value) > MAX_QUERY_ITEMS:
+            raise ValueError(f"at most {MAX_QUERY_ITEMS} items are allowed")
+        return value[0] if len(value) == 1 else value
 
-    def _run(self, amount: float, from_currency: str, to_currency: str) -> str:
-        if not EXCHANGE_RATE_API_KEY:
-            return "Error: ExchangeRate API key is not configured or loaded."
+def query_amounts(inputs: Dict[str, Any]) -> List[float]:
+    """The amounts of parsed inputs as a list, whether `amount` held one value or several."""
+    amount = inputs["amount"]
+    return [float(a) for a in amount] if isinstance(amount, (list, tuple)) else [float(amount)]
 
-        url = f"https://v6.exchangerate-api.com/v6/{EXCHANGE_RATE_API_KEY}/latest/{from_currency.upper()}"
+def query_targets(inputs: Dict[str, Any]) -> List[str]:
+    """The distinct upper-cased target currencies of parsed inputs, in the order given."""
+    to_currency = inputs["to_currency"]
+    codes = to_currency if isinstance(to_currency, (list, tuple)) else [to_currency]
+    return list(dict.fromkeys(code.upper() for code in codes))
 
-        try:
-            response = requests.get(url, timeout=10)
-            response.raise_for_status()
-        except requests.exceptions.RequestException as e:
-            return f"Failed to fetch exchange rates: {e}"
+def is_multi_query(inputs: Dict[str, Any]) -> bool:
+    return isinstance(inputs["amount"], (list, tuple)) or isinstance(inputs["to_currency"], (list, tuple))
 
-        data = response.json()
-        if data.get("result") == "error":
-            error_type = data.get("error-type", "Unknown error")
-            if error_type == "unsupported-code":
-                return f"Invalid or unsupported currency code provided for 'from_currency': {from_currency}"
-            return f"API error when fetching rates for {from_currency}: {error_type}"
+################ Metrics and Tracing ######################
+# Set TRACE_EXPORT_PATH to a file to append one JSON trace per request
+TRACE_EXPORT_PATH = os.getenv("TRACE_EXPORT_PATH")
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+TOKEN_BUCKETS = (16, 32, 64, 128, 256, 512, 1024, 2048, 4096, 8192, 16384)
 
-        if "conversion_rates" not in data or to_currency.upper() not in data["conversion_rates"]:
-            return f"Invalid or unsupported currency code for 'to_currency': {to_currency}"
+def _format_labels(names: Sequence[str], values: Sequence[Any]) -> str:
+    """Prometheus label list without braces, e.g. `stage="parse",outcome="llm"`."""
+    escaped = (str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for v in values)
+    return ",".join(f'{name}="{value}"' for name, value in zip(names, escaped))
 
-        rate = data["conversion_rates"][to_currency.upper()]
-        converted_amount = amount * rate
-        return f"{amount} {from_currency.upper()} is equal to {converted_amount:.2f} {to_currency.upper()}."
+class Histogram:
+    """Thread-safe Prometheus histogram with one series per combination of label values."""
 
-################ LLM Query Parser Function ######################
-GROQ_PARSER_MODEL = "groq/llama3-8b-8192"
+    def __init__(self, name: str, documentation: str, label_names: Sequence[str], buckets: Sequence[float]):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = tuple(label_names)
+        self.buckets = tuple(buckets)
+        self._lock = threading.Lock()
+        # label values -> per-bucket counts (not cumulative), then sum and count
+        self._series: Dict[Tuple[str, ...], List[float]] = {}
 
-def parse_query_with_llm(query: str) -> Optional[Dict[str, Any]]:
-    prompt = f"""
-You are an expert at parsing financial queries for currency conversion.
-Your task is to extract the amount, the source currency, and the target currency from the user's query.
-Provide the output in a valid JSON object with the following keys: "amount", "from_currency", "to_currency".
-- "amount": Should be a numerical value (float or int).
-- "from_currency": Should be the 3-letter ISO currency code (e.g., USD, EUR, JPY).
-- "to_currency": Should be the 3-letter ISO currency code.
-If any information is crucial and cannot be reasonably inferred, return null for that specific field or an error structure.
-Common currency names like 'dollars', 'euros', 'yen', 'pounds' should be mapped to their ISO codes.
-'Dollars' usually means USD unless specified otherwise (e.g., 'Canadian dollars' -> CAD).
-'Euros' -> EUR. 'Pounds' -> GBP.
-User query: "{query}"
-JSON Output:
-"""
-    content = None
-    parsed_json = None
+    def observe(self, value: float, *label_values: str) -> None:
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(label_values)
+            if series is None:
+                series = self._series[label_values] = [0] * len(self.buckets) + [0.0, 0]
+            if index < len(self.buckets):
+                series[index] += 1
+            series[-2] += value
+            series[-1] += 1
+
+    def render(self) -> List[str]:
+        with self._lock:
+            snapshot = sorted((labels, list(series)) for labels, series in self._series.items())
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        for label_values, series in snapshot:
+            labels = _format_labels(self.label_names, label_values)
+            prefix = labels + "," if labels else ""
+            cumulative = 0
+            for bound, count in zip(self.buckets, series):
+                cumulative += count
+                lines.append(f'{self.name}_bucket{{{prefix}le="{bound}"}} {cumulative}')
+            lines.append(f'{self.name}_bucket{{{prefix}le="+Inf"}} {series[-1]}')
+            lines.append(f"{self.name}_sum{{{labels}}} {series[-2]}")
+            lines.append(f"{self.name}_count{{{labels}}} {series[-1]}")
+        return lines
+
+STAGE_SECONDS = Histogram(
+    "currency_converter_stage_seconds", "Time spent in each pipeline stage.", ("stage", "outcome"), LATENCY_BUCKETS,
+)
+LLM_TOKENS = Histogram(
+    "currency_converter_llm_tokens", "Tokens used per LLM call.", ("model", "kind"), TOKEN_BUCKETS,
+)
+
+_current_trace: "contextvars.ContextVar[Optional[Dict[str, Any]]]" = contextvars.ContextVar("currency_converter_trace", default=None)
+_trace_export_lock = threading.Lock()
+
+def record_span(stage: str, seconds: float, outcome: str = "", started: Optional[float] = None, *,
+                trace: Optional[Dict[str, Any]] = None, **attributes: Any) -> None:
+    """Observes one stage duration and adds it to `trace`, by default the current request trace if any."""
+    STAGE_SECONDS.observe(seconds, stage, outcome)
+    trace = trace if trace is not None else _current_trace.get()
+    if trace is not None:
+        entry = {"stage": stage, "outcome": outcome, "seconds": seconds, **attributes}
+        if started is not None:
+            entry["offset"] = started - trace["_started"]
+        trace["spans"].append(entry)
+
+@contextmanager
+def span(stage: str, outcome: str = "") -> Iterator[Dict[str, Any]]:
+    """
+    Times the block as `stage`. The caller may set "outcome" (e.g. hit/miss) or extra trace
+    attributes on the yielded dict; an exception without an outcome is recorded as "error".
+    """
+    details: Dict[str, Any] = {"outcome": outcome}
+    started = time.perf_counter()
     try:
-        print(f"Attempting to parse query: '{query}' with model {GROQ_PARSER_MODEL}")
-        response = completion(
-            model=GROQ_PARSER_MODEL,
-            messages=[{"role": "user", "content": prompt}],
-            api_key=GROQ_API_KEY,
-            response_format={"type": "json_object"},
-            timeout=30
-        )
-        content = response.choices[0].message.content
-        if not content:
-            print("Error: LLM returned empty content for query parsing.")
-            return None
-        print(f"LLM Raw JSON response for parsing: {content}")
-        parsed_json = json.loads(content)
-        validated_data = CurrencyConverterInput(**parsed_json)
-        return validated_data.model_dump()
-    except json.JSONDecodeError as e:
-        print(f"Error decoding JSON from LLM response: {e}. LLM Raw output was: {content}")
-        return None
-    except ValidationError as e:
-        print(f"Validation error for LLM output: {e}. Parsed JSON was: {parsed_json}")
+        yield details
+    except BaseException:
+        details["outcome"] = details["outcome"] or "error"
+        raise
+    finally:
+        outcome = details.pop("outcome")
+        record_span(stage, time.perf_counter() - started, outcome, started, **details)
+
+def record_tokens(model: str, usage: Any) -> None:
+    """Records prompt/completion token counts from a litellm usage object or CrewAI UsageMetrics."""
+    if usage is None:
+        return
+    trace = _current_trace.get()
+    for kind in ("prompt_tokens", "completion_tokens"):
+        count = usage.get(kind) if isinstance(usage, dict) else getattr(usage, kind, None)
+        if not count:
+            continue
+        LLM_TOKENS.observe(count, model, kind.split("_")[0])
+        if trace is not None:
+            trace["tokens"][kind] += count
+
+@contextmanager
+def request_trace(name: str, **attributes: Any) -> Iterator[Dict[str, Any]]:
+    """
+    Collects every span recorded while the block runs into one trace dict and, when
+    TRACE_EXPORT_PATH is set, appends it to that file as a JSON line.
+    """
+    trace: Dict[str, Any] = {
+        "trace_id": uuid.uuid4().hex, "name": name, "started_at": time.time(), **attributes,
+        "spans": [], "tokens": {"prompt_tokens": 0, "completion_tokens": 0}, "_started": time.perf_counter(),
+    }
+    token = _current_trace.set(trace)
+    try:
+        yield trace
+    finally:
+        try:
+            _current_trace.reset(token)
+        except ValueError:  # a streaming generator closed from another context
+            pass
+        trace["seconds"] = time.perf_counter() - trace["_started"]
+        if TRACE_EXPORT_PATH:
+            line = json.dumps({k: v for k, v in trace.items() if not k.startswith("_")}, default=str)
+            try:
+                with _trace_export_lock, open(TRACE_EXPORT_PATH, "a", encoding="utf-8") as f:
+                    f.write(line + "\n")
+            except OSError as e:
+                logger.warning("Could not export trace to %s: %s", TRACE_EXPORT_PATH, e)
+
+################ Upstream Scheduler ######################
+# Every call to ExchangeRate-API and Groq first takes a token from its provider's bucket.
+# Waiters are served by priority, so interactive requests overtake batch work and the
+# background refresher; a 429 pauses the provider and slows its bucket until calls succeed again.
+# The rates below are per process unless SHARED_RATE_STORE_DIR is set: then every worker on the
+# host draws from one bucket per provider kept there, so N gunicorn workers share one quota.
+PRIORITY_INTERACTIVE, PRIORITY_BATCH, PRIORITY_BACKGROUND = 0, 1, 2
+PRIORITY_NAMES = {PRIORITY_INTERACTIVE: "interactive", PRIORITY_BATCH: "batch", PRIORITY_BACKGROUND: "background"}
+EXCHANGE_RATE_API_RATE_PER_SECOND = float(os.getenv("EXCHANGE_RATE_API_RATE_PER_SECOND", "5"))
+EXCHANGE_RATE_API_BURST = int(os.getenv("EXCHANGE_RATE_API_BURST", "10"))
+# Groq's free tier allows 30 requests per minute per model. There is one bucket for the whole
+# provider (parser and agent models together), so this default keeps each model under its limit.
+GROQ_RATE_PER_SECOND = float(os.getenv("GROQ_RATE_PER_SECOND", "0.5"))
+GROQ_BURST = int(os.getenv("GROQ_BURST", "5"))
+UPSTREAM_MAX_RETRIES = int(os.getenv("UPSTREAM_MAX_RETRIES", "4"))
+# How long a call may queue for a token before it gives up
+UPSTREAM_MAX_WAIT_SECONDS = float(os.getenv("UPSTREAM_MAX_WAIT_SECONDS", "60"))
+UPSTREAM_BACKOFF_BASE_SECONDS = 0.5
+UPSTREAM_BACKOFF_MAX_SECONDS = 30.0
+UPSTREAM_SHARED_DIR = os.getenv("SHARED_RATE_STORE_DIR", "")
+
+UPSTREAM_WAIT_SECONDS = Histogram(
+    "currency_converter_upstream_wait_seconds", "Time upstream calls queued for a rate-limit token.",
+    ("provider", "priority"), LATENCY_BUCKETS,
+)
+
+_upstream_priority: "contextvars.ContextVar[int]" = contextvars.ContextVar(
+    "currency_converter_upstream_priority", default=PRIORITY_INTERACTIVE,
+)
+
+@contextmanager
+def upstream_priority(priority: int) -> Iterator[None]:
+    """Runs the block's upstream calls at `priority` (PRIORITY_INTERACTIVE, PRIORITY_BATCH or PRIORITY_BACKGROUND)."""
+    token = _upstream_priority.set(priority)
+    try:
+        yield
+    finally:
+        _upstream_priority.reset(token)
+
+class UpstreamBusyError(Exception):
+    """Raised when a call queued longer than its scheduler's max_wait_seconds for a token."""
+
+class UpstreamRateLimited(Exception):
+    """An upstream answered 429. `retry_after` is its Retry-After in seconds, if it sent one."""
+
+    def __init__(self, message: str, retry_after: Optional[float] = None):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+def _retry_after_seconds(headers: Any) -> Optional[float]:
+    """Retry-After from a response's headers, given either as seconds or as an HTTP date."""
+    value = headers.get("retry-after") if headers is not None else None
+    if not value:
         return None
-    except LiteLLMServiceUnavailableError as e:
-        print(f"LLM service (Groq) for query parsing is currently unavailable: {e}. Please try again later.")
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
         return None
-    except Exception as e:
-        print(f"An unexpected error occurred during LLM query parsing: {e}")
-        import traceback
-        traceback.print_exc()
+
+def rate_limit_retry_after(error: BaseException) -> Optional[float]:
+    """
+    For an upstream 429 (UpstreamRateLimited, or an LLM client error with status 429) the
+    Retry-After it carried in seconds, 0.0 if it gave none. None for any other error.
+    """
+    if isinstance(error, UpstreamRateLimited):
+        return error.retry_after or 0.0
+    if getattr(error, "status_code", None) != 429:
         return None
+    return _retry_after_seconds(getattr(getattr(error, "response", None), "headers", None)) or 0.0
 
-################ Agent and Crew Logic (Callable Function) ######################
-GROQ_AGENT_MODEL = "groq/llama3-70b-8192"
+class UpstreamScheduler:
+    """
+    Token bucket for one upstream provider with a priority wait queue. `acquire()` blocks until
+    a token is free and no higher-priority (or earlier, equal-priority) caller is still waiting.
+    `call()` runs a function once a token is granted and retries it while the provider answers
+    429: each 429 pauses the provider for a jittered exponential backoff (never shorter than
+    Retry-After) and halves the refill rate, which then creeps back up with every success.
+
+    With `shared_dir`, the bucket (tokens, pause and current rate) lives in a small file there
+    that every process reads and writes back under flock, so they all spend one budget; the
+    priority queue stays per process. The file stays open (reopened after a fork, as flock
+    belongs to the open file), and the flock is only taken outside the wait-queue condition;
+    coroutines never block on it. Without flock, or if the file cannot be opened, the bucket
+    falls back to this process alone.
+    """
+
+    _STATE = struct.Struct("<ddddI")  # tokens, updated, paused_until (wall clock), rate, throttle streak
+
+    def __init__(self, provider: str, rate_per_second: float, burst: int,
+                 max_retries: int = UPSTREAM_MAX_RETRIES, max_wait_seconds: float = UPSTREAM_MAX_WAIT_SECONDS,
+                 shared_dir: Optional[Union[str, Path]] = None):
+        self.provider = provider
+        self.shared_path = Path(shared_dir) / f"upstream-{provider}.bucket" if shared_dir and fcntl else None
+        self.rate_per_second = max(rate_per_second, 1e-3)
+        self.burst = max(1, burst)
+        self.max_retries = max_retries
+        self.max_wait_seconds = max_wait_seconds
+        self._rate = self.rate_per_second
+        self._tokens = float(self.burst)
+        self._updated = time.monotonic()
+        self._paused_until = 0.0
+        self._throttle_streak = 0
+        self._cond = threading.Condition()
+        # Guards the bucket fields; in shared mode it is held together with the file's flock
+        self._bucket_lock = threading.Lock()
+        self._fd: Optional[int] = None
+        self._fd_pid = 0
+        self._fd_finalizer: Optional[weakref.finalize] = None
+        self._flocked = False
+        self._wall_offset = 0.0
+        self._waiters: List[Tuple[int, int]] = []
+        self._sequence = itertools.count()
+        self._random = random.Random()
+        self.acquired = 0
+        self.throttled = 0
+        self.retries = 0
+        self.timeouts = 0
+
+    def _bucket_fd(self) -> Optional[int]:
+        """The bucket file opened by this process, or None when the bucket is not shared."""
+        if self.shared_path is None:
+            return None
+        if self._fd is not None and self._fd_pid == os.getpid():
+            return self._fd
+        if self._fd_finalizer is not None:
+            self._fd_finalizer()  # a fork's copy of the parent's file would share its flock
+        try:
+            self.shared_path.parent.mkdir(parents=True, exist_ok=True)
+            self._fd = os.open(self.shared_path, os.O_RDWR | os.O_CREAT, 0o666)
+        except OSError as e:
+            logger.warning("Could not open shared %s bucket %s (%s); its rate limit is now per process",
+                           self.provider, self.shared_path, e)
+            self.shared_path = self._fd = self._fd_finalizer = None
+            return None
+        self._fd_pid = os.getpid()
+        self._fd_finalizer = weakref.finalize(self, os.close, self._fd)
+        return self._fd
+
+    def _lock_bucket(self, blocking: bool = True) -> bool:
+        """Locks the bucket and, in shared mode, loads it from the file. False if it is busy and not `blocking`."""
+        if not self._bucket_lock.acquire(blocking):
+            return False
+        try:
+            fd = self._bucket_fd()
+            if fd is None:
+                return True
+            try:
+                fcntl.flock(fd, fcntl.LOCK_EX if blocking else fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                self._bucket_lock.release()
+                return False
+            self._flocked = True
+            self._wall_offset = time.time() - time.monotonic()  # the file holds wall-clock times
+            data = os.pread(fd, self._STATE.size, 0)
+            if len(data) == self._STATE.size:
+                tokens, updated, paused_until, self._rate, self._throttle_streak = self._STATE.unpack(data)
+                self._tokens = min(float(self.burst), tokens)
+                self._updated = updated - self._wall_offset
+                self._paused_until = paused_until - self._wall_offset
+            return True
+        except BaseException:
+            self._unlock_bucket()
+            raise
+
+    def _unlock_bucket(self) -> None:
+        try:
+            if self._flocked:
+                try:
+                    offset = self._wall_offset
+                    os.pwrite(self._fd, self._STATE.pack(self._tokens, self._updated + offset,
+                                                         self._paused_until + offset, self._rate, self._throttle_streak), 0)
+                finally:
+                    self._flocked = False
+                    fcntl.flock(self._fd, fcntl.LOCK_UN)
+        finally:
+            self._bucket_lock.release()
+
+    @contextmanager
+    def _bucket(self) -> Iterator[None]:
+        """Holds the bucket state, waiting for other threads and (in shared mode) other processes."""
+        self._lock_bucket()
+        try:
+            yield
+        finally:
+            self._unlock_bucket()
+
+    def _refill(self, now: float) -> None:
+        self._tokens = min(self.burst, self._tokens + (now - self._updated) * self._rate)
+        self._updated = now
+
+    def _enqueue(self, priority: Optional[int]) -> Tuple[int, int]:
+        ticket = (_upstream_priority.get() if priority is None else priority, next(self._sequence))
+        heapq.heappush(self._waiters, ticket)
+        return ticket
+
+    def _leave(self, ticket: Tuple[int, int]) -> None:
+        if self._waiters and self._waiters[0] == ticket:
+            heapq.heappop(self._waiters)
+        else:
+            self._waiters.remove(ticket)
+            heapq.heapify(self._waiters)
+        self._cond.notify_all()
+
+    def _is_next(self, ticket: Tuple[int, int]) -> bool:
+        with self._cond:
+            return self._waiters[0] == ticket
+
+    def _take(self) -> float:
+        """With the bucket locked: 0.0 once a token is taken, otherwise the seconds until one is free."""
+        now = time.monotonic()
+        self._refill(now)
+        ready_at = max(self._paused_until, now if self._tokens >= 1 else now + (1 - self._tokens) / self._rate)
+        if ready_at > now:
+            return ready_at - now
+        self._tokens -= 1
+        self.acquired += 1
+        return 0.0
+
+    def _waited(self, ticket: Tuple[int, int], started: float) -> float:
+        waited = time.monotonic() - started
+        UPSTREAM_WAIT_SECONDS.observe(waited, self.provider, PRIORITY_NAMES.get(ticket[0], str(ticket[0])))
+        return waited
+
+    def _timed_out(self) -> UpstreamBusyError:
+        self.timeouts += 1
+        return UpstreamBusyError(f"{self.provider} is busy; no request slot freed up within {self.max_wait_seconds:g}s.")
+
+    def acquire(self, priority: Optional[int] = None) -> float:
+        """Waits for a token (at the context's upstream_priority by default). Returns the seconds waited."""
+        started = time.monotonic()
+        deadline = started + self.max_wait_seconds
+        with self._cond:
+            ticket = self._enqueue(priority)
+        try:
+            while True:
+                # Only the head waiter touches the bucket; the rest sleep until the head moves
+                delay = None
+                if self._is_next(ticket):
+                    with self._bucket():
+                        delay = self._take()
+                    if delay == 0.0:
+                        break
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise self._timed_out()
+                with self._cond:
+                    if delay is not None or self._waiters[0] != ticket:
+                        self._cond.wait(remaining if delay is None else min(delay, remaining))
+        finally:
+            with self._cond:
+                self._leave(ticket)
+        return self._waited(ticket, started)
+
+    async def acquire_async(self, priority: Optional[int] = None) -> float:
+        """acquire() for coroutines: queues in the same order but sleeps on the event loop."""
+        started = time.monotonic()
+        deadline = started + self.max_wait_seconds
+        with self._cond:
+            ticket = self._enqueue(priority)
+        try:
+            while True:
+                delay = None
+                # Never block the event loop on the bucket: if it is busy, poll again shortly
+                if self._is_next(ticket) and self._lock_bucket(blocking=False):
+                    try:
+                        delay = self._take()
+                    finally:
+                        self._unlock_bucket()
+                if delay == 0.0:
+                    break
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise self._timed_out()
+                await asyncio.sleep(min(0.01 if delay is None else delay, remaining))
+        finally:
+            with self._cond:
+                self._leave(ticket)
+        return self._waited(ticket, started)
+
+    def record_throttle(self, retry_after: Optional[float]) -> float:
+        """Registers a 429: empties the bucket, halves the rate and pauses the provider. Returns the pause."""
+        with self._bucket():
+            self.throttled += 1
+            self._throttle_streak += 1
+            backoff = min(UPSTREAM_BACKOFF_MAX_SECONDS, UPSTREAM_BACKOFF_BASE_SECONDS * 2 ** (self._throttle_streak - 1))
+            # Full jitter spreads the retries of every waiting caller instead of releasing them together
+            delay = max(retry_after or 0.0, self._random.uniform(0, backoff))
+            now = time.monotonic()
+            self._refill(now)
+            self._tokens = 0.0
+            self._paused_until = max(self._paused_until, now + delay)
+            self._rate = max(self.rate_per_second / 16, self._rate / 2)
+        with self._cond:
+            self._cond.notify_all()
+        return delay
+
+    def record_success(self, blocking: bool = True) -> None:
+        """Ends a 429 streak and lets the rate creep back up; without `blocking`, skipped while the bucket is busy."""
+        if self._throttle_streak == 0 and self._rate >= self.rate_per_second:
+            return  # nothing to restore; spare the shared bucket a locked write on every call
+        if not self._lock_bucket(blocking):
+            return  # a later success restores the rate instead
+        try:
+            self._throttle_streak = 0
+            if self._rate < self.rate_per_second:
+                self._rate = min(self.rate_per_second, self._rate + self.rate_per_second / 20)
+        finally:
+            self._unlock_bucket()
+
+    def _should_retry(self, error: Exception, attempt: int) -> Optional[float]:
+        """The backoff before retrying after `error`, or None when it must be raised."""
+        retry_after = rate_limit_retry_after(error)
+        if retry_after is None:
+            return None
+        delay = self.record_throttle(retry_after)
+        if attempt >= self.max_retries:
+            return None
+        self.retries += 1
+        logger.warning("%s rate limited a request; retrying in %.2fs (retry %d of %d)",
+                       self.provider, delay, attempt + 1, self.max_retries)
+        return delay
+
+    def call(self, fn: Callable[[], Any], priority: Optional[int] = None, acquire: bool = True) -> Any:
+        """
+        Runs fn() once a token is granted, retrying on 429. With acquire=False, fn takes its own
+        tokens (e.g. per agent turn) and only the 429 backoff applies.
+        """
+        for attempt in itertools.count():
+            if acquire:
+                self.acquire(priority)
+            try:
+                result = fn()
+            except Exception as e:
+                delay = self._should_retry(e, attempt)
+                if delay is None:
+                    raise
+                if not acquire:  # otherwise the next acquire() waits out the pause
+                    time.sleep(delay)
+                continue
+            self.record_success()
+            return result
+
+    async def call_async(self, fn: Callable[[], Awaitable[Any]], priority: Optional[int] = None) -> Any:
+        """Async counterpart of call() for coroutine functions."""
+        for attempt in itertools.count():
+            await self.acquire_async(priority)
+            try:
+                result = await fn()
+            except Exception as e:
+                # Recording the 429 may wait on other processes' flock, so it runs off the event loop
+                if await asyncio.to_thread(self._should_retry, e, attempt) is None:
+                    raise
+                continue
+            self.record_success(blocking=False)
+            return result
+
+    def stats(self) -> Dict[str, Any]:
+        with self._cond:
+            depth = dict.fromkeys(PRIORITY_NAMES.values(), 0)
+            for priority, _ in self._waiters:
+                name = PRIORITY_NAMES.get(priority, str(priority))
+                depth[name] = depth.get(name, 0) + 1
+            return {
+                "provider": self.provider,
+                "shared": self.shared_path is not None,
+                "rate_per_second": self._rate,
+                "queue_depth": depth,
+                "paused_for": max(0.0, self._paused_until - time.monotonic()),
+                "acquired": self.acquired,
+                "throttled": self.throttled,
+                "retries": self.retries,
+                "timeouts": self.timeouts,
+            }
+
+EXCHANGE_RATE_SCHEDULER = UpstreamScheduler("exchangerate", EXCHANGE_RATE_API_RATE_PER_SECOND, EXCHANGE_RATE_API_BURST,
+                                             shared_dir=UPSTREAM_SHARED_DIR or None)
+GROQ_SCHEDULER = UpstreamScheduler("groq", GROQ_RATE_PER_SECOND, GROQ_BURST, shared_dir=UPSTREAM_SHARED_DIR or None)
+UPSTREAM_SCHEDULERS = (EXCHANGE_RATE_SCHEDULER, GROQ_SCHEDULER)
+
+def scheduler_for_model(model: Any) -> Optional[UpstreamScheduler]:
+    """The scheduler for an LLM model string or CrewAI LLM, or None for providers without one."""
+    provider = getattr(model, "provider", None)
+    model = getattr(model, "model", model)
+    if not provider and isinstance(model, str) and "/" in model:
+        provider = model.split("/", 1)[0]
+    return GROQ_SCHEDULER if provider == "groq" else None
+
+def scheduled_completion(**kwargs: Any) -> Any:
+    """completion() paced and retried by the model provider's scheduler."""
+    scheduler = scheduler_for_model(kwargs.get("model"))
+    if scheduler is None:
+        return completion(**kwargs)
+    return scheduler.call(lambda: completion(**kwargs))
+
+async def scheduled_acompletion(**kwargs: Any) -> Any:
+    """acompletion() paced and retried by the model provider's scheduler."""
+    scheduler = scheduler_for_model(kwargs.get("model"))
+    if scheduler is None:
+        return await acompletion(**kwargs)
+    return await scheduler.call_async(lambda: acompletion(**kwargs))
+
+def _pace_agent_llm_call(context: Any) -> None:
+    """CrewAI before_llm_call hook: every agent turn takes a token from its provider's bucket."""
+    scheduler = scheduler_for_model(getattr(context, "llm", None))
+    if scheduler is not None:
+        scheduler.acquire()
+
+################ Exchange Rate Table Cache ######################
+EXCHANGE_RATE_API_BASE_URL = os.getenv("EXCHANGE_RATE_API_BASE_URL", "https://v6.exchangerate-api.com/v6")
+# ExchangeRate-API publishes new tables hourly on paid plans and daily on the free plan,
+# so an hour is the longest a cached table can be reused without missing an update.
+RATE_CACHE_TTL_SECONDS = float(os.getenv("RATE_CACHE_TTL_SECONDS", "3600"))
+RATE_CACHE_MAX_ENTRIES = int(os.getenv("RATE_CACHE_MAX_ENTRIES", "64"))
+# How long past expiry a table may still be served while it is refreshed or the provider is down
+RATE_MAX_STALENESS_SECONDS = float(os.getenv("RATE_MAX_STALENESS_SECONDS", "1800"))
 
-def get_currency_conversion_response(natural_language_query: str) -> str:
+class RateFetchError(Exception):
+    """Raised when a rate table cannot be obtained. The message is safe to show to the user."""
+
+HTTP_POOL_MAXSIZE = int(os.getenv("HTTP_POOL_MAXSIZE", "32"))
+
+# Shared keep-alive pool so repeated fetches reuse the TLS connection instead of handshaking each time
+_http_session = requests.Session()
+_http_session.mount("https://", HTTPAdapter(pool_connections=4, pool_maxsize=HTTP_POOL_MAXSIZE))
+_http_session.mount("http://", HTTPAdapter(pool_connections=4, pool_maxsize=HTTP_POOL_MAXSIZE))
+
+# httpx.AsyncClient is bound to the event loop it was first used on, so keep one per loop
+_async_http_clients: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, httpx.AsyncClient]" = weakref.WeakKeyDictionary()
+
+def get_async_http_client() -> httpx.AsyncClient:
+    """Returns the pooled keep-alive client for the running event loop."""
+    loop = asyncio.get_running_loop()
+    client = _async_http_clients.get(loop)
+    if client is None or client.is_closed:
+        client = httpx.AsyncClient(
+            timeout=10,
+            limits=httpx.Limits(max_connections=HTTP_POOL_MAXSIZE, max_keepalive_connections=HTTP_POOL_MAXSIZE),
+        )
+        _async_http_clients[loop] = client
+    return client
+
+async def aclose_async_http_client() -> None:
+    """Closes the running loop's pooled client; call before the loop shuts down."""
+    client = _async_http_clients.pop(asyncio.get_running_loop(), None)
+    if client is not None:
+        await client.aclose()
+
+def _rate_table_url(base_currency: str, as_of: Optional[date] = None) -> str:
+    if not EXCHANGE_RATE_API_KEY:
+        raise RateFetchError("Error: ExchangeRate API key is not configured or loaded.")
+    if as_of is not None:
+        return (f"{EXCHANGE_RATE_API_BASE_URL}/{EXCHANGE_RATE_API_KEY}/history/{base_currency}/"
+                f"{as_of.year}/{as_of.month}/{as_of.day}")
+    return f"{EXCHANGE_RATE_API_BASE_URL}/{EXCHANGE_RATE_API_KEY}/latest/{base_currency}"
+
+def _rate_table_from_payload(data: Dict[str, Any], base_currency: str) -> Tuple[Dict[str, float], Optional[float]]:
+    if data.get("result") == "error":
+        error_type = data.get("error-type", "Unknown error")
+        if error_type == "unsupported-code":
+            raise RateFetchError(f"Invalid or unsupported currency code provided for 'from_currency': {base_currency}")
+        raise RateFetchError(f"API error when fetching rates for {base_currency}: {error_type}")
+
+    if "conversion_rates" not in data:
+        raise RateFetchError(f"API error when fetching rates for {base_currency}: missing conversion_rates")
+
+    return data["conversion_rates"], data.get("time_next_update_unix")
+
+def _raise_for_rate_limit(response: Any) -> None:
+    """Turns an HTTP 429 from requests or httpx into UpstreamRateLimited, so the scheduler backs off."""
+    if response.status_code == 429:
+        raise UpstreamRateLimited("ExchangeRate-API answered 429 Too Many Requests",
+                                  _retry_after_seconds(response.headers))
+
+def _get_rate_response(url: str) -> requests.Response:
+    response = _http_session.get(url, timeout=10)
+    _raise_for_rate_limit(response)
+    response.raise_for_status()
+    return response
+
+def fetch_rate_table(base_currency: str) -> Tuple[Dict[str, float], Optional[float]]:
     """
-    Parses a natural language query, runs the currency conversion crew, and returns the result.
-    This function encapsulates the agent, task, and crew logic.
+    Fetches the latest `conversion_rates` table for `base_currency` from ExchangeRate-API.
+    Returns the table and the provider's next update time (unix seconds) if it reported one.
     """
-    if not GROQ_API_KEY: # Redundant check, but good for a self-contained function perspective
-        return "Error: GROQ_API_KEY is not configured for the agent."
+    base_currency = base_currency.upper()
+    url = _rate_table_url(base_currency)
 
-    parsed_inputs = parse_query_with_llm(natural_language_query)
-    if not parsed_inputs:
-        return "Could not parse your query. Please try rephrasing it, check connectivity, or ensure all details (amount, currencies) are clear."
+    try:
+        response = EXCHANGE_RATE_SCHEDULER.call(lambda: _get_rate_response(url))
+    except (UpstreamRateLimited, UpstreamBusyError) as e:
+        raise RateFetchError(f"Exchange rate provider is busy, please try again shortly: {e}") from e
+    except requests.exceptions.RequestException as e:
+        raise RateFetchError(f"Failed to fetch exchange rates: {e}") from e
 
-    print(f"Parsed inputs for crew: {parsed_inputs}")
+    return _rate_table_from_payload(response.json(), base_currency)
 
-    # Define agent (core logic as per user's working version)
-    currency_analyst = Agent(
-        role="Currency Analyst",
-        goal="Provide real-time currency conversion rates and financial insights based on the user's query.",
-        backstory=(
-            "You are a meticulous financial analyst specializing in currency conversion. "
-            "You use precise, real-time data to perform conversions and offer brief, relevant financial context if appropriate. "
-            "You stick to the task of conversion and providing the result clearly."
-        ),
-        tools=[CurrencyConverterTool()],
-        verbose=True,
-        llm=GROQ_AGENT_MODEL, # Using the model string directly as it was working for the user
-        allow_delegation=False,
-        max_iter=5
-    )
+def fetch_history_table(base_currency: str, as_of: date) -> Dict[str, float]:
+    """Fetches the `conversion_rates` table for `base_currency` on a past day from ExchangeRate-API."""
+    base_currency = base_currency.upper()
+    url = _rate_table_url(base_currency, as_of)
 
-    # Define task
-    currency_conversion_task_template = (
-        "Convert {amount} {from_currency} to {to_currency} using the latest exchange rates. "
-        "Provide the equivalent amount in the target currency. "
-        "If possible, briefly explain any highly relevant financial context or recent significant changes "
-        "related to these currencies if it directly impacts the conversion, but keep it concise. "
-        "Focus primarily on delivering the conversion result accurately."
-    )
-    task_description = currency_conversion_task_template.format(**parsed_inputs)
-    expected_output_description = (
-        f"A detailed response including the converted amount of {parsed_inputs['amount']} "
-        f"{parsed_inputs['from_currency']} to {parsed_inputs['to_currency']}, "
-        "and brief, relevant financial insights if applicable."
-    )
-    dynamic_task = Task(
-        description=task_description,
-        expected_output=expected_output_description,
-        agent=currency_analyst,
-    )
+    try:
+        response = EXCHANGE_RATE_SCHEDULER.call(lambda: _get_rate_response(url))
+    except (UpstreamRateLimited, UpstreamBusyError) as e:
+        raise RateFetchError(f"Exchange rate provider is busy, please try again shortly: {e}") from e
+    except requests.exceptions.RequestException as e:
+        raise RateFetchError(f"Failed to fetch exchange rates for {as_of.isoformat()}: {e}") from e
 
-    # Define and run crew
-    crew = Crew(
-        agents=[currency_analyst],
-        tasks=[dynamic_task],
-        process=Process.sequential,
-        verbose=True
-    )
+    return _rate_table_from_payload(response.json(), base_currency)[0]
+
+async def fetch_rate_table_async(base_currency: str) -> Tuple[Dict[str, float], Optional[float]]:
+    """Async counterpart of fetch_rate_table() using the pooled httpx client."""
+    base_currency = base_currency.upper()
+    url = _rate_table_url(base_currency)
+
+    async def get() -> httpx.Response:
+        response = await get_async_http_client().get(url)
+        _raise_for_rate_limit(response)
+        response.raise_for_status()
+        return response
 
-    print("Kicking off the crew for conversion...")
     try:
-        response = crew.kickoff(inputs=parsed_inputs)
-        return str(response) # Ensure the final output is a string
-    except LiteLLMServiceUnavailableError as e:
-        return f"LLM service (Groq) for the agent is currently unavailable: {e}. Please try again later."
-    except Exception as e:
-        print(f"An error occurred while running the crew: {e}")
-        import traceback
-        traceback.print_exc()
-        return "An unexpected error occurred during currency conversion. Please check logs."
+        response = await EXCHANGE_RATE_SCHEDULER.call_async(get)
+    except (UpstreamRateLimited, UpstreamBusyError) as e:
+        raise RateFetchError(f"Exchange rate provider is busy, please try again shortly: {e}") from e
+    except httpx.HTTPError as e:
+        raise RateFetchError(f"Failed to fetch exchange rates: {e}") from e
+
+    return _rate_table_from_payload(response.json(), base_currency)
+
+################ Single-Flight Coalescing ######################
+class SingleFlight:
+    """
+    Collapses concurrent calls for the same key into one in-flight call; every caller that
+    arrives while it runs waits for it and shares its result or exception.
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+        self._lock = threading.Lock()
+        self._calls: Dict[Hashable, Dict[str, Any]] = {}
+        self._async_calls: Dict[Tuple[int, Hashable], "asyncio.Future[Any]"] = {}
+        self.executed = 0
+        self.collapsed = 0
+
+    def do(self, key: Hashable, fn: Callable[[], Any]) -> Any:
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = {"done": threading.Event(), "result": None, "error": None}
+                self._calls[key] = call
+                self.executed += 1
+            else:
+                self.collapsed += 1
+
+        if not leader:
+            call["done"].wait()
+            if call["error"] is not None:
+                raise call["error"]
+            return call["result"]
+
+        try:
+            call["result"] = fn()
+            return call["result"]
+        except BaseException as e:
+            call["error"] = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call["done"].set()
+
+    async def do_async(self, key: Hashable, fn: Callable[[], Awaitable[Any]]) -> Any:
+        loop = asyncio.get_running_loop()
+        # Futures belong to one event loop, so coalesce per loop
+        flight_key = (id(loop), key)
+        with self._lock:
+            future = self._async_calls.get(flight_key)
+            leader = future is None
+            if leader:
+                future = loop.create_future()
+                self._async_calls[flight_key] = future
+                self.executed += 1
+            else:
+                self.collapsed += 1
+
+        if not leader:
+            return await asyncio.shield(future)
+
+        try:
+            result = await fn()
+            future.set_result(result)
+            return result
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except BaseException as e:
+            future.set_exception(e)
+            future.exception()  # mark retrieved so asyncio does not log it when nobody was waiting
+            raise
+        finally:
+            with self._lock:
+                self._async_calls.pop(flight_key, None)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            total = self.executed + self.collapsed
+            return {
+                "executed": self.executed,
+                "collapsed": self.collapsed,
+                "in_flight": len(self._calls) + len(self._async_calls),
+                "collapse_rate": (self.collapsed / total) if total else 0.0,
+            }
+
+RATE_FETCH_FLIGHT = SingleFlight("rate_fetch")
+LLM_PARSE_FLIGHT = SingleFlight("llm_parse")
+
+################ Shared Rate Store ######################
+SHARED_RATE_STORE_DIR = os.getenv("SHARED_RATE_STORE_DIR", "")
+
+class SharedRateStore:
+    """
+    Host-wide rate tables shared by every worker process, one fixed-layout file per base.
+    Writers build the file next to the old one and swap it in with os.replace, so readers
+    never lock: they map whatever file is current and re-decode only when it changes.
+    A per-base flock lets a single worker refresh a table while the others wait and reuse it.
+
+    Layout (little-endian): header `<4sIIdd8s` (magic, layout version, count, fetched_at,
+    expires_at, base), then `count` 4-byte currency codes, then `count` float64 rates.
+    """
+
+    MAGIC = b"FXRT"
+    LAYOUT_VERSION = 1
+    _HEADER = struct.Struct("<4sIIdd8s")
+
+    def __init__(self, directory: Union[str, Path]):
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        # base -> ((st_ino, st_mtime_ns, st_size), (rates, fetched_at, expires_at))
+        self._views: Dict[str, Tuple[Tuple[int, int, int], Tuple[Dict[str, float], float, float]]] = {}
+        self.loads = 0
+        self.decodes = 0
+        self.publishes = 0
+
+    def _path(self, base_currency: str) -> Path:
+        return self.directory / f"rates-{base_currency}.bin"
+
+    def _decode(self, view: mmap.mmap) -> Optional[Tuple[Dict[str, float], float, float]]:
+        header_size = self._HEADER.size
+        if len(view) < header_size:
+            return None
+        magic, layout_version, count, fetched_at, expires_at, _ = self._HEADER.unpack_from(view, 0)
+        if magic != self.MAGIC or layout_version != self.LAYOUT_VERSION or len(view) != header_size + count * 12:
+            return None
+        codes_end = header_size + count * 4
+        codes = [view[i:i + 3].decode("ascii") for i in range(header_size, codes_end, 4)]
+        values = struct.unpack_from(f"<{count}d", view, codes_end)
+        return dict(zip(codes, values)), fetched_at, expires_at
+
+    def load(self, base_currency: str) -> Optional[Tuple[Dict[str, float], float, float]]:
+        """(rates, fetched_at, expires_at) as last published by any process, or None."""
+        self.loads += 1
+        try:
+            with open(self._path(base_currency), "rb") as f:
+                st = os.fstat(f.fileno())
+                version = (st.st_ino, st.st_mtime_ns, st.st_size)
+                cached = self._views.get(base_currency)
+                if cached is not None and cached[0] == version:
+                    return cached[1]
+                if st.st_size == 0:
+                    return None
+                with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as view:
+                    table = self._decode(view)
+        except (OSError, ValueError, UnicodeDecodeError) as e:
+            logger.warning("Could not read shared rate table for %s: %s", base_currency, e)
+            return None
+        if table is not None:
+            self.decodes += 1
+            self._views[base_currency] = (version, table)
+        return table
+
+    def publish(self, base_currency: str, rates: Dict[str, float], fetched_at: float, expires_at: float) -> None:
+        """Atomically replaces the shared table for `base_currency`."""
+        codes = [code for code in rates if len(code) == 3 and code.isascii()]
+        payload = b"".join((
+            self._HEADER.pack(self.MAGIC, self.LAYOUT_VERSION, len(codes), fetched_at, expires_at,
+                              base_currency.encode("ascii")),
+            b"".join(code.encode("ascii") + b"\0" for code in codes),
+            struct.pack(f"<{len(codes)}d", *(float(rates[code]) for code in codes)),
+        ))
+        try:
+            fd, tmp_path = tempfile.mkstemp(dir=self.directory, prefix=f".rates-{base_currency}.", suffix=".tmp")
+            try:
+                os.fchmod(fd, 0o644)  # mkstemp creates 0600; workers may run as other users
+                with os.fdopen(fd, "wb") as f:
+                    f.write(payload)
+                os.replace(tmp_path, self._path(base_currency))
+            except BaseException:
+                os.unlink(tmp_path)
+                raise
+        except OSError as e:
+            logger.warning("Could not publish shared rate table for %s: %s", base_currency, e)
+            return
+        self.publishes += 1
+
+    @contextmanager
+    def writer_lock(self, base_currency: str) -> Iterator[None]:
+        """Serializes refreshes of one base across processes (a no-op where flock is unavailable)."""
+        if fcntl is None:
+            yield
+            return
+        with open(self.directory / f"rates-{base_currency}.lock", "a") as lock_file:
+            fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file.fileno(), fcntl.LOCK_UN)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "directory": str(self.directory),
+            "loads": self.loads,
+            "decodes": self.decodes,
+            "publishes": self.publishes,
+        }
+
+SHARED_RATE_STORE = SharedRateStore(SHARED_RATE_STORE_DIR) if SHARED_RATE_STORE_DIR else None
+
+################ Historical Rate Archive ######################
+# Every fetched table is kept by day; set RATE_ARCHIVE_DIR to an empty string to turn this off.
+# The directory is created on the first write, and an unwritable one turns the archive off.
+RATE_ARCHIVE_DIR = os.getenv("RATE_ARCHIVE_DIR", str(project_root / "data" / "rate_archive"))
+# First day the archive can address; ExchangeRate-API history starts in 1990
+RATE_ARCHIVE_EPOCH = date(1990, 1, 1)
+
+def historical_date(as_of: Union[str, date, None]) -> Optional[date]:
+    """
+    The past UTC day `as_of` refers to, or None when the latest rates apply (no date, or today).
+    Raises RateFetchError for malformed, future or pre-archive dates.
+    """
+    if as_of is None or as_of == "":
+        return None
+    if isinstance(as_of, str):
+        try:
+            as_of = date.fromisoformat(as_of.strip())
+        except ValueError:
+            raise RateFetchError(f"Invalid as_of date '{as_of}'. Expected YYYY-MM-DD.") from None
+    today = datetime.now(timezone.utc).date()
+    if as_of > today:
+        raise RateFetchError(f"Rates for {as_of.isoformat()} are not available yet.")
+    if as_of < RATE_ARCHIVE_EPOCH:
+        raise RateFetchError(f"Historical rates are only available from {RATE_ARCHIVE_EPOCH.isoformat()} onwards.")
+    return None if as_of == today else as_of
+
+class RateArchive:
+    """
+    Date-indexed history of fetched rate tables, one file pair per base currency.
+    `{BASE}.codes` lists the column codes (4 bytes each, append-only). `{BASE}.rates` is a 16-byte
+    header `<4sIiI` (magic, layout version, epoch day ordinal, row width) followed by one row of
+    `ROW_WIDTH` little-endian float64 per UTC day since RATE_ARCHIVE_EPOCH, so a day's row sits at
+    a fixed offset. Days never written are sparse holes that read as 0.0, meaning "no data".
+    Rows are written in place under a per-base flock (the last fetch of a day wins) and are never
+    removed; lookups read them through mmap. The directory is created on the first write; if
+    that or any write fails, recording stops (with one warning) while lookups keep working.
+    """
+
+    MAGIC = b"FXAR"
+    LAYOUT_VERSION = 1
+    ROW_WIDTH = 256
+    _HEADER = struct.Struct("<4sIiI")
+
+    def __init__(self, directory: Union[str, Path]):
+        self.directory = Path(directory)
+        self.writable = True
+        self._row_bytes = self.ROW_WIDTH * 8
+        self._header = self._HEADER.pack(self.MAGIC, self.LAYOUT_VERSION, RATE_ARCHIVE_EPOCH.toordinal(), self.ROW_WIDTH)
+        self._write_lock = threading.Lock()
+        self._map_lock = threading.Lock()
+        # base -> (codes file size, rates file size, code -> column, mapped rates file)
+        self._views: Dict[str, Tuple[int, int, Dict[str, int], mmap.mmap]] = {}
+        self.rows_written = 0
+        self.lookups = 0
+        self.lookup_misses = 0
+
+    def _paths(self, base_currency: str) -> Tuple[Path, Path]:
+        return self.directory / f"{base_currency}.codes", self.directory / f"{base_currency}.rates"
+
+    def _row_offset(self, day: date) -> int:
+        return self._HEADER.size + (day.toordinal() - RATE_ARCHIVE_EPOCH.toordinal()) * self._row_bytes
+
+    @staticmethod
+    def _read_codes(path: Path) -> List[str]:
+        try:
+            data = path.read_bytes()
+        except FileNotFoundError:
+            return []
+        return [data[i:i + 3].decode("ascii") for i in range(0, len(data) - len(data) % 4, 4)]
+
+    def record(self, base_currency: str, rates: Dict[str, float], day: date) -> bool:
+        """Stores `rates` as the table for `day`. Returns False if it could not be archived."""
+        if not self.writable or day < RATE_ARCHIVE_EPOCH:
+            return False
+        codes_path, rates_path = self._paths(base_currency)
+        try:
+            self.directory.mkdir(parents=True, exist_ok=True)
+            # Not opened with O_APPEND: pwrite would then ignore the row offset on Linux
+            with self._write_lock, os.fdopen(os.open(rates_path, os.O_RDWR | os.O_CREAT, 0o644), "r+b") as f:
+                if fcntl is not None:
+                    fcntl.flock(f.fileno(), fcntl.LOCK_EX)  # released when the file is closed
+                columns = self._read_codes(codes_path)
+                known = set(columns)
+                new_codes = [code for code in rates if code not in known and len(code) == 3 and code.isascii()]
+                new_codes = new_codes[:self.ROW_WIDTH - len(columns)]
+                if new_codes:
+                    # Codes are appended before any row refers to them, so readers never see an unnamed column
+                    with open(codes_path, "ab") as codes_file:
+                        codes_file.write(b"".join(code.encode("ascii") + b"\0" for code in new_codes))
+                    columns += new_codes
+
+                row = struct.pack(f"<{self.ROW_WIDTH}d", *(
+                    [float(rates.get(code) or 0.0) for code in columns] + [0.0] * (self.ROW_WIDTH - len(columns))
+                ))
+                fd = f.fileno()
+                if os.fstat(fd).st_size == 0:
+                    os.pwrite(fd, self._header, 0)
+                os.pwrite(fd, row, self._row_offset(day))
+        except OSError as e:
+            # Typically a read-only or missing mount; stop trying rather than warn on every fetch
+            self.writable = False
+            logger.warning("Could not archive %s rates for %s, rate archiving is off: %s", base_currency, day.isoformat(), e)
+            return False
+        self.rows_written += 1
+        return True
+
+    def _view(self, base_currency: str) -> Optional[Tuple[int, int, Dict[str, int], mmap.mmap]]:
+        codes_path, rates_path = self._paths(base_currency)
+        try:
+            codes_size, rates_size = os.stat(codes_path).st_size, os.stat(rates_path).st_size
+        except FileNotFoundError:
+            return None
+        with self._map_lock:
+            view = self._views.get(base_currency)
+            # Rewrites of an existing row show through the shared mapping; only growth needs a remap
+            if view is not None and view[0] == codes_size and view[1] == rates_size:
+                return view
+            if rates_size < self._HEADER.size:
+                return None
+            with open(rates_path, "rb") as f:
+                mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            if mapped[:self._HEADER.size] != self._header:
+                logger.warning("Ignoring rate archive %s: unexpected header", rates_path)
+                self._close(mapped)
+                return None
+            columns = {code: column for column, code in enumerate(self._read_codes(codes_path))}
+            self._views[base_currency] = (codes_size, len(mapped), columns, mapped)
+            if view is not None:
+                self._close(view[3])  # readers still holding it get None and remap (see _read_rate)
+            return self._views[base_currency]
+
+    @staticmethod
+    def _close(mapped: mmap.mmap) -> None:
+        try:
+            mapped.close()
+        except BufferError:
+            pass  # a reader is mid-unpack on it; garbage collection releases it afterwards
+
+    def _read_rate(self, view: Tuple[int, int, Dict[str, int], mmap.mmap], day: date,
+                   from_currency: str, to_currency: str) -> Optional[float]:
+        _, size, columns, mapped = view
+        offset = self._row_offset(day)
+        from_column, to_column = columns.get(from_currency), columns.get(to_currency)
+        if from_column is None or to_column is None or offset + self._row_bytes > size:
+            return None
+        try:
+            (from_rate,) = struct.unpack_from("<d", mapped, offset + from_column * 8)
+            (to_rate,) = struct.unpack_from("<d", mapped, offset + to_column * 8)
+        except ValueError:  # closed after another thread remapped the grown file
+            return None
+        return to_rate / from_rate if from_rate and to_rate else None
+
+    def rate(self, base_currency: str, day: date, from_currency: str, to_currency: str) -> Optional[float]:
+        """The from -> to cross rate on `day` derived from the archived `base_currency` table, or None."""
+        self.lookups += 1
+        # Try the current mapping first; the files are only re-checked when it has no answer
+        view = self._views.get(base_currency)
+        rate = self._read_rate(view, day, from_currency, to_currency) if view is not None else None
+        if rate is None:
+            view = self._view(base_currency)
+            rate = self._read_rate(view, day, from_currency, to_currency) if view is not None else None
+        if rate is None:
+            self.lookup_misses += 1
+        return rate
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "directory": str(self.directory),
+            "writable": self.writable,
+            "rows_written": self.rows_written,
+            "lookups": self.lookups,
+            "lookup_misses": self.lookup_misses,
+        }
+
+RATE_ARCHIVE = RateArchive(RATE_ARCHIVE_DIR) if RATE_ARCHIVE_DIR else None
+
+class RateTableCache:
+    """
+    In-process cache of rate tables keyed by base currency.
+    Entries expire after `ttl_seconds` (or earlier, at the provider's announced next update),
+    and the least recently used table is evicted once `max_entries` is reached.
+    Expired tables stay servable for `max_staleness_seconds`: while a background refresher is
+    attached through `on_stale`, or when the upstream fetch fails.
+    With a `shared_store`, misses and refreshes first reuse a table another process published.
+    Every table fetched from upstream is also written to `archive` under its UTC day.
+    """
+
+    def __init__(self, ttl_seconds: float = RATE_CACHE_TTL_SECONDS, max_entries: int = RATE_CACHE_MAX_ENTRIES,
+                 max_staleness_seconds: float = RATE_MAX_STALENESS_SECONDS,
+                 shared_store: Optional[SharedRateStore] = None, archive: Optional[RateArchive] = None):
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.max_staleness_seconds = max_staleness_seconds
+        self.shared_store = shared_store
+        self.archive = archive
+        # base -> (expires_at, rates, fetched_at)
+        self._entries: "OrderedDict[str, Tuple[float, Dict[str, float], float]]" = OrderedDict()
+        self._request_counts: Dict[str, float] = {}
+        self._lock = threading.Lock()
+        self.on_stale: Optional[Callable[[str], None]] = None
+        self.hits = 0
+        self.stale_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.shared_hits = 0
+
+    def is_fresh(self, base_currency: str) -> bool:
+        """True if `base_currency` would be served from memory; does not touch the hit/miss counters."""
+        with self._lock:
+            entry = self._entries.get(base_currency.upper())
+            return entry is not None and entry[0] > time.time()
+
+    def status(self, base_currency: str) -> Optional[Tuple[float, bool]]:
+        """(fetched_at, is_stale) for a cached table, or None if it is not cached."""
+        with self._lock:
+            entry = self._entries.get(base_currency.upper())
+            if entry is None:
+                return None
+            return entry[2], entry[0] <= time.time()
+
+    def expires_in(self, base_currency: str) -> Optional[float]:
+        with self._lock:
+            entry = self._entries.get(base_currency.upper())
+            return None if entry is None else entry[0] - time.time()
+
+    def hot_bases(self, limit: int) -> List[str]:
+        """Cached bases ranked by recent request frequency."""
+        with self._lock:
+            ranked = sorted(self._request_counts.items(), key=lambda item: item[1], reverse=True)
+            return [base for base, _ in ranked if base in self._entries][:limit]
+
+    def decay_request_counts(self, factor: float) -> None:
+        with self._lock:
+            self._request_counts = {base: count * factor for base, count in self._request_counts.items() if count * factor >= 0.01}
+
+    def _lookup(self, base_currency: str, now: float) -> Tuple[Optional[Dict[str, float]], Optional[Dict[str, float]]]:
+        """Returns (fresh table, None) on a hit, else (None, expired table still within the staleness bound)."""
+        with self._lock:
+            self._request_counts[base_currency] = self._request_counts.get(base_currency, 0.0) + 1.0
+            entry = self._entries.get(base_currency)
+            if entry is not None and entry[0] > now:
+                self._entries.move_to_end(base_currency)
+                self.hits += 1
+                return entry[1], None
+            self.misses += 1
+            if entry is not None and now - entry[0] <= self.max_staleness_seconds:
+                return None, entry[1]
+            return None, None
+
+    def _serve_stale(self, stale: Dict[str, float]) -> Dict[str, float]:
+        with self._lock:
+            # _lookup counted a miss; the request was answered from memory after all
+            self.stale_hits += 1
+            self.misses -= 1
+        return stale
+
+    def _expiry(self, next_update_unix: Optional[float], now: float) -> float:
+        expires_at = now + self.ttl_seconds
+        if next_update_unix and now < next_update_unix < expires_at:
+            expires_at = float(next_update_unix)
+        return expires_at
+
+    def _store(self, base_currency: str, rates: Dict[str, float], expires_at: float, fetched_at: float) -> None:
+        with self._lock:
+            self._entries[base_currency] = (expires_at, rates, fetched_at)
+            self._entries.move_to_end(base_currency)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def get(self, base_currency: str) -> Dict[str, float]:
+        base_currency = base_currency.upper()
+        with span("rate_fetch", "hit") as details:
+            now = time.time()
+            rates, stale = self._lookup(base_currency, now)
+            if rates is not None:
+                return rates
+            details["outcome"] = "stale"
+            if stale is not None and self.on_stale is not None:
+                # Stale-while-revalidate: answer from the old table and let the refresher reload it
+                self.on_stale(base_currency)
+                return self._serve_stale(stale)
+
+            # Fetch outside the lock so one slow upstream call does not block hits for other bases;
+            # concurrent misses for the same base share a single upstream call
+            details["outcome"] = "miss"
+            try:
+                return RATE_FETCH_FLIGHT.do(base_currency, lambda: self._fetch_and_store(base_currency))
+            except RateFetchError:
+                if stale is None:
+                    raise
+                # Upstream outage: keep answering from the last good table within the staleness bound
+                details["outcome"] = "stale_fallback"
+                return self._serve_stale(stale)
+
+    async def get_async(self, base_currency: str) -> Dict[str, float]:
+        base_currency = base_currency.upper()
+        with span("rate_fetch", "hit") as details:
+            return await self._get_async(base_currency, details)
+
+    async def _get_async(self, base_currency: str, details: Dict[str, Any]) -> Dict[str, float]:
+        now = time.time()
+        rates, stale = self._lookup(base_currency, now)
+        if rates is not None:
+            return rates
+        details["outcome"] = "stale"
+        if stale is not None and self.on_stale is not None:
+            self.on_stale(base_currency)
+            return self._serve_stale(stale)
+        details["outcome"] = "miss"
+
+        async def fetch_and_store() -> Dict[str, float]:
+            # Shared-store reads are local mmap reads; the cross-process writer lock is skipped
+            # here so a slow peer cannot block the event loop
+            shared = self._adopt_shared(base_currency, refresh=False)
+            if shared is not None:
+                return shared
+            fetched_at = time.time()
+            rates, next_update_unix = await fetch_rate_table_async(base_currency)
+            self._publish(base_currency, rates, self._expiry(next_update_unix, fetched_at), fetched_at)
+            return rates
+
+        try:
+            return await RATE_FETCH_FLIGHT.do_async(base_currency, fetch_and_store)
+        except RateFetchError:
+            if stale is None:
+                raise
+            details["outcome"] = "stale_fallback"
+            return self._serve_stale(stale)
+
+    def _adopt_shared(self, base_currency: str, refresh: bool) -> Optional[Dict[str, float]]:
+        """
+        Loads a fresh table published by another process into memory and returns it.
+        When `refresh` is set, the shared table must also be newer than the one held locally.
+        """
+        if self.shared_store is None:
+            return None
+        shared = self.shared_store.load(base_currency)
+        if shared is None:
+            return None
+        rates, fetched_at, expires_at = shared
+        if expires_at <= time.time():
+            return None
+        if refresh:
+            with self._lock:
+                entry = self._entries.get(base_currency)
+            if entry is not None and entry[2] >= fetched_at:
+                return None
+        self._store(base_currency, rates, expires_at, fetched_at)
+        with self._lock:
+            self.shared_hits += 1
+        return rates
+
+    def _publish(self, base_currency: str, rates: Dict[str, float], expires_at: float, fetched_at: float) -> None:
+        self._store(base_currency, rates, expires_at, fetched_at)
+        if self.shared_store is not None:
+            self.shared_store.publish(base_currency, rates, fetched_at, expires_at)
+        if self.archive is not None:
+            self.archive.record(base_currency, rates, datetime.fromtimestamp(fetched_at, tz=timezone.utc).date())
+
+    def _fetch_and_store(self, base_currency: str, refresh: bool = False) -> Dict[str, float]:
+        if self.shared_store is None:
+            fetched_at = time.time()
+            rates, next_update_unix = fetch_rate_table(base_currency)
+            self._publish(base_currency, rates, self._expiry(next_update_unix, fetched_at), fetched_at)
+            return rates
+
+        shared = self._adopt_shared(base_currency, refresh)
+        if shared is not None:
+            return shared
+        # One worker per host refreshes a base; the others wait here and then adopt its table
+        with self.shared_store.writer_lock(base_currency):
+            shared = self._adopt_shared(base_currency, refresh)
+            if shared is not None:
+                return shared
+            fetched_at = time.time()
+            rates, next_update_unix = fetch_rate_table(base_currency)
+            self._publish(base_currency, rates, self._expiry(next_update_unix, fetched_at), fetched_at)
+            return rates
+
+    def refresh(self, base_currency: str) -> Dict[str, float]:
+        """
+        Fetches `base_currency` and replaces the cached table, unless another process already
+        published a newer one to the shared store. Raises RateFetchError.
+        """
+        base_currency = base_currency.upper()
+        return RATE_FETCH_FLIGHT.do(base_currency, lambda: self._fetch_and_store(base_currency, refresh=True))
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.hits + self.stale_hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "hits": self.hits,
+                "stale_hits": self.stale_hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "shared_hits": self.shared_hits,
+                "hit_rate": ((self.hits + self.stale_hits) / lookups) if lookups else 0.0,
+            }
+
+RATE_CACHE = RateTableCache(shared_store=SHARED_RATE_STORE, archive=RATE_ARCHIVE)
+
+################ Background Rate Refresher ######################
+RATE_REFRESH_INTERVAL_SECONDS = float(os.getenv("RATE_REFRESH_INTERVAL_SECONDS", "30"))
+RATE_REFRESH_AHEAD_SECONDS = float(os.getenv("RATE_REFRESH_AHEAD_SECONDS", "120"))
+RATE_REFRESH_TOP_N = int(os.getenv("RATE_REFRESH_TOP_N", "8"))
+RATE_REFRESH_BUDGET_PER_MINUTE = int(os.getenv("RATE_REFRESH_BUDGET_PER_MINUTE", "10"))
+
+class RateRefresher:
+    """
+    Daemon thread that reloads the most requested base tables shortly before they expire,
+    plus any stale table a request was just served from. Upstream calls made by the
+    refresher are capped at `budget_per_minute`.
+    """
+
+    def __init__(self, cache: RateTableCache = RATE_CACHE, interval_seconds: float = RATE_REFRESH_INTERVAL_SECONDS,
+                 refresh_ahead_seconds: float = RATE_REFRESH_AHEAD_SECONDS, top_n: int = RATE_REFRESH_TOP_N,
+                 budget_per_minute: int = RATE_REFRESH_BUDGET_PER_MINUTE):
+        self.cache = cache
+        self.interval_seconds = interval_seconds
+        self.refresh_ahead_seconds = refresh_ahead_seconds
+        self.top_n = top_n
+        self.budget_per_minute = budget_per_minute
+        self._recent_fetches: "deque[float]" = deque()
+        self._pending: List[str] = []
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self.refreshes = 0
+        self.failures = 0
+        self.skipped_for_budget = 0
+
+    def start(self) -> "RateRefresher":
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._stop.clear()
+                self._thread = threading.Thread(target=self._run, name="rate-refresher", daemon=True)
+                self._thread.start()
+                self.cache.on_stale = self.request_refresh
+        return self
+
+    def stop(self) -> None:
+        self.cache.on_stale = None
+        self._stop.set()
+        self._wake.set()
+
+    def request_refresh(self, base_currency: str) -> None:
+        """Queues a base that was just served stale and wakes the refresher."""
+        with self._lock:
+            if base_currency not in self._pending:
+                self._pending.append(base_currency)
+        self._wake.set()
+
+    def _take_budget(self) -> bool:
+        now = time.time()
+        while self._recent_fetches and now - self._recent_fetches[0] >= 60:
+            self._recent_fetches.popleft()
+        if len(self._recent_fetches) >= self.budget_per_minute:
+            return False
+        self._recent_fetches.append(now)
+        return True
+
+    def refresh_due(self) -> None:
+        """One refresher pass: stale tables first, then hot tables close to expiry."""
+        with self._lock:
+            candidates, self._pending = self._pending, []
+        for base_currency in self.cache.hot_bases(self.top_n):
+            expires_in = self.cache.expires_in(base_currency)
+            if base_currency not in candidates and expires_in is not None and expires_in <= self.refresh_ahead_seconds:
+                candidates.append(base_currency)
+
+        for position, base_currency in enumerate(candidates):
+            if not self._take_budget():
+                self.skipped_for_budget += len(candidates) - position
+                # Retry stale tables on the next pass once budget frees up
+                with self._lock:
+                    self._pending.extend(b for b in candidates[position:] if b not in self._pending)
+                break
+            try:
+                self.cache.refresh(base_currency)
+                self.refreshes += 1
+            except RateFetchError as e:
+                self.failures += 1
+                logger.warning("Background refresh of %s rates failed: %s", base_currency, e)
+        # Let request frequency reflect recent traffic rather than all-time totals
+        self.cache.decay_request_counts(0.9)
+
+    def _run(self) -> None:
+        while not self._stop.is_set():
+            self._wake.wait(self.interval_seconds)
+            self._wake.clear()
+            if self._stop.is_set():
+                break
+            try:
+                with upstream_priority(PRIORITY_BACKGROUND):
+                    self.refresh_due()
+            except Exception as e:
+                logger.exception("Rate refresher pass failed: %s", e)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "running": self._thread is not None and self._thread.is_alive(),
+            "refreshes": self.refreshes,
+            "failures": self.failures,
+            "skipped_for_budget": self.skipped_for_budget,
+        }
+
+RATE_REFRESHER = RateRefresher()
+
+def start_rate_refresher() -> RateRefresher:
+    """Starts the background refresher; until then expired tables are refetched inline."""
+    return RATE_REFRESHER.start()
+
+################ Cross-Rate Engine ######################
+# Every pair is derived from one anchor table, so a mixed workload costs one upstream call per TTL
+ANCHOR_CURRENCY = os.getenv("ANCHOR_CURRENCY", "USD").upper()
+
+class CrossRateEngine:
+    """
+    Computes any currency pair from a single anchor rate table as rate[to] / rate[from].
+    The anchor table is held as a float64 vector (NumPy if available, otherwise array('d'))
+    indexed through a currency-code -> slot map, rebuilt only when the cached table changes.
+    Rates for a past day come from the archived anchor table, or from the provider's history
+    endpoint (then archived) when that day has not been recorded.
+    """
+
+    def __init__(self, cache: RateTableCache = RATE_CACHE, anchor: str = ANCHOR_CURRENCY,
+                 archive: Optional[RateArchive] = RATE_ARCHIVE):
+        self.cache = cache
+        self.anchor = anchor.upper()
+        self.archive = archive
+        self._lock = threading.Lock()
+        self._source: Optional[Dict[str, float]] = None
+        self._slots: Dict[str, int] = {}
+        self._vector: Any = None
+        # Bumped whenever a new anchor table is indexed, so answers can be tied to the rates they used
+        self._version = 0
+
+    def snapshot(self) -> Tuple[Dict[str, int], Any]:
+        """Returns the current (code -> slot map, rate vector) pair for the anchor table."""
+        return self._index(self.cache.get(self.anchor))[:2]
+
+    async def snapshot_async(self) -> Tuple[Dict[str, int], Any]:
+        return self._index(await self.cache.get_async(self.anchor))[:2]
+
+    def _index(self, table: Dict[str, float]) -> Tuple[Dict[str, int], Any, int]:
+        with self._lock:
+            if table is not self._source:
+                codes = sorted(table)
+                values = [float(table[code]) for code in codes]
+                self._slots = {code: slot for slot, code in enumerate(codes)}
+                self._vector = np.array(values, dtype=np.float64) if np is not None else array("d", values)
+                self._source = table
+                self._version += 1
+            return self._slots, self._vector, self._version
+
+    def versioned_rate(self, from_currency: str, to_currency: str,
+                       as_of: Union[str, date, None] = None) -> Tuple[Hashable, float]:
+        """
+        The rate plus the version of the rates it came from: the anchor snapshot's version for
+        latest rates, or the ISO day for a past date, whose rates never change.
+        """
+        day = historical_date(as_of)
+        if day is not None:
+            return day.isoformat(), self.historical_rate(from_currency, to_currency, day)
+        slots, vector, version = self._index(self.cache.get(self.anchor))
+        from_slot = self._slot(slots, from_currency, "from_currency")
+        to_slot = self._slot(slots, to_currency, "to_currency")
+        return version, float(vector[to_slot]) / float(vector[from_slot])
+
+    def published_snapshot(self) -> Dict[str, Any]:
+        """
+        The anchor table for clients that convert locally: {"base", "version", "rates",
+        "fetched_at", "expires_at"} with times in unix seconds. Raises RateFetchError.
+        """
+        table = self.cache.get(self.anchor)
+        version = self._index(table)[2]
+        now = time.time()
+        status = self.cache.status(self.anchor)
+        expires_in = self.cache.expires_in(self.anchor)
+        return {
+            "base": self.anchor,
+            "version": version,
+            "rates": table,
+            "fetched_at": status[0] if status is not None else now,
+            "expires_at": now + expires_in if expires_in is not None else now,
+        }
+
+    def staleness_note(self) -> str:
+        """A sentence to append to answers computed from an expired anchor table, else ""."""
+        status = self.cache.status(self.anchor)
+        if status is None or not status[1]:
+            return ""
+        fetched_at = datetime.fromtimestamp(status[0], tz=timezone.utc).strftime("%Y-%m-%d %H:%M UTC")
+        return f" Note: rates may be stale (last updated {fetched_at})."
+
+    def is_stale(self) -> bool:
+        status = self.cache.status(self.anchor)
+        return status is not None and status[1]
+
+    @staticmethod
+    def _slot(slots: Dict[str, int], code: str, field: str) -> int:
+        slot = slots.get(code.upper())
+        if slot is None:
+            raise RateFetchError(f"Invalid or unsupported currency code for '{field}': {code}")
+        return slot
+
+    def rate(self, from_currency: str, to_currency: str, as_of: Union[str, date, None] = None) -> float:
+        day = historical_date(as_of)
+        if day is not None:
+            return self.historical_rate(from_currency, to_currency, day)
+        slots, vector = self.snapshot()
+        from_slot = self._slot(slots, from_currency, "from_currency")
+        to_slot = self._slot(slots, to_currency, "to_currency")
+        return float(vector[to_slot]) / float(vector[from_slot])
+
+    def convert(self, amount: float, from_currency: str, to_currency: str, as_of: Union[str, date, None] = None) -> float:
+        return amount * self.rate(from_currency, to_currency, as_of)
+
+    def historical_rate(self, from_currency: str, to_currency: str, day: date) -> float:
+        return self.historical_rates(from_currency, [to_currency], day)[0]
+
+    def historical_rates(self, from_currency: str, to_currencies: Sequence[str], day: date) -> List[float]:
+        """Rates from `from_currency` to each target on `day`, from the archive or one history fetch."""
+        from_currency = from_currency.upper()
+        to_currencies = [code.upper() for code in to_currencies]
+        if self.archive is not None:
+            rates = [self.archive.rate(self.anchor, day, from_currency, code) for code in to_currencies]
+            if all(rate is not None for rate in rates):
+                return rates
+
+        table = RATE_FETCH_FLIGHT.do((self.anchor, day), lambda: self._fetch_history(day))
+        for code, field in [(from_currency, "from_currency")] + [(code, "to_currency") for code in to_currencies]:
+            if not table.get(code):
+                raise RateFetchError(f"Invalid or unsupported currency code for '{field}': {code}")
+        return [float(table[code]) / float(table[from_currency]) for code in to_currencies]
+
+    def _fetch_history(self, day: date) -> Dict[str, float]:
+        table = fetch_history_table(self.anchor, day)
+        if self.archive is not None:
+            self.archive.record(self.anchor, table, day)
+        return table
+
+    def convert_many(
+        self,
+        amounts: Sequence[float],
+        from_codes: Union[str, Sequence[str]],
+        to_codes: Union[str, Sequence[str]],
+    ) -> Any:
+        """
+        Vectorized conversion of `amounts[i]` from `from_codes[i]` to `to_codes[i]`.
+        Either code argument may be a single string, which applies to every row.
+        Returns a NumPy array when NumPy is installed, otherwise a list of floats.
+        """
+        slots, vector = self.snapshot()
+        n = len(amounts)
+        if isinstance(from_codes, str):
+            from_codes = [from_codes] * n
+        if isinstance(to_codes, str):
+            to_codes = [to_codes] * n
+        if len(from_codes) != n or len(to_codes) != n:
+            raise ValueError("amounts, from_codes and to_codes must have the same length")
+
+        from_slots = [self._slot(slots, code, "from_currency") for code in from_codes]
+        to_slots = [self._slot(slots, code, "to_currency") for code in to_codes]
+        if np is not None:
+            from_idx = np.asarray(from_slots, dtype=np.intp)
+            to_idx = np.asarray(to_slots, dtype=np.intp)
+            return np.asarray(amounts, dtype=np.float64) * (vector[to_idx] / vector[from_idx])
+        return [float(a) * vector[t] / vector[f] for a, f, t in zip(amounts, from_slots, to_slots)]
+
+    def convert_grid(
+        self,
+        amounts: Sequence[float],
+        from_currency: str,
+        to_currencies: Sequence[str],
+        as_of: Union[str, date, None] = None,
+    ) -> Tuple[List[float], List[List[float]]]:
+        """
+        Converts every amount into every target from one anchor snapshot (or one archived day).
+        Returns the rate per target and grid[i][j] = amounts[i] * rates[j], computed as one outer product.
+        """
+        day = historical_date(as_of)
+        if day is not None:
+            rates: Any = self.historical_rates(from_currency, to_currencies, day)
+        else:
+            slots, vector = self.snapshot()
+            from_slot = self._slot(slots, from_currency, "from_currency")
+            to_slots = [self._slot(slots, code, "to_currency") for code in to_currencies]
+            if np is not None:
+                rates = vector[np.asarray(to_slots, dtype=np.intp)] / vector[from_slot]
+            else:
+                rates = [vector[slot] / vector[from_slot] for slot in to_slots]
+        if np is not None:
+            grid = np.outer(np.asarray(amounts, dtype=np.float64), np.asarray(rates, dtype=np.float64))
+            return [float(rate) for rate in rates], grid.tolist()
+        return list(rates), [[float(amount) * rate for rate in rates] for amount in amounts]
+
+CROSS_RATES = CrossRateEngine()
+
+def published_rate_snapshot() -> Dict[str, Any]:
+    """The current anchor table as served by the web app's /rates endpoint (see CrossRateEngine.published_snapshot)."""
+    return CROSS_RATES.published_snapshot()
+
+def conversion_records(amounts: Sequence[float], to_currencies: Sequence[str], rates: Sequence[float],
+                       grid: Sequence[Sequence[float]]) -> List[Dict[str, Any]]:
+    """Flattens a convert_grid() result into one record per (amount, target), amount-major."""
+    return [
+        {"amount": amount, "to_currency": code, "rate": rate, "converted_amount": converted}
+        for amount, row in zip(amounts, grid) for code, rate, converted in zip(to_currencies, rates, row)
+    ]
+
+def _convert_multi_row(inputs: Dict[str, Any]) -> Dict[str, Any]:
+    amounts, targets = query_amounts(inputs), query_targets(inputs)
+    inputs["from_currency"] = inputs["from_currency"].upper()
+    inputs["to_currency"] = targets if isinstance(inputs["to_currency"], list) else targets[0]
+    try:
+        rates, grid = CROSS_RATES.convert_grid(amounts, inputs["from_currency"], targets, inputs.get("as_of"))
+    except RateFetchError as e:
+        return {**inputs, "error": str(e)}
+    stale = False if inputs.get("as_of") else CROSS_RATES.is_stale()
+    return {**inputs, "conversions": conversion_records(amounts, targets, rates, grid), "stale": stale}
+
+def _convert_historical_row(inputs: Dict[str, Any]) -> Dict[str, Any]:
+    inputs["from_currency"], inputs["to_currency"] = inputs["from_currency"].upper(), inputs["to_currency"].upper()
+    try:
+        converted_amount = CROSS_RATES.convert(inputs["amount"], inputs["from_currency"], inputs["to_currency"], inputs["as_of"])
+    except RateFetchError as e:
+        return {**inputs, "error": str(e)}
+    return {**inputs, "converted_amount": converted_amount, "stale": False}
+
+def convert_rows(rows: Sequence[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """
+    Converts structured {amount, from_currency, to_currency} rows against one anchor snapshot
+    with a single vectorized multiply. Rows with an `as_of` date are looked up in the archive
+    one by one, and rows listing several amounts or targets get a "conversions" list.
+    Results keep input order; bad rows get an "error" entry.
+    """
+    results: List[Dict[str, Any]] = [{} for _ in rows]
+    valid: List[Tuple[int, Dict[str, Any]]] = []
+    for index, row in enumerate(rows):
+        try:
+            inputs = CurrencyConverterInput(**row).model_dump(mode="json", exclude_none=True)
+            if is_multi_query(inputs):
+                results[index] = _convert_multi_row(inputs)
+            elif "as_of" in inputs:
+                results[index] = _convert_historical_row(inputs)
+            else:
+                valid.append((index, inputs))
+        except ValidationError as e:
+            problems = "; ".join(f"{'.'.join(map(str, err['loc']))}: {err['msg']}" for err in e.errors())
+            results[index] = {"error": f"Invalid row: {problems}"}
+        except TypeError:
+            results[index] = {"error": "Invalid row: expected an object with amount, from_currency and to_currency"}
+    if not valid:
+        return results
+
+    try:
+        slots, _ = CROSS_RATES.snapshot()
+    except RateFetchError as e:
+        for index, _ in valid:
+            results[index] = {"error": str(e)}
+        return results
+
+    convertible: List[Tuple[int, Dict[str, Any]]] = []
+    for index, inputs in valid:
+        inputs["from_currency"], inputs["to_currency"] = inputs["from_currency"].upper(), inputs["to_currency"].upper()
+        unknown = next((f for f in ("from_currency", "to_currency") if inputs[f] not in slots), None)
+        if unknown:
+            results[index] = {**inputs, "error": f"Invalid or unsupported currency code for '{unknown}': {inputs[unknown]}"}
+        else:
+            convertible.append((index, inputs))
+    if not convertible:
+        return results
+
+    try:
+        converted = CROSS_RATES.convert_many(
+            [inputs["amount"] for _, inputs in convertible],
+            [inputs["from_currency"] for _, inputs in convertible],
+            [inputs["to_currency"] for _, inputs in convertible],
+        )
+    except RateFetchError as e:
+        for index, inputs in convertible:
+            results[index] = {**inputs, "error": str(e)}
+        return results
+    stale = CROSS_RATES.is_stale()
+    for (index, inputs), converted_amount in zip(convertible, converted):
+        results[index] = {**inputs, "converted_amount": float(converted_amount), "stale": stale}
+    return results
+
+################## Class for actual tool ######################
+def format_conversion(amount: float, from_currency: str, to_currency: str, converted_amount: float,
+                      as_of: Optional[date] = None) -> str:
+    if as_of is not None:
+        return f"{amount} {from_currency.upper()} was equal to {converted_amount:.2f} {to_currency.upper()} on {as_of.isoformat()}."
+    return f"{amount} {from_currency.upper()} is equal to {converted_amount:.2f} {to_currency.upper()}."
+
+def format_conversion_grid(amounts: Sequence[float], from_currency: str, to_currencies: Sequence[str],
+                           rates: Sequence[float], grid: Sequence[Sequence[float]], as_of: Optional[date] = None) -> str:
+    """One line per amount listing every target, then the rates used."""
+    from_currency = from_currency.upper()
+    lines = [
+        f"{amount} {from_currency} = " + " | ".join(f"{converted:.2f} {code}" for code, converted in zip(to_currencies, row))
+        for amount, row in zip(amounts, grid)
+    ]
+    when = f" on {as_of.isoformat()}" if as_of is not None else ""
+    lines.append(f"Exchange rates{when}: 1 {from_currency} = " + ", ".join(f"{rate:.6g} {code}" for code, rate in zip(to_currencies, rates)) + ".")
+    return "\n".join(lines)
+
+def convert_currency(amount: Union[float, Sequence[float]], from_currency: str, to_currency: Union[str, Sequence[str]],
+                     as_of: Union[str, date, None] = None) -> str:
+    """
+    Converts `amount` with the current cross rates, or the archived rates of `as_of` (YYYY-MM-DD),
+    and returns a one-line result or error message. Lists of amounts and/or target currencies are
+    converted together from one rate lookup and returned as a grid.
+    """
+    try:
+        day = historical_date(as_of)
+        inputs = {"amount": amount, "to_currency": to_currency}
+        if is_multi_query(inputs):
+            amounts, targets = query_amounts(inputs), query_targets(inputs)
+            rates, grid = CROSS_RATES.convert_grid(amounts, from_currency, targets, day)
+            text = format_conversion_grid(amounts, from_currency, targets, rates, grid, day)
+            return text if day is not None else text + CROSS_RATES.staleness_note()
+        converted_amount = CROSS_RATES.convert(amount, from_currency, to_currency, day)
+    except RateFetchError as e:
+        return str(e)
+    if day is not None:
+        return format_conversion(amount, from_currency, to_currency, converted_amount, day)
+    return format_conversion(amount, from_currency, to_currency, converted_amount) + CROSS_RATES.staleness_note()
+
+_agent_lock = threading.Lock()
+_tool_class: Optional[type] = None
+_tool_instance: Any = None
+
+def _currency_converter_tool_class() -> type:
+    """Defines CurrencyConverterTool on first use, since its BaseTool parent pulls in crewai."""
+    global _tool_class
+    with _agent_lock:
+        if _tool_class is None:
+            from crewai.tools import BaseTool
+
+            class CurrencyConverterTool(BaseTool):
+                name: str = "Currency Converter Tool"
+                description: str = (
+                    "Converts an amount from one currency to another using the ExchangeRate API. "
+                    "Pass lists as `amount` and/or `to_currency` to convert several amounts or targets in one call. "
+                    "Pass `as_of` (YYYY-MM-DD) to convert at a past day's rates."
+                )
+                args_schema: Type[BaseModel] = CurrencyConverterInput
+                # The api_key for this tool will use the globally loaded EXCHANGE_RATE_API_KEY
+
+                def _run(self, amount: Union[float, List[float]], from_currency: str, to_currency: Union[str, List[str]],
+                         as_of: Union[str, date, None] = None) -> str:
+                    with span("tool", "historical" if as_of else "latest"):
+                        return convert_currency(amount, from_currency, to_currency, as_of)
+
+            CurrencyConverterTool.__module__ = __name__
+            CurrencyConverterTool.__qualname__ = "CurrencyConverterTool"
+            _tool_class = CurrencyConverterTool
+        return _tool_class
+
+def currency_converter_tool() -> Any:
+    """The shared tool instance; the tool is stateless, so every pooled agent uses the same one."""
+    global _tool_instance
+    tool_class = _currency_converter_tool_class()
+    with _agent_lock:
+        if _tool_instance is None:
+            _tool_instance = tool_class()
+        return _tool_instance
+
+def __getattr__(name: str) -> Any:
+    """Resolves the crewai-backed module attributes lazily (PEP 562)."""
+    if name == "CurrencyConverterTool":
+        return _currency_converter_tool_class()
+    if name == "CURRENCY_CONVERTER_TOOL":
+        return currency_converter_tool()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+################ Rule-Based Fast-Path Parser ######################
+# ISO 4217 codes served by ExchangeRate-API
+ISO_CURRENCY_CODES = frozenset("""
+AED AFN ALL AMD ANG AOA ARS AUD AWG AZN BAM BBD BDT BGN BHD BIF BMD BND BOB BRL BSD BTN BWP BYN BZD
+CAD CDF CHF CLP CNY COP CRC CUP CVE CZK DJF DKK DOP DZD EGP ERN ETB EUR FJD FKP FOK GBP GEL GGP GHS
+GIP GMD GNF GTQ GYD HKD HNL HRK HTG HUF IDR ILS IMP INR IQD IRR ISK JEP JMD JOD JPY KES KGS KHR KID
+KMF KRW KWD KYD KZT LAK LBP LKR LRD LSL LYD MAD MDL MGA MKD MMK MNT MOP MRU MUR MVR MWK MXN MYR MZN
+NAD NGN NIO NOK NPR NZD OMR PAB PEN PGK PHP PKR PLN PYG QAR RON RSD RUB RWF SAR SBD SCR SDG SEK SGD
+SHP SLE SLL SOS SRD SSP STN SYP SZL THB TJS TMT TND TOP TRY TTD TVD TWD TZS UAH UGX USD UYU UZS VES
+VND VUV WST XAF XCD XDR XOF XPF YER ZAR ZMW ZWL
+""".split())
+# Codes that are also everyday English words only count when typed in capitals
+_AMBIGUOUS_CODE_WORDS = frozenset({"ALL", "AMD", "BAM", "BOB", "CUP", "DOP", "GEL", "KID", "MAD", "MOP", "PEN", "SOS", "TOP", "TRY"})
+
+CURRENCY_NAMES = {
+    "dollar": "USD", "dollars": "USD", "us dollar": "USD", "us dollars": "USD",
+    "american dollar": "USD", "american dollars": "USD", "buck": "USD", "bucks": "USD",
+    "canadian dollar": "CAD", "canadian dollars": "CAD",
+    "australian dollar": "AUD", "australian dollars": "AUD",
+    "new zealand dollar": "NZD", "new zealand dollars": "NZD",
+    "hong kong dollar": "HKD", "hong kong dollars": "HKD",
+    "singapore dollar": "SGD", "singapore dollars": "SGD",
+    "euro": "EUR", "euros": "EUR",
+    "pound": "GBP", "pounds": "GBP", "sterling": "GBP", "pound sterling": "GBP",
+    "british pound": "GBP", "british pounds": "GBP",
+    "yen": "JPY", "japanese yen": "JPY",
+    "yuan": "CNY", "renminbi": "CNY", "chinese yuan": "CNY",
+    "naira": "NGN", "nigerian naira": "NGN",
+    "rupee": "INR", "rupees": "INR", "indian rupee": "INR", "indian rupees": "INR",
+    "swiss franc": "CHF", "swiss francs": "CHF",
+    "rand": "ZAR", "south african rand": "ZAR",
+    "cedi": "GHS", "cedis": "GHS", "ghanaian cedi": "GHS", "ghanaian cedis": "GHS",
+    "kenyan shilling": "KES", "kenyan shillings": "KES",
+    "mexican peso": "MXN", "mexican pesos": "MXN",
+    "korean won": "KRW", "south korean won": "KRW",
+    "ruble": "RUB", "rubles": "RUB", "rouble": "RUB", "roubles": "RUB",
+    "lira": "TRY", "turkish lira": "TRY",
+    "brazilian real": "BRL", "brazilian reais": "BRL",
+    "dirham": "AED", "dirhams": "AED", "riyal": "SAR", "riyals": "SAR",
+}
+CURRENCY_SYMBOLS = {
+    "$": "USD", "us$": "USD", "c$": "CAD", "a$": "AUD", "nz$": "NZD", "hk$": "HKD", "s$": "SGD", "r$": "BRL",
+    "€": "EUR", "£": "GBP", "¥": "JPY", "₦": "NGN", "₹": "INR",
+    "₩": "KRW", "₽": "RUB", "₺": "TRY", "₵": "GHS", "₱": "PHP",
+}
+AMOUNT_MULTIPLIERS = {
+    "k": 1e3, "thousand": 1e3,
+    "m": 1e6, "mn": 1e6, "million": 1e6,
+    "b": 1e9, "bn": 1e9, "billion": 1e9,
+}
+
+def _alternation(options) -> str:
+    # Longest first so "canadian dollars" wins over "dollars" and "us$" over "$"
+    return "|".join(re.escape(option) for option in sorted(options, key=len, reverse=True))
+
+_AMOUNT_PATTERN = re.compile(
+    r"(?<![\w.,])(\d{1,3}(?:,\d{3})+|\d+)(\.\d+)?(?:\s*(" + _alternation(AMOUNT_MULTIPLIERS) + r"))?(?!\w)",
+    re.IGNORECASE,
+)
+_NAME_PATTERN = re.compile(r"\b(" + _alternation(CURRENCY_NAMES) + r")\b", re.IGNORECASE)
+_SYMBOL_PATTERN = re.compile("(" + _alternation(CURRENCY_SYMBOLS) + ")", re.IGNORECASE)
+_CODE_PATTERN = re.compile(r"\b([A-Za-z]{3})\b")
+_SEPARATOR_PATTERN = re.compile(r"\b(?:to|in|into|as)\b|->|→|=", re.IGNORECASE)
+# What may sit between listed target currencies: "EUR, GBP and JPY", "EUR/GBP", "EUR & GBP"
+_TARGET_LIST_GAP_PATTERN = re.compile(r"(?:\s|,|&|/|\band\b|\bor\b)*", re.IGNORECASE)
+_REVERSED_QUESTION_PATTERN = re.compile(r"\bhow\s+(?:many|much)\s+$", re.IGNORECASE)
+# Queries about a past day need the LLM to resolve the date into `as_of`
+_DATE_REFERENCE_PATTERN = re.compile(
+    r"\b(?:yesterday|ago|last|previous|historical|as\s+of|was|were|"
+    r"(?:mon|tues|wednes|thurs|fri|satur|sun)day|january|february|march|april|june|july|august|"
+    r"september|october|november|december)\b|\d{4}-\d{1,2}-\d{1,2}|\d{1,2}/\d{1,2}/\d{2,4}",
+    re.IGNORECASE,
+)
+
+def _find_currency_mentions(query: str, amount_span: Tuple[int, int]) -> List[Tuple[int, int, str]]:
+    """Returns (start, end, ISO code) for every currency mention, in query order."""
+    mentions: List[Tuple[int, int, str]] = []
+
+    def is_free(start: int, end: int) -> bool:
+        return all(end <= m_start or start >= m_end for m_start, m_end, _ in mentions)
+
+    for match in _NAME_PATTERN.finditer(query):
+        mentions.append((match.start(), match.end(), CURRENCY_NAMES[match.group(1).lower()]))
+    for match in _CODE_PATTERN.finditer(query):
+        token, code = match.group(1), match.group(1).upper()
+        if code not in ISO_CURRENCY_CODES or not is_free(*match.span()):
+            continue
+        if code in _AMBIGUOUS_CODE_WORDS and token != code:
+            continue
+        mentions.append((match.start(), match.end(), code))
+
+    amount_start, amount_end = amount_span
+    # "$100 CAD": an explicit code or name right after the amount overrides the symbol before it
+    explicit_after_amount = any(
+        start >= amount_end and not query[amount_end:start].strip() for start, _, _ in mentions
+    )
+    for match in _SYMBOL_PATTERN.finditer(query):
+        if not is_free(*match.span()):
+            continue
+        if explicit_after_amount and match.end() <= amount_start and not query[match.end():amount_start].strip():
+            continue
+        mentions.append((match.start(), match.end(), CURRENCY_SYMBOLS[match.group(1).lower()]))
+
+    mentions.sort()
+    return mentions
+
+def _parse_amount(match: "re.Match[str]") -> float:
+    amount = float(match.group(1).replace(",", "") + (match.group(2) or ""))
+    if match.group(3):
+        amount *= AMOUNT_MULTIPLIERS[match.group(3).lower()]
+    return amount
+
+def parse_query_fast(query: str) -> Optional[Dict[str, Any]]:
+    """
+    Resolves simple queries such as "100 USD to EUR", "€1.5k in naira" or
+    "how many yen is 20 pounds" locally, without calling the LLM.
+    Several targets may be listed after the separator ("100 USD in EUR, GBP and JPY").
+    Returns None unless exactly one amount and at least two distinct currencies are found in a
+    recognised pattern, and for anything that refers to a past date.
+    """
+    if _DATE_REFERENCE_PATTERN.search(query):
+        return None
+    amount_matches = list(_AMOUNT_PATTERN.finditer(query))
+    if len(amount_matches) != 1:
+        return None
+    amount_match = amount_matches[0]
+    amount = _parse_amount(amount_match)
+
+    mentions = _find_currency_mentions(query, amount_match.span())
+    if len(mentions) < 2 or mentions[0][2] == mentions[1][2]:
+        return None
+    (first_start, first_end, first_code), (second_start, _, second_code) = mentions[:2]
+    amount_start = amount_match.start()
+
+    if len(mentions) == 2 and first_end <= amount_start and _REVERSED_QUESTION_PATTERN.search(query[:first_start]):
+        # "how many euros is 100 dollars" asks for the first-mentioned currency
+        from_currency, to_currency = second_code, first_code
+    elif amount_start < second_start and _SEPARATOR_PATTERN.search(query, first_end, second_start):
+        targets = mentions[1:]
+        if not all(_TARGET_LIST_GAP_PATTERN.fullmatch(query, previous[1], current[0]) for previous, current in zip(targets, targets[1:])):
+            return None
+        from_currency = first_code
+        codes = [code for code in dict.fromkeys(code for _, _, code in targets) if code != first_code]
+        to_currency = codes[0] if len(codes) == 1 else codes
+    else:
+        return None
+
+    return CurrencyConverterInput(amount=amount, from_currency=from_currency, to_currency=to_currency).model_dump(mode="json")
+
+def detect_currency_codes(query: str) -> set:
+    """Every ISO code the query plausibly mentions by code, name or symbol, with no ordering or pairing."""
+    codes = {CURRENCY_NAMES[match.group(1).lower()] for match in _NAME_PATTERN.finditer(query)}
+    for match in _CODE_PATTERN.finditer(query):
+        token, code = match.group(1), match.group(1).upper()
+        if code in ISO_CURRENCY_CODES and (code not in _AMBIGUOUS_CODE_WORDS or token == code):
+            codes.add(code)
+    codes.update(CURRENCY_SYMBOLS[match.group(1).lower()] for match in _SYMBOL_PATTERN.finditer(query))
+    return codes
+
+################ Parsed Query Cache ######################
+PARSE_CACHE_MAX_ENTRIES = int(os.getenv("PARSE_CACHE_MAX_ENTRIES", "2048"))
+# Set PARSE_CACHE_DB_PATH to a SQLite file to keep parses across restarts
+PARSE_CACHE_DB_PATH = os.getenv("PARSE_CACHE_DB_PATH")
+PARSE_CACHE_DB_MAX_ENTRIES = int(os.getenv("PARSE_CACHE_DB_MAX_ENTRIES", "100000"))
+_AMOUNT_PLACEHOLDER = "<amount>"
+
+def normalize_query(query: str) -> str:
+    """Lowercases, collapses whitespace and drops trailing punctuation so trivial variants share a key."""
+    return " ".join(query.lower().split()).rstrip(" ?!.")
+
+class ParseCache:
+    """
+    LRU cache of validated parses keyed by normalized query text. A second key with the
+    single amount replaced by a placeholder lets "50 USD to EUR" reuse the parse of
+    "70 USD to EUR". With `db_path` set, entries are also written through to SQLite.
+    """
+
+    def __init__(self, max_entries: int = PARSE_CACHE_MAX_ENTRIES, db_path: Optional[str] = PARSE_CACHE_DB_PATH,
+                 db_max_entries: int = PARSE_CACHE_DB_MAX_ENTRIES):
+        self.max_entries = max_entries
+        self.db_max_entries = db_max_entries
+        self._entries: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._db: Optional[sqlite3.Connection] = None
+        self._db_writes = 0
+        self.exact_hits = 0
+        self.template_hits = 0
+        self.misses = 0
+        if db_path:
+            self._db = sqlite3.connect(db_path, check_same_thread=False)
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS parse_cache (key TEXT PRIMARY KEY, value TEXT NOT NULL, last_used REAL NOT NULL)"
+            )
+            self._db.commit()
+
+    @staticmethod
+    def _template_key(normalized: str) -> Optional[Tuple[str, float]]:
+        amount_matches = list(_AMOUNT_PATTERN.finditer(normalized))
+        if len(amount_matches) != 1:
+            return None
+        match = amount_matches[0]
+        return "t:" + normalized[:match.start()] + _AMOUNT_PLACEHOLDER + normalized[match.end():], _parse_amount(match)
+
+    def _lookup(self, key: str) -> Optional[Dict[str, Any]]:
+        value = self._entries.get(key)
+        if value is not None:
+            self._entries.move_to_end(key)
+            return value
+        if self._db is None:
+            return None
+        row = self._db.execute("SELECT value FROM parse_cache WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            return None
+        self._db.execute("UPDATE parse_cache SET last_used = ? WHERE key = ?", (time.time(), key))
+        self._db.commit()
+        value = json.loads(row[0])
+        self._remember(key, value)
+        return value
+
+    def _remember(self, key: str, value: Dict[str, Any]) -> None:
+        self._entries[key] = value
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def get(self, query: str) -> Optional[Dict[str, Any]]:
+        normalized = normalize_query(query)
+        template = self._template_key(normalized)
+        with self._lock:
+            value = self._lookup("q:" + normalized)
+            if value is not None:
+                self.exact_hits += 1
+            elif template is not None:
+                value = self._lookup(template[0])
+                if value is not None:
+                    value = {**value, "amount": template[1]}
+                    self.template_hits += 1
+            if value is None:
+                self.misses += 1
+                return None
+        try:
+            return CurrencyConverterInput(**value).model_dump(mode="json")
+        except ValidationError:
+            return None
+
+    def put(self, query: str, parsed_inputs: Dict[str, Any]) -> None:
+        normalized = normalize_query(query)
+        items = [("q:" + normalized, parsed_inputs)]
+        template = self._template_key(normalized)
+        # Only share the entry across amounts when the number in the text really was the (single) parsed amount
+        amount = parsed_inputs["amount"]
+        if template is not None and not isinstance(amount, list) and abs(template[1] - float(amount)) < 1e-9:
+            items.append((template[0], parsed_inputs))
+        with self._lock:
+            for key, value in items:
+                self._remember(key, value)
+            if self._db is not None:
+                now = time.time()
+                self._db.executemany(
+                    "INSERT OR REPLACE INTO parse_cache (key, value, last_used) VALUES (?, ?, ?)",
+                    [(key, json.dumps(value), now) for key, value in items],
+                )
+                self._db_writes += len(items)
+                if self._db_writes >= 256:
+                    self._db_writes = 0
+                    self._db.execute(
+                        "DELETE FROM parse_cache WHERE key NOT IN "
+                        "(SELECT key FROM parse_cache ORDER BY last_used DESC LIMIT ?)",
+                        (self.db_max_entries,),
+                    )
+                self._db.commit()
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            if self._db is not None:
+                self._db.execute("DELETE FROM parse_cache")
+                self._db.commit()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.exact_hits + self.template_hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "exact_hits": self.exact_hits,
+                "template_hits": self.template_hits,
+                "misses": self.misses,
+                "hit_rate": ((self.exact_hits + self.template_hits) / lookups) if lookups else 0.0,
+                "persistent": self._db is not None,
+            }
+
+PARSE_CACHE = ParseCache()
+
+################ Speculative Rate Prefetch ######################
+class SpeculativePrefetcher:
+    """
+    Warms the anchor rate table while the LLM parse is in flight, so the rate fetch
+    overlaps the parse instead of following it. Speculation starts only when the raw
+    query mentions a currency and the table is not already fresh.
+    """
+
+    def __init__(self, engine: CrossRateEngine = CROSS_RATES, max_workers: int = 2):
+        self.engine = engine
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="rate-prefetch")
+        self._lock = threading.Lock()
+        self.speculations = 0
+        self.fetches_started = 0
+        self.hits = 0
+        self.mispredictions = 0
+        self.wasted_fetches = 0
+
+    def _begin(self, query: str) -> Tuple[Optional[set], bool]:
+        """Returns the detected codes (None to skip speculation) and whether a fetch is needed."""
+        codes = detect_currency_codes(query)
+        if not codes:
+            return None, False
+        needs_fetch = not self.engine.cache.is_fresh(self.engine.anchor)
+        with self._lock:
+            self.speculations += 1
+            if needs_fetch:
+                self.fetches_started += 1
+        return codes, needs_fetch
+
+    def start(self, query: str) -> Optional[Dict[str, Any]]:
+        """Returns a speculation handle to pass to settle(), or None if nothing was speculated."""
+        codes, needs_fetch = self._begin(query)
+        if codes is None:
+            return None
+        # Run in a copy of the caller's context, so the fetch keeps the request's upstream priority
+        fetch = self._executor.submit(contextvars.copy_context().run, self.engine.snapshot) if needs_fetch else None
+        return {"codes": codes, "fetch": fetch}
+
+    def start_async(self, query: str) -> Optional[Dict[str, Any]]:
+        codes, needs_fetch = self._begin(query)
+        if codes is None:
+            return None
+        fetch = None
+        if needs_fetch:
+            fetch = asyncio.ensure_future(self.engine.snapshot_async())
+            # Failures resurface on the real lookup; consume them here so asyncio does not log them
+            fetch.add_done_callback(lambda task: task.cancelled() or task.exception())
+        return {"codes": codes, "fetch": fetch}
+
+    def settle(self, speculation: Optional[Dict[str, Any]], parsed_inputs: Optional[Dict[str, Any]]) -> None:
+        """Scores a speculation against the real parse once it is known."""
+        if speculation is None:
+            return
+        fetch = speculation["fetch"]
+        fetch_failed = fetch is not None and fetch.done() and not fetch.cancelled() and fetch.exception() is not None
+        with self._lock:
+            if parsed_inputs:
+                predicted = {parsed_inputs["from_currency"].upper(), *query_targets(parsed_inputs)}
+                if predicted <= speculation["codes"]:
+                    self.hits += 1
+                else:
+                    self.mispredictions += 1
+            if fetch is not None and (not parsed_inputs or fetch_failed):
+                self.wasted_fetches += 1
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            scored = self.hits + self.mispredictions
+            return {
+                "speculations": self.speculations,
+                "fetches_started": self.fetches_started,
+                "hits": self.hits,
+                "mispredictions": self.mispredictions,
+                "wasted_fetches": self.wasted_fetches,
+                "hit_rate": (self.hits / scored) if scored else 0.0,
+            }
+
+SPECULATIVE_PREFETCH = SpeculativePrefetcher()
+
+################ LLM Model Routing ######################
+# Each LLM task has candidate models, smallest first. The router picks the smallest one that
+# suits the request and its latency budget, and when a call runs past that model's p95 it
+# sends a hedged duplicate to the other candidate and keeps whichever answers first.
+LLM_ROUTING_ENABLED = os.getenv("LLM_ROUTING_ENABLED", "true").lower() == "true"
+LLM_HEDGING_ENABLED = os.getenv("LLM_HEDGING_ENABLED", "true").lower() == "true"
+# Default per-request latency budget; 0 means none. Callers can set one with latency_budget()
+LLM_LATENCY_BUDGET_SECONDS = float(os.getenv("LLM_LATENCY_BUDGET_SECONDS", "0"))
+GROQ_PARSER_FALLBACK_MODEL = os.getenv("GROQ_PARSER_FALLBACK_MODEL", "groq/llama3-70b-8192")
+# Used by the agent when a short confirmation is enough, i.e. the query asks for no context or trends
+GROQ_AGENT_SMALL_MODEL = os.getenv("GROQ_AGENT_SMALL_MODEL", "groq/llama3-8b-8192")
+# Calls observed per task and model before its p95 is trusted for hedging and budgeting
+LLM_HEDGE_MIN_SAMPLES = int(os.getenv("LLM_HEDGE_MIN_SAMPLES", "20"))
+LLM_LATENCY_WINDOW = 200
+LLM_HEDGE_WORKERS = int(os.getenv("LLM_HEDGE_WORKERS", "32"))
+
+LLM_CALL_SECONDS = Histogram(
+    "currency_converter_llm_call_seconds", "Latency of completed LLM calls.", ("task", "model"), LATENCY_BUCKETS,
+)
+
+_request_deadline: "contextvars.ContextVar[Optional[float]]" = contextvars.ContextVar(
+    "currency_converter_request_deadline", default=None,
+)
+
+@contextmanager
+def latency_budget(seconds: Optional[float]) -> Iterator[None]:
+    """Gives the block's LLM calls `seconds` (from now) to finish; None or 0 leaves the budget unset."""
+    token = _request_deadline.set(time.perf_counter() + seconds if seconds else None)
+    try:
+        yield
+    finally:
+        try:
+            _request_deadline.reset(token)
+        except ValueError:  # a streaming generator closed from another context
+            pass
+
+def remaining_budget() -> Optional[float]:
+    """Seconds left in the current request's latency budget, or None without one."""
+    deadline = _request_deadline.get()
+    if deadline is None and LLM_LATENCY_BUDGET_SECONDS > 0:
+        trace = _current_trace.get()
+        if trace is not None:
+            deadline = trace["_started"] + LLM_LATENCY_BUDGET_SECONDS
+    return None if deadline is None else deadline - time.perf_counter()
+
+def model_name(model: Any) -> str:
+    """The model string of a model name or CrewAI LLM object."""
+    return str(getattr(model, "model", model))
+
+class ModelRouter:
+    """
+    Picks a model per LLM call and hedges slow ones. `choose()` returns the smallest candidate
+    unless the request needs the larger models' depth, in which case it takes the largest one
+    whose observed p95 fits the remaining latency budget. `call()` runs the choice and, once
+    that model's p95 is known, hedges to the neighbouring candidate when the call outlives it.
+    """
+
+    def __init__(self, enabled: bool = LLM_ROUTING_ENABLED, hedging: bool = LLM_HEDGING_ENABLED,
+                 min_samples: int = LLM_HEDGE_MIN_SAMPLES, window: int = LLM_LATENCY_WINDOW,
+                 max_workers: int = LLM_HEDGE_WORKERS):
+        self.enabled = enabled
+        self.hedging = hedging
+        self.min_samples = min_samples
+        self.window = window
+        self._lock = threading.Lock()
+        self._latencies: Dict[Tuple[str, str], "deque[float]"] = {}
+        self._executor = ThreadPoolExecutor(max_workers=max(2, max_workers), thread_name_prefix="llm-hedge")
+        self.decisions: Dict[Tuple[str, str, str], int] = {}
+        self.hedges: Dict[Tuple[str, str], int] = {}
+
+    def record_latency(self, task: str, model: Any, seconds: float) -> None:
+        name = model_name(model)
+        LLM_CALL_SECONDS.observe(seconds, task, name)
+        with self._lock:
+            samples = self._latencies.get((task, name))
+            if samples is None:
+                samples = self._latencies[(task, name)] = deque(maxlen=self.window)
+            samples.append(seconds)
+
+    def p95(self, task: str, model: Any) -> Optional[float]:
+        """p95 latency of the recent calls to `model` for `task`, or None until min_samples were seen."""
+        with self._lock:
+            samples = sorted(self._latencies.get((task, model_name(model)), ()))
+        if len(samples) < max(1, self.min_samples):
+            return None
+        return _percentile(samples, 0.95)
+
+    def choose(self, task: str, candidates: Sequence[Any], needs_depth: bool = False) -> Tuple[Any, str]:
+        """
+        (model, reason). Reason is "small" when the smallest model suffices, "depth" when the largest
+        fits the budget, and "budget" when a smaller one was taken because the largest would not.
+        """
+        if not needs_depth:
+            choice, reason = candidates[0], "small"
+        else:
+            choice = candidates[0]
+            budget = remaining_budget()
+            for model in reversed(candidates):
+                p95 = self.p95(task, model)
+                if budget is None or p95 is None or p95 <= budget:
+                    choice = model
+                    break
+            reason = "depth" if choice is candidates[-1] else "budget"
+        with self._lock:
+            key = (task, model_name(choice), reason)
+            self.decisions[key] = self.decisions.get(key, 0) + 1
+        return choice, reason
+
+    def _fallback(self, candidates: Sequence[Any], choice: Any) -> Optional[Any]:
+        """The candidate to hedge to: the next larger one, or the next smaller for the largest."""
+        names = [model_name(model) for model in candidates]
+        index = names.index(model_name(choice))
+        for neighbour in (index + 1, index - 1):
+            if 0 <= neighbour < len(candidates) and names[neighbour] != names[index]:
+                return candidates[neighbour]
+        return None
+
+    def _count_hedge(self, task: str, outcome: str) -> None:
+        with self._lock:
+            self.hedges[(task, outcome)] = self.hedges.get((task, outcome), 0) + 1
+
+    def _timed(self, task: str, model: Any, fn: Callable[[Any], Any]) -> Any:
+        started = time.perf_counter()
+        result = fn(model)
+        self.record_latency(task, model, time.perf_counter() - started)
+        return result
+
+    def _hedge_after(self, task: str, candidates: Sequence[Any], choice: Any) -> Tuple[Optional[Any], Optional[float]]:
+        fallback = self._fallback(candidates, choice) if self.hedging else None
+        return fallback, (self.p95(task, choice) if fallback is not None else None)
+
+    def call(self, task: str, candidates: Sequence[Any], fn: Callable[[Any], Any], needs_depth: bool = False) -> Any:
+        """
+        Runs fn(model) on the routed model, hedged to the fallback once the call exceeds its p95.
+        With routing disabled, fn runs once on the first candidate.
+        """
+        if not self.enabled:
+            return fn(candidates[0])
+        choice, _ = self.choose(task, candidates, needs_depth)
+        fallback, hedge_after = self._hedge_after(task, candidates, choice)
+        if hedge_after is None:
+            return self._timed(task, choice, fn)
+
+        # Each attempt runs in its own copy of the context, so spans and upstream priority carry over
+        primary = self._executor.submit(contextvars.copy_context().run, self._timed, task, choice, fn)
+        if wait_futures([primary], timeout=hedge_after).done:
+            return primary.result()
+        self._count_hedge(task, "launched")
+        hedge = self._executor.submit(contextvars.copy_context().run, self._timed, task, fallback, fn)
+        pending = {primary: "primary", hedge: "fallback"}
+        error: Optional[BaseException] = None
+        for future in as_completed(pending):
+            if future.exception() is None:
+                self._count_hedge(task, f"{pending[future]}_won")
+                return future.result()
+            error = error or future.exception()
+        raise error
+
+    async def call_async(self, task: str, candidates: Sequence[Any], fn: Callable[[Any], Awaitable[Any]],
+                         needs_depth: bool = False) -> Any:
+        """call() for coroutine functions; the losing attempt of a hedge is cancelled."""
+        if not self.enabled:
+            return await fn(candidates[0])
+
+        async def timed(model: Any) -> Any:
+            started = time.perf_counter()
+            result = await fn(model)
+            self.record_latency(task, model, time.perf_counter() - started)
+            return result
+
+        choice, _ = self.choose(task, candidates, needs_depth)
+        fallback, hedge_after = self._hedge_after(task, candidates, choice)
+        if hedge_after is None:
+            return await timed(choice)
+
+        primary = asyncio.ensure_future(timed(choice))
+        done, _ = await asyncio.wait({primary}, timeout=hedge_after)
+        if done:
+            return primary.result()
+        self._count_hedge(task, "launched")
+        hedge = asyncio.ensure_future(timed(fallback))
+        labels = {primary: "primary", hedge: "fallback"}
+        pending = set(labels)
+        error: Optional[BaseException] = None
+        try:
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task_future in done:
+                    if task_future.exception() is None:
+                        self._count_hedge(task, f"{labels[task_future]}_won")
+                        return task_future.result()
+                    error = error or task_future.exception()
+        finally:
+            for task_future in pending:
+                task_future.cancel()
+        raise error
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            decisions = dict(self.decisions)
+            hedges = dict(self.hedges)
+            keys = list(self._latencies)
+        hedge_stats = {}
+        for task in sorted({task for task, _ in hedges}):
+            launched = hedges.get((task, "launched"), 0)
+            won = hedges.get((task, "fallback_won"), 0)
+            hedge_stats[task] = {
+                "launched": launched, "primary_won": hedges.get((task, "primary_won"), 0), "fallback_won": won,
+                "fallback_win_rate": (won / launched) if launched else 0.0,
+            }
+        return {
+            "decisions": [{"task": task, "model": model, "reason": reason, "count": count}
+                          for (task, model, reason), count in sorted(decisions.items())],
+            "hedges": hedge_stats,
+            "p95_seconds": {f"{task}:{model}": self.p95(task, model) for task, model in keys},
+        }
+
+MODEL_ROUTER = ModelRouter()
+
+################ LLM Query Parser Function ######################
+GROQ_PARSER_MODEL = "groq/llama3-8b-8192"
+
+def _parser_messages(query: str) -> List[Dict[str, str]]:
+    today = datetime.now(timezone.utc).date()
+    prompt = f"""
+You are an expert at parsing financial queries for currency conversion.
+Your task is to extract the amount, the source currency, the target currency and, for questions about the past, the date from the user's query.
+Provide the output in a valid JSON object with the following keys: "amount", "from_currency", "to_currency", "as_of".
+- "amount": Should be a numerical value (float or int), or a list of numbers when the query gives several amounts.
+- "from_currency": Should be the 3-letter ISO currency code (e.g., USD, EUR, JPY).
+- "to_currency": Should be the 3-letter ISO currency code, or a list of codes when the query asks for several target currencies (e.g., "100 USD in EUR, GBP and JPY" -> ["EUR", "GBP", "JPY"]).
+- "as_of": The date the query asks about as YYYY-MM-DD, or null for current rates. Today is {today.isoformat()} ({today:%A}); resolve relative dates such as 'yesterday' or 'last Friday' against it.
+If any information is crucial and cannot be reasonably inferred, return null for that specific field or an error structure.
+Common currency names like 'dollars', 'euros', 'yen', 'pounds' should be mapped to their ISO codes.
+'Dollars' usually means USD unless specified otherwise (e.g., 'Canadian dollars' -> CAD).
+'Euros' -> EUR. 'Pounds' -> GBP.
+User query: "{query}"
+JSON Output:
+"""
+    return [{"role": "user", "content": prompt}]
+
+def _validate_parser_content(content: Optional[str]) -> Optional[Dict[str, Any]]:
+    """Turns the parser LLM's raw JSON reply into validated inputs, or None."""
+    if not content:
+        logger.warning("LLM returned empty content for query parsing.")
+        return None
+    logger.debug("LLM raw JSON response for parsing: %s", content)
+    parsed_json = None
+    try:
+        parsed_json = json.loads(content)
+        validated_data = CurrencyConverterInput(**parsed_json)
+        return validated_data.model_dump(mode="json")
+    except json.JSONDecodeError as e:
+        logger.warning("Error decoding JSON from LLM response: %s. LLM raw output was: %s", e, content)
+        return None
+    except (ValidationError, TypeError) as e:
+        logger.warning("Validation error for LLM output: %s. Parsed JSON was: %s", e, parsed_json)
+        return None
+
+def parse_query_with_llm(query: str) -> Optional[Dict[str, Any]]:
+    if not GROQ_API_KEY:
+        logger.warning("GROQ_API_KEY is not set, so the LLM parser cannot read query %r", query)
+        return None
+    def parse_with(model: Any) -> Any:
+        logger.debug("Attempting to parse query %r with model %s", query, model)
+        response = scheduled_completion(
+            model=model,
+            messages=_parser_messages(query),
+            api_key=GROQ_API_KEY,
+            response_format={"type": "json_object"},
+            timeout=30
+        )
+        record_tokens(model_name(model), getattr(response, "usage", None))
+        return response
+
+    try:
+        with span("llm_parse"):
+            response = MODEL_ROUTER.call("parse", (GROQ_PARSER_MODEL, GROQ_PARSER_FALLBACK_MODEL), parse_with)
+        return _validate_parser_content(response.choices[0].message.content)
+    except Exception as e:
+        if is_llm_unavailable(e):
+            logger.warning("LLM service (Groq) for query parsing is currently unavailable: %s", e)
+        else:
+            logger.exception("An unexpected error occurred during LLM query parsing: %s", e)
+        return None
+
+async def parse_query_with_llm_async(query: str) -> Optional[Dict[str, Any]]:
+    """Async counterpart of parse_query_with_llm() built on litellm.acompletion."""
+    if not GROQ_API_KEY:
+        logger.warning("GROQ_API_KEY is not set, so the LLM parser cannot read query %r", query)
+        return None
+    async def parse_with(model: Any) -> Any:
+        logger.debug("Attempting to parse query %r with model %s", query, model)
+        response = await scheduled_acompletion(
+            model=model,
+            messages=_parser_messages(query),
+            api_key=GROQ_API_KEY,
+            response_format={"type": "json_object"},
+            timeout=30
+        )
+        record_tokens(model_name(model), getattr(response, "usage", None))
+        return response
+
+    try:
+        with span("llm_parse"):
+            response = await MODEL_ROUTER.call_async("parse", (GROQ_PARSER_MODEL, GROQ_PARSER_FALLBACK_MODEL), parse_with)
+        return _validate_parser_content(response.choices[0].message.content)
+    except Exception as e:
+        if is_llm_unavailable(e):
+            logger.warning("LLM service (Groq) for query parsing is currently unavailable: %s", e)
+        else:
+            logger.exception("An unexpected error occurred during LLM query parsing: %s", e)
+        return None
+
+PARSER_STATS = {"fast_path_hits": 0, "cache_hits": 0, "llm_fallbacks": 0}
+_parser_stats_lock = threading.Lock()
+
+def _count_parse(outcome: str) -> None:
+    with _parser_stats_lock:
+        PARSER_STATS[outcome] += 1
+
+def _parse_query_locally(query: str) -> Tuple[Optional[Dict[str, Any]], str]:
+    """Fast path, then parse cache. Returns the inputs (None means the LLM is needed) and where they came from."""
+    parsed_inputs = parse_query_fast(query)
+    if parsed_inputs:
+        _count_parse("fast_path_hits")
+        logger.debug("Fast-path parser resolved query: %s", parsed_inputs)
+        return parsed_inputs, "fast_path"
+
+    parsed_inputs = PARSE_CACHE.get(query)
+    if parsed_inputs:
+        _count_parse("cache_hits")
+        logger.debug("Parse cache resolved query: %s", parsed_inputs)
+        return parsed_inputs, "cache"
+
+    _count_parse("llm_fallbacks")
+    return None, "llm"
+
+def parse_query(query: str) -> Optional[Dict[str, Any]]:
+    """
+    Parses a query with the local fast path, then the parse cache, falling back to the
+    LLM only when neither can resolve it. The anchor rate table is warmed speculatively
+    while the LLM call is in flight. Successful LLM parses are cached, except dated ones
+    ("yesterday" resolves to a different day tomorrow).
+    """
+    with span("parse") as details:
+        parsed_inputs, details["outcome"] = _parse_query_locally(query)
+        if parsed_inputs:
+            return parsed_inputs
+
+        speculation = SPECULATIVE_PREFETCH.start(query)
+        # Identical queries arriving together share one LLM call; each caller gets its own copy
+        parsed_inputs = LLM_PARSE_FLIGHT.do(normalize_query(query), lambda: parse_query_with_llm(query))
+        parsed_inputs = dict(parsed_inputs) if parsed_inputs else None
+        SPECULATIVE_PREFETCH.settle(speculation, parsed_inputs)
+        if not parsed_inputs:
+            details["outcome"] = "failed"
+        elif not parsed_inputs.get("as_of"):
+            PARSE_CACHE.put(query, parsed_inputs)
+        return parsed_inputs
+
+async def parse_query_async(query: str) -> Optional[Dict[str, Any]]:
+    with span("parse") as details:
+        parsed_inputs, details["outcome"] = _parse_query_locally(query)
+        if parsed_inputs:
+            return parsed_inputs
+
+        speculation = SPECULATIVE_PREFETCH.start_async(query)
+        parsed_inputs = await LLM_PARSE_FLIGHT.do_async(normalize_query(query), lambda: parse_query_with_llm_async(query))
+        parsed_inputs = dict(parsed_inputs) if parsed_inputs else None
+        SPECULATIVE_PREFETCH.settle(speculation, parsed_inputs)
+        if not parsed_inputs:
+            details["outcome"] = "failed"
+        elif not parsed_inputs.get("as_of"):
+            PARSE_CACHE.put(query, parsed_inputs)
+        return parsed_inputs
+
+def get_parser_stats() -> Dict[str, Any]:
+    with _parser_stats_lock:
+        total = sum(PARSER_STATS.values())
+        return {
+            **PARSER_STATS,
+            "fast_path_hit_rate": (PARSER_STATS["fast_path_hits"] / total) if total else 0.0,
+            "cache_hit_rate": (PARSER_STATS["cache_hits"] / total) if total else 0.0,
+        }
+
+################ Response Modes ######################
+# "direct" answers from the rate tool alone, "insight" runs the agent, "auto" picks per query
+RESPONSE_MODES = ("direct", "insight", "auto")
+DEFAULT_RESPONSE_MODE = os.getenv("RESPONSE_MODE", "insight").lower()
+_INSIGHT_REQUEST_PATTERN = re.compile(
+    r"\b(?:why|trend(?:s|ing)?|context|insights?|explain|analy[sz]e|analysis|outlook|forecast|predict(?:ion)?|"
+    r"history|historical|news|recent(?:ly)?|chang(?:e|ed|es|ing)|volatil(?:e|ity)|stronger|weaker|should\s+i|impact)\b",
+    re.IGNORECASE,
+)
+
+def wants_context(natural_language_query: str) -> bool:
+    """True when the query asks for context or trends rather than just the converted amount."""
+    return bool(_INSIGHT_REQUEST_PATTERN.search(natural_language_query))
+
+def resolve_response_mode(natural_language_query: str, mode: Optional[str] = None) -> str:
+    """Returns "direct" or "insight"; "auto" selects the agent only when the query asks for context or trends."""
+    mode = (mode or DEFAULT_RESPONSE_MODE).lower()
+    if mode not in RESPONSE_MODES:
+        raise ValueError(f"Unknown response mode '{mode}'. Expected one of: {', '.join(RESPONSE_MODES)}")
+    if mode == "auto":
+        return "insight" if wants_context(natural_language_query) else "direct"
+    return mode
+
+def format_direct_response(parsed_inputs: Dict[str, Any], rate: float) -> str:
+    from_currency, to_currency = parsed_inputs["from_currency"].upper(), parsed_inputs["to_currency"].upper()
+    day = historical_date(parsed_inputs.get("as_of"))
+    result = format_conversion(parsed_inputs["amount"], from_currency, to_currency, parsed_inputs["amount"] * rate, day)
+    if day is not None:
+        return f"{result}\nExchange rate on {day.isoformat()}: 1 {from_currency} = {rate:.6g} {to_currency}."
+    return f"{result}\nExchange rate: 1 {from_currency} = {rate:.6g} {to_currency}.{CROSS_RATES.staleness_note()}"
+
+def get_direct_response(parsed_inputs: Dict[str, Any]) -> str:
+    """Templated answer computed from the rate tool alone, without the agent."""
+    if is_multi_query(parsed_inputs):
+        return convert_currency(parsed_inputs["amount"], parsed_inputs["from_currency"], parsed_inputs["to_currency"],
+                                parsed_inputs.get("as_of"))
+    try:
+        rate = CROSS_RATES.rate(parsed_inputs["from_currency"], parsed_inputs["to_currency"], parsed_inputs.get("as_of"))
+        return format_direct_response(parsed_inputs, rate)
+    except RateFetchError as e:
+        return str(e)
+
+################ Answer Cache ######################
+ANSWER_CACHE_MAX_ENTRIES = int(os.getenv("ANSWER_CACHE_MAX_ENTRIES", "1024"))
+_ANSWER_SENTENCE_BREAK = re.compile(r"((?<=[.!?])\s+|\n+)")
+_ANSWER_NUMBER = re.compile(r"(?<![\w.])(\d[\d,]*(?:\.\d+)?)(\s?%|\s?per\s?cent\b)?")
+
+def _is_amount_free_number(number: str, percent: Optional[str], rate: float) -> bool:
+    """
+    True for a number that cannot depend on the converted amount: a percentage, a year, the
+    "1" of a unit quote, or the pair's rate (either way round) at the precision it was printed with.
+    """
+    if percent:
+        return True
+    digits = number.replace(",", "")
+    value = float(digits)
+    if "," not in number and "." not in digits and 1900 <= value <= 2100:
+        return True
+    decimals = len(digits.split(".", 1)[1]) if "." in digits else 0
+    return value == 1 or any(round(quote, decimals) == value for quote in (rate, 1 / rate) if quote)
+
+def answer_commentary(text: str, rate: float) -> Optional[str]:
+    """
+    The sentences of an answer that hold no amount-dependent figure, so they stay true at any
+    amount. A sentence with any other number (the conversion itself, a fee, "about 40 coffees")
+    is dropped whole rather than rewritten. None when nothing is left.
+    """
+    parts = _ANSWER_SENTENCE_BREAK.split(text)
+    kept = []
+    for sentence, separator in itertools.zip_longest(parts[::2], parts[1::2], fillvalue=""):
+        if all(_is_amount_free_number(match.group(1), match.group(2), rate) for match in _ANSWER_NUMBER.finditer(sentence)):
+            kept.append(sentence + separator)
+    commentary = "".join(kept).strip()
+    return commentary or None
+
+class AnswerCache:
+    """
+    LRU cache of final answers keyed by (from, to, response mode, rate-snapshot version). An
+    entry keeps the full answer with the normalized question and amount it was given for, and
+    its amount-independent commentary (see answer_commentary). get() returns the full answer
+    only for that same question and amount; any other amount or wording gets the commentary,
+    to go after a conversion line the caller computes from the cached rate, so numbers in a
+    reused answer never contradict each other. A new anchor snapshot drops every latest-rate
+    entry; answers for past days stay, since their rates never change.
+    """
+
+    def __init__(self, max_entries: int = ANSWER_CACHE_MAX_ENTRIES):
+        self.max_entries = max_entries
+        # key -> (normalized question, amount, full answer, commentary)
+        self._entries: "OrderedDict[Tuple[Hashable, ...], Tuple[str, float, str, Optional[str]]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._latest_version: Hashable = None
+        self.exact_hits = 0
+        self.commentary_hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    def _observe_version(self, version: Hashable) -> None:
+        """Drops latest-rate entries from older snapshots once a newer version shows up."""
+        if isinstance(version, str) or version == self._latest_version:
+            return
+        if self._latest_version is not None and version < self._latest_version:
+            return
+        stale = [key for key in self._entries if not isinstance(key[-1], str) and key[-1] != version]
+        for key in stale:
+            del self._entries[key]
+        if self._latest_version is not None:
+            self.invalidations += 1
+        self._latest_version = version
+
+    def get(self, key: Tuple[Hashable, ...], amount: float, question: str) -> Optional[Tuple[str, bool]]:
+        """(full answer, True) for the same question and amount, (commentary, False) otherwise, or None."""
+        with self._lock:
+            self._observe_version(key[-1])
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                cached_question, cached_amount, text, commentary = entry
+                if cached_amount == amount and cached_question == normalize_query(question):
+                    self.exact_hits += 1
+                    return text, True
+                if commentary is not None:
+                    self.commentary_hits += 1
+                    return commentary, False
+            self.misses += 1
+            return None
+
+    def put(self, key: Tuple[Hashable, ...], amount: float, rate: float, question: str, text: str) -> None:
+        commentary = answer_commentary(text, rate)
+        with self._lock:
+            self._observe_version(key[-1])
+            if not isinstance(key[-1], str) and key[-1] != self._latest_version:
+                return  # computed from a snapshot that has since been replaced
+            self._entries[key] = (normalize_query(question), amount, text, commentary)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.exact_hits + self.commentary_hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "exact_hits": self.exact_hits,
+                "commentary_hits": self.commentary_hits,
+                "misses": self.misses,
+                "invalidations": self.invalidations,
+                "hit_rate": ((self.exact_hits + self.commentary_hits) / lookups) if lookups else 0.0,
+            }
+
+ANSWER_CACHE = AnswerCache() if ANSWER_CACHE_MAX_ENTRIES > 0 else None
+
+################ Agent and Crew Logic (Callable Function) ######################
+GROQ_AGENT_MODEL = "groq/llama3-70b-8192"
+CREW_POOL_SIZE = int(os.getenv("CREW_POOL_SIZE", "4"))
+
+# Task text stays templated; crew.kickoff(inputs=...) interpolates it per request
+CURRENCY_CONVERSION_TASK_TEMPLATE = (
+    "Convert {amount} {from_currency} to {to_currency} using the exchange rates as of {rates_date}. "
+    "For a past date, pass it to the tool as `as_of` (YYYY-MM-DD). "
+    "For several amounts or target currencies, pass them to the tool as lists in a single call. "
+    "Provide the equivalent amount in the target currency. "
+    "If possible, briefly explain any highly relevant financial context or recent significant changes "
+    "related to these currencies if it directly impacts the conversion, but keep it concise. "
+    "Focus primarily on delivering the conversion result accurately."
+)
+EXPECTED_OUTPUT_TEMPLATE = (
+    "A detailed response including the converted amount of {amount} {from_currency} to {to_currency}, "
+    "and brief, relevant financial insights if applicable."
+)
+
+def _join_words(items: Sequence[Any]) -> str:
+    items = [str(item) for item in items]
+    return items[0] if len(items) == 1 else ", ".join(items[:-1]) + " and " + items[-1]
+
+def task_inputs(parsed_inputs: Dict[str, Any]) -> Dict[str, Any]:
+    """Parsed inputs worded for the task templates (lists joined as "EUR, GBP and JPY") plus `rates_date`."""
+    return {
+        **parsed_inputs,
+        "amount": _join_words(query_amounts(parsed_inputs)) if is_multi_query(parsed_inputs) else parsed_inputs["amount"],
+        "to_currency": _join_words(query_targets(parsed_inputs)) if is_multi_query(parsed_inputs) else parsed_inputs["to_currency"],
+        "rates_date": parsed_inputs.get("as_of") or "today (latest rates)",
+    }
+
+ANALYST_ROLE = "Currency Analyst"
+ANALYST_GOAL = "Provide real-time currency conversion rates and financial insights based on the user's query."
+ANALYST_BACKSTORY = (
+    "You are a meticulous financial analyst specializing in currency conversion. "
+    "You use precise, real-time data to perform conversions and offer brief, relevant financial context if appropriate. "
+    "You stick to the task of conversion and providing the result clearly."
+)
+
+# Start of the current agent step and the request's trace, set by _kickoff for the length of one kickoff
+_agent_step_clock: "contextvars.ContextVar[Optional[Dict[str, Any]]]" = contextvars.ContextVar(
+    "currency_converter_agent_step_clock", default=None,
+)
+
+def record_agent_step(step_output: Any) -> None:
+    """
+    Crew step_callback that records each agent iteration as an "agent_step" span. It is a
+    module-level function rather than a per-crew object because CrewAI only accepts callbacks
+    it can serialize; the per-kickoff state lives in _agent_step_clock instead.
+    """
+    clock = _agent_step_clock.get()
+    if clock is None:
+        return
+    now = time.perf_counter()
+    outcome = "finish" if type(step_output).__name__ == "AgentFinish" else "action"
+    record_span("agent_step", now - clock["started"], outcome, clock["started"], trace=clock["trace"])
+    clock["started"] = now
+
+_agent_pacing_registered = False
+
+def _register_agent_pacing() -> None:
+    """Registers _pace_agent_llm_call as a global CrewAI hook once; executors pick it up when built."""
+    global _agent_pacing_registered
+    with _agent_lock:
+        if not _agent_pacing_registered:
+            from crewai.hooks import register_before_llm_call_hook
+            register_before_llm_call_hook(_pace_agent_llm_call)
+            _agent_pacing_registered = True
+
+def build_currency_crew(llm: Any = None) -> "Crew":
+    """Builds one ready-to-run analyst crew on `llm` (default GROQ_AGENT_MODEL) whose task is filled in by kickoff(inputs=...)."""
+    from crewai import Agent, Task, Crew, Process
+
+    _register_agent_pacing()
+
+    currency_analyst = Agent(
+        role=ANALYST_ROLE,
+        goal=ANALYST_GOAL,
+        backstory=ANALYST_BACKSTORY,
+        tools=[currency_converter_tool()],
+        verbose=AGENT_VERBOSE,
+        llm=llm or GROQ_AGENT_MODEL, # Using the model string directly as it was working for the user
+        allow_delegation=False,
+        max_iter=5
+    )
+    conversion_task = Task(
+        description=CURRENCY_CONVERSION_TASK_TEMPLATE,
+        expected_output=EXPECTED_OUTPUT_TEMPLATE,
+        agent=currency_analyst,
+    )
+    return Crew(
+        agents=[currency_analyst],
+        tasks=[conversion_task],
+        process=Process.sequential,
+        verbose=AGENT_VERBOSE,
+        step_callback=record_agent_step,
+    )
+
+class CrewPool:
+    """
+    Bounded, thread-safe pool of ready crews. Crews are built lazily up to `max_size`;
+    once all are busy, callers wait for one to be released. A crew keeps per-run state
+    on its agent and task, so each one serves a single request at a time.
+    """
+
+    def __init__(self, factory: Callable[[], "Crew"] = build_currency_crew, max_size: int = CREW_POOL_SIZE):
+        self.factory = factory
+        self.max_size = max(1, max_size)
+        self._idle: "queue.LifoQueue[Crew]" = queue.LifoQueue()
+        self._lock = threading.Lock()
+        self._created = 0
+
+    @contextmanager
+    def acquire(self, timeout: Optional[float] = None) -> Iterator["Crew"]:
+        crew = self._checkout(timeout)
+        try:
+            yield crew
+        finally:
+            self._idle.put(crew)
+
+    def _checkout(self, timeout: Optional[float]) -> "Crew":
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            pass
+        with self._lock:
+            can_create = self._created < self.max_size
+            if can_create:
+                self._created += 1
+        if can_create:
+            try:
+                return self.factory()
+            except Exception:
+                with self._lock:
+                    self._created -= 1
+                raise
+        return self._idle.get(timeout=timeout)
+
+    def stats(self) -> Dict[str, int]:
+        return {"created": self._created, "idle": self._idle.qsize(), "max_size": self.max_size}
+
+CREW_POOL = CrewPool()
+# Pools for the other models the router may pick; GROQ_AGENT_MODEL always uses CREW_POOL
+_model_crew_pools: Dict[str, CrewPool] = {}
+
+def crew_pool(model: Any) -> CrewPool:
+    """The crew pool for agents running on `model`."""
+    if model_name(model) == model_name(GROQ_AGENT_MODEL):
+        return CREW_POOL
+    with _agent_lock:
+        pool = _model_crew_pools.get(model_name(model))
+        if pool is None:
+            pool = _model_crew_pools[model_name(model)] = CrewPool(lambda: build_currency_crew(model))
+        return pool
+
+def agent_models() -> Tuple[Any, ...]:
+    """The agent's candidate models, smallest first; just GROQ_AGENT_MODEL when routing is off."""
+    return (GROQ_AGENT_SMALL_MODEL, GROQ_AGENT_MODEL) if MODEL_ROUTER.enabled else (GROQ_AGENT_MODEL,)
+
+def _usage_delta(before: Any, after: Any) -> Optional[Dict[str, int]]:
+    """Token counts `after` minus `before`; a pooled crew's UsageMetrics are cumulative over all its kickoffs."""
+    if after is None:
+        return None
+    return {kind: (getattr(after, kind, 0) or 0) - (getattr(before, kind, 0) or 0)
+            for kind in ("prompt_tokens", "completion_tokens")}
+
+def _kickoff(model: Any, inputs: Dict[str, Any]) -> Any:
+    with crew_pool(model).acquire() as crew:
+        usage_before = crew.calculate_usage_metrics()  # the crew is ours until release, so the delta is this kickoff's
+        clock = _agent_step_clock.set({"started": time.perf_counter(), "trace": _current_trace.get()})
+        try:
+            # Agent turns take their own tokens (see _pace_agent_llm_call); a 429 retries the kickoff after backoff
+            scheduler = scheduler_for_model(model)
+            if scheduler is None:
+                response = crew.kickoff(inputs=inputs)
+            else:
+                response = scheduler.call(lambda: crew.kickoff(inputs=inputs), acquire=False)
+        finally:
+            _agent_step_clock.reset(clock)
+    record_tokens(model_name(model), _usage_delta(usage_before, getattr(response, "token_usage", None)))
+    return response
+
+def _answer_cache_slot(parsed_inputs: Dict[str, Any], mode: str,
+                       question: Optional[str]) -> Optional[Tuple[Tuple[Hashable, ...], float, float]]:
+    """(cache key, amount, rate) for a single-pair query, or None when it cannot be cached."""
+    if ANSWER_CACHE is None or question is None or is_multi_query(parsed_inputs):
+        return None
+    from_currency, to_currency = parsed_inputs["from_currency"].upper(), parsed_inputs["to_currency"].upper()
+    try:
+        version, rate = CROSS_RATES.versioned_rate(from_currency, to_currency, parsed_inputs.get("as_of"))
+    except RateFetchError:
+        return None  # let the agent's tool report the problem
+    amount = float(parsed_inputs["amount"])
+    return (from_currency, to_currency, mode, version), amount, rate
+
+def get_insight_response(parsed_inputs: Dict[str, Any], needs_context: bool = True, question: Optional[str] = None) -> str:
+    """
+    Runs a pooled currency analyst crew for the parsed inputs and returns its answer. Without
+    `needs_context` (the query asked for no context or trends) a short confirmation is enough,
+    so the router runs the agent on the small model. When the user's `question` is given,
+    answers are reused from ANSWER_CACHE until the rate snapshot they were computed from rolls over;
+    for another amount or wording, a fresh conversion line leads the cached commentary.
+    """
+    if not GROQ_API_KEY: # Redundant check, but good for a self-contained function perspective
+        return "Error: GROQ_API_KEY is not configured for the agent."
+
+    slot = _answer_cache_slot(parsed_inputs, "insight:context" if needs_context else "insight", question)
+    if slot is not None:
+        key, amount, rate = slot
+        with span("answer_cache") as details:
+            cached = ANSWER_CACHE.get(key, amount, question)
+            details["outcome"] = "hit" if cached is not None else "miss"
+        if cached is not None:
+            text, full_answer = cached
+            return text if full_answer else f"{format_direct_response(parsed_inputs, rate)}\n\n{text}"
+
+    logger.debug("Kicking off the crew for conversion")
+    try:
+        inputs = task_inputs(parsed_inputs)
+        with span("agent"):
+            response = MODEL_ROUTER.call("agent", agent_models(), lambda model: _kickoff(model, inputs), needs_context)
+        answer = str(response) # Ensure the final output is a string
+        if slot is not None:
+            ANSWER_CACHE.put(key, amount, rate, question, answer)
+        return answer
+    except Exception as e:
+        if is_llm_unavailable(e):
+            return f"LLM service (Groq) for the agent is currently unavailable: {e}. Please try again later."
+        logger.exception("An error occurred while running the crew: %s", e)
+        return "An unexpected error occurred during currency conversion. Please check logs."
+
+PARSE_FAILURE_MESSAGE = (
+    "Could not parse your query. Please try rephrasing it, check connectivity, "
+    "or ensure all details (amount, currencies) are clear."
+)
+
+# Top-level stages reported in run_conversion()["timings"]
+RUN_TIMING_STAGES = ("parse", "rates", "agent", "total")
+
+def run_conversion(natural_language_query: str, mode: Optional[str] = None) -> Dict[str, Any]:
+    """
+    Answers a query like get_currency_conversion_response() and reports how long each stage took.
+    Returns {"response", "mode", "parsed", "timings"}; timings are seconds for "parse", then
+    "rates" (direct mode) or "agent" (insight mode), and "total". Raises ValueError for an unknown mode.
+    """
+    with request_trace("conversion", query=natural_language_query) as trace, span("total"):
+        response_mode = trace["mode"] = resolve_response_mode(natural_language_query, mode)
+        parsed_inputs = parse_query(natural_language_query)
+        if not parsed_inputs:
+            response = PARSE_FAILURE_MESSAGE
+        else:
+            logger.info("Parsed inputs (%s mode): %s", response_mode, parsed_inputs)
+            if response_mode == "direct":
+                with span("rates"):
+                    response = get_direct_response(parsed_inputs)
+            else:
+                response = get_insight_response(parsed_inputs, wants_context(natural_language_query), natural_language_query)
+    timings = {entry["stage"]: entry["seconds"] for entry in trace["spans"] if entry["stage"] in RUN_TIMING_STAGES}
+    return {"response": response, "mode": response_mode, "parsed": parsed_inputs, "timings": timings}
+
+def get_currency_conversion_response(natural_language_query: str, mode: Optional[str] = None) -> str:
+    """
+    Parses a natural language query and answers it in the requested response mode
+    ("direct", "insight" or "auto"; defaults to RESPONSE_MODE). Raises ValueError for an unknown mode.
+    """
+    return run_conversion(natural_language_query, mode)["response"]
+
+async def get_currency_conversion_response_async(natural_language_query: str, mode: Optional[str] = None) -> str:
+    """
+    Async variant of get_currency_conversion_response(). Parsing uses litellm.acompletion and
+    rates come through the pooled httpx client, so one worker can hold many conversions in flight.
+    The CrewAI agent itself is synchronous and runs in a worker thread.
+    """
+    with request_trace("conversion", query=natural_language_query) as trace, span("total"):
+        response_mode = trace["mode"] = resolve_response_mode(natural_language_query, mode)
+
+        parsed_inputs = await parse_query_async(natural_language_query)
+        if not parsed_inputs:
+            return PARSE_FAILURE_MESSAGE
+
+        logger.info("Parsed inputs (%s mode): %s", response_mode, parsed_inputs)
+        if response_mode != "direct":
+            # asyncio.to_thread copies the context, so the agent's spans still land in this trace
+            return await asyncio.to_thread(get_insight_response, parsed_inputs, wants_context(natural_language_query),
+                                           natural_language_query)
+        with span("rates"):
+            if parsed_inputs.get("as_of"):
+                # Archive reads are local, but an unarchived day goes to the provider's history endpoint
+                return await asyncio.to_thread(get_direct_response, parsed_inputs)
+            try:
+                # Warm the anchor table without blocking the loop; the templated answer then reads from memory
+                await CROSS_RATES.snapshot_async()
+            except RateFetchError as e:
+                return str(e)
+            return get_direct_response(parsed_inputs)
+
+################ Streaming Responses ######################
+def stream_insight(parsed_inputs: Dict[str, Any], conversion_text: str, needs_context: bool = True) -> Iterator[str]:
+    """
+    Streams the analyst's commentary token by token. The conversion is already computed,
+    so the analyst persona is prompted directly with the result instead of running the
+    crew's tool loop, which only returns its answer once complete. The model is routed like
+    the agent's, but a stream is not hedged once its first tokens may have been sent.
+    """
+    messages = [
+        {"role": "system", "content": f"You are a {ANALYST_ROLE}. {ANALYST_BACKSTORY} Your goal: {ANALYST_GOAL}"},
+        {"role": "user", "content": (
+            f"{CURRENCY_CONVERSION_TASK_TEMPLATE.format(**task_inputs(parsed_inputs))}\n"
+            f"The conversion has already been computed from the exchange rate data: {conversion_text}\n"
+            "Restate the result and add brief, relevant financial context."
+        )},
+    ]
+    model = MODEL_ROUTER.choose("insight_stream", agent_models(), needs_context)[0]
+    started = time.perf_counter()
+    with span("insight_stream"):
+        response = scheduled_completion(model=model, messages=messages, api_key=GROQ_API_KEY, stream=True, timeout=60)
+        usage = None
+        for chunk in response:
+            # Providers that report usage while streaming attach it to the final chunk
+            usage = getattr(chunk, "usage", None) or usage
+            delta = chunk.choices[0].delta.content if chunk.choices else None
+            if delta:
+                yield delta
+    MODEL_ROUTER.record_latency("insight_stream", model, time.perf_counter() - started)
+    record_tokens(model_name(model), usage)
+
+def stream_currency_conversion(natural_language_query: str, mode: Optional[str] = None) -> Iterator[Tuple[str, Dict[str, Any]]]:
+    """
+    Yields (event, payload) pairs as each stage finishes: "parsed" with the inputs, "result" with the
+    computed number, then "insight" text chunks in insight mode, and finally "done" (or "error").
+    """
+    with request_trace("stream", query=natural_language_query), span("total"):
+        yield from _stream_conversion_events(natural_language_query, mode)
+
+def _stream_conversion_events(natural_language_query: str, mode: Optional[str]) -> Iterator[Tuple[str, Dict[str, Any]]]:
+    response_mode = resolve_response_mode(natural_language_query, mode)
+
+    parsed_inputs = parse_query(natural_language_query)
+    if not parsed_inputs:
+        yield "error", {"error": PARSE_FAILURE_MESSAGE}
+        return
+    yield "parsed", {**parsed_inputs, "mode": response_mode}
+
+    multi = is_multi_query(parsed_inputs)
+    try:
+        with span("rates"):
+            day = historical_date(parsed_inputs.get("as_of"))
+            if multi:
+                amounts, targets = query_amounts(parsed_inputs), query_targets(parsed_inputs)
+                rates, grid = CROSS_RATES.convert_grid(amounts, parsed_inputs["from_currency"], targets, day)
+            else:
+                rate = CROSS_RATES.rate(parsed_inputs["from_currency"], parsed_inputs["to_currency"], day)
+    except RateFetchError as e:
+        yield "error", {"error": str(e)}
+        return
+    result: Dict[str, Any] = {"as_of": parsed_inputs.get("as_of"), "stale": False if day is not None else CROSS_RATES.is_stale()}
+    if multi:
+        conversion_text = format_conversion_grid(amounts, parsed_inputs["from_currency"], targets, rates, grid, day)
+        if day is None:
+            conversion_text += CROSS_RATES.staleness_note()
+        result["conversions"] = conversion_records(amounts, targets, rates, grid)
+    else:
+        conversion_text = format_direct_response(parsed_inputs, rate)
+        result.update(converted_amount=parsed_inputs["amount"] * rate, rate=rate)
+    yield "result", {**result, "text": conversion_text}
+
+    if response_mode == "insight":
+        if not GROQ_API_KEY:
+            yield "error", {"error": "Error: GROQ_API_KEY is not configured for the agent."}
+            return
+        needs_context = wants_context(natural_language_query)
+        # Streamed commentary is cached apart from crew answers (its own mode), and a hit is sent as one chunk
+        slot = _answer_cache_slot(parsed_inputs, "stream:context" if needs_context else "stream", natural_language_query)
+        if slot is not None:
+            with span("answer_cache") as details:
+                cached = ANSWER_CACHE.get(slot[0], slot[1], natural_language_query)
+                details["outcome"] = "hit" if cached is not None else "miss"
+            if cached is not None:
+                yield "insight", {"text": cached[0]}  # the result event above already carried this amount
+                yield "done", {}
+                return
+        try:
+            chunks = []
+            for text in stream_insight(parsed_inputs, conversion_text, needs_context):
+                chunks.append(text)
+                yield "insight", {"text": text}
+            if slot is not None:
+                ANSWER_CACHE.put(slot[0], slot[1], slot[2], natural_language_query, "".join(chunks))
+        except Exception as e:
+            if is_llm_unavailable(e):
+                yield "error", {"error": f"LLM service (Groq) for the agent is currently unavailable: {e}. Please try again later."}
+                return
+            logger.exception("An error occurred while streaming the insight: %s", e)
+            yield "error", {"error": "An unexpected error occurred while generating insights. Please check logs."}
+            return
+    yield "done", {}
+
+################ Metrics Exposition ######################
+def _render_samples(name: str, documentation: str, metric_type: str, samples: List[Tuple[Dict[str, Any], float]]) -> List[str]:
+    lines = [f"# HELP {name} {documentation}", f"# TYPE {name} {metric_type}"]
+    for labels, value in samples:
+        label_text = _format_labels(list(labels), list(labels.values()))
+        lines.append(f"{name}{{{label_text}}} {value}" if label_text else f"{name} {value}")
+    return lines
+
+def render_metrics() -> str:
+    """All metrics in the Prometheus text exposition format (version 0.0.4)."""
+    cache, parser, pool = RATE_CACHE.stats(), get_parser_stats(), CREW_POOL.stats()
+    lines = STAGE_SECONDS.render() + LLM_TOKENS.render() + UPSTREAM_WAIT_SECONDS.render() + LLM_CALL_SECONDS.render()
+    lines += _render_samples(
+        "currency_converter_rate_cache_lookups_total", "Rate table lookups by result.", "counter",
+        [({"result": "hit"}, cache["hits"]), ({"result": "stale"}, cache["stale_hits"]), ({"result": "miss"}, cache["misses"])],
+    )
+    lines += _render_samples(
+        "currency_converter_parses_total", "Parsed queries by source.", "counter",
+        [({"source": "fast_path"}, parser["fast_path_hits"]), ({"source": "cache"}, parser["cache_hits"]),
+         ({"source": "llm"}, parser["llm_fallbacks"])],
+    )
+    lines += _render_samples(
+        "currency_converter_single_flight_collapsed_total", "Calls that shared another caller's in-flight result.",
+        "counter", [({"flight": flight.name}, flight.stats()["collapsed"]) for flight in (RATE_FETCH_FLIGHT, LLM_PARSE_FLIGHT)],
+    )
+    lines += _render_samples(
+        "currency_converter_crew_pool_crews", "Pooled analyst crews.", "gauge",
+        [({"state": "created"}, pool["created"]), ({"state": "idle"}, pool["idle"])],
+    )
+    if ANSWER_CACHE is not None:
+        answers = ANSWER_CACHE.stats()
+        lines += _render_samples(
+            "currency_converter_answer_cache_lookups_total", "Cached insight answer lookups by result.", "counter",
+            [({"result": "exact"}, answers["exact_hits"]), ({"result": "commentary"}, answers["commentary_hits"]),
+             ({"result": "miss"}, answers["misses"])],
+        )
+    routing = MODEL_ROUTER.stats()
+    lines += _render_samples(
+        "currency_converter_llm_routing_decisions_total", "Models chosen by the router, by task and reason.", "counter",
+        [({"task": d["task"], "model": d["model"], "reason": d["reason"]}, d["count"]) for d in routing["decisions"]],
+    )
+    lines += _render_samples(
+        "currency_converter_llm_hedges_total", "Hedged LLM calls launched, and which attempt answered first.", "counter",
+        [({"task": task, "outcome": outcome}, hedges[outcome])
+         for task, hedges in routing["hedges"].items() for outcome in ("launched", "primary_won", "fallback_won")],
+    )
+    upstream = [scheduler.stats() for scheduler in UPSTREAM_SCHEDULERS]
+    lines += _render_samples(
+        "currency_converter_upstream_queue_depth", "Calls waiting for an upstream rate-limit token.", "gauge",
+        [({"provider": stats["provider"], "priority": priority}, depth)
+         for stats in upstream for priority, depth in stats["queue_depth"].items()],
+    )
+    lines += _render_samples(
+        "currency_converter_upstream_rate_per_second", "Current adaptive request rate per upstream provider.", "gauge",
+        [({"provider": stats["provider"]}, stats["rate_per_second"]) for stats in upstream],
+    )
+    for name, documentation in (("throttled", "429 responses received"), ("retries", "Calls retried after a 429"),
+                                ("timeouts", "Calls that gave up waiting for a token")):
+        lines += _render_samples(
+            f"currency_converter_upstream_{name}_total", f"{documentation}, per upstream provider.", "counter",
+            [({"provider": stats["provider"]}, stats[name]) for stats in upstream],
+        )
+    return "\n".join(lines) + "\n"
+
+################ Bulk Ledger Conversion ######################
+LEDGER_CHUNK_ROWS = int(os.getenv("LEDGER_CHUNK_ROWS", "50000"))
+LEDGER_ERROR_COLUMN = "conversion_error"
+
+# Multiplier from each currency into the ledger's target currency; set per process so
+# pool workers convert without touching the network
+_ledger_factors: Dict[str, float] = {}
+
+def _init_ledger_worker(factors: Dict[str, float]) -> None:
+    global _ledger_factors
+    _ledger_factors = factors
+
+def _init_ledger_process(factors: Dict[str, float]) -> None:
+    """
+    Process-pool initializer. Pool workers leave through os._exit without running atexit
+    handlers, so a queue listener could still hold records; workers log synchronously instead.
+    """
+    logger.handlers = [handler.target if isinstance(handler, _LazyQueueHandler) else handler
+                       for handler in logger.handlers]
+    _init_ledger_worker(factors)
+
+def ledger_factors(to_currency: str, engine: CrossRateEngine = CROSS_RATES) -> Dict[str, float]:
+    """Multiplier from every currency in one anchor snapshot into `to_currency`. Raises RateFetchError."""
+    slots, vector = engine.snapshot()
+    target = float(vector[engine._slot(slots, to_currency, "to_currency")])
+    return {code: target / float(vector[slot]) for code, slot in slots.items()}
+
+def _parse_amounts(raw_amounts: Sequence[Any]) -> Tuple[Any, List[str]]:
+    """
+    Floats for every amount (NaN where invalid) and per-row error messages ("" when fine).
+    "nan" and "inf" parse as floats but are rejected like any other bad amount; negative
+    amounts (debits, refunds) are valid ledger entries and convert as usual. JSON true/false
+    would cast to 1.0/0.0, so booleans are rejected too.
+    """
+    errors = [""] * len(raw_amounts)
+    values = raw_amounts
+    booleans = [index for index, raw in enumerate(raw_amounts) if isinstance(raw, bool)]
+    if booleans:
+        values = list(raw_amounts)
+        for index in booleans:
+            values[index] = "nan"  # flagged below with the original value
+    if np is not None:
+        try:
+            amounts = np.asarray(values, dtype=np.float64)
+        except (TypeError, ValueError):
+            pass  # at least one unparseable value; parse row by row below
+        else:
+            for index in np.flatnonzero(~np.isfinite(amounts)).tolist():
+                errors[index] = f"Invalid amount: {raw_amounts[index]!r}"
+            return amounts, errors
+    amounts = []
+    for index, value in enumerate(values):
+        try:
+            amount = float(value)
+        except (TypeError, ValueError):
+            amount = float("nan")
+        if not math.isfinite(amount):
+            amount = float("nan")
+            errors[index] = f"Invalid amount: {raw_amounts[index]!r}"
+        amounts.append(amount)
+    return (np.asarray(amounts, dtype=np.float64) if np is not None else amounts), errors
+
+def convert_ledger_values(raw_amounts: Sequence[Any], codes: Sequence[Any]) -> Tuple[List[Optional[float]], List[str]]:
+    """
+    Converts one chunk of (amount, currency) columns into the target currency with one
+    vectorized multiply. Returns converted amounts (None on error) and error messages ("" when fine).
+    """
+    amounts, errors = _parse_amounts(raw_amounts)
+    factors = [_ledger_factors.get(str(code).strip().upper(), 0.0) for code in codes]
+    for index, factor in enumerate(factors):
+        if not factor and not errors[index]:
+            errors[index] = f"Invalid or unsupported currency code: {codes[index]}"
+    if np is not None:
+        converted = (amounts * np.asarray(factors, dtype=np.float64)).tolist()
+    else:
+        converted = [amount * factor for amount, factor in zip(amounts, factors)]
+    return [None if error else value for value, error in zip(converted, errors)], errors
+
+def _process_ledger_chunk(fmt: str, text: str, spec: Dict[str, Any]) -> Tuple[str, int, int]:
+    """
+    Parses, converts and serializes one chunk of raw input text, so pool workers get the
+    CPU-heavy parts. Returns (output text, rows, failed rows).
+    """
+    decimals = spec["decimals"]
+    out = io.StringIO()
+    if fmt == "csv":
+        records: List[Any] = [row for row in csv.reader(io.StringIO(text, newline="")) if row]
+        amount_index, currency_index = spec["amount_index"], spec["currency_index"]
+        converted, errors = convert_ledger_values(
+            [row[amount_index] if amount_index < len(row) else "" for row in records],
+            [row[currency_index] if currency_index < len(row) else "" for row in records],
+        )
+        csv.writer(out).writerows(
+            row + ["" if value is None else f"{value:.{decimals}f}", error]
+            for row, value, error in zip(records, converted, errors)
+        )
+    else:
+        records = [line for line in text.splitlines() if line.strip()]
+        parsed: List[Optional[Dict[str, Any]]] = []
+        for line in records:
+            try:
+                record = json.loads(line)
+                parsed.append(record if isinstance(record, dict) else None)
+            except json.JSONDecodeError:
+                parsed.append(None)
+        converted, errors = convert_ledger_values(
+            [record.get(spec["amount_column"]) if record else None for record in parsed],
+            [record.get(spec["currency_column"]) if record else "" for record in parsed],
+        )
+        for record, value, error in zip(parsed, converted, errors):
+            if record is None:
+                record, error = {}, "Invalid JSON object"
+            record[spec["output_column"]] = None if value is None else round(value, decimals)
+            if error:
+                record[LEDGER_ERROR_COLUMN] = error
+            out.write(json.dumps(record) + "\n")
+    return out.getvalue(), len(records), sum(1 for error in errors if error)
+
+def _ledger_chunks(fmt: str, source: Any, chunk_rows: int) -> Iterator[str]:
+    """Yields the input as raw text chunks of about `chunk_rows` lines, split on record boundaries."""
+    while True:
+        lines = list(itertools.islice(source, chunk_rows))
+        if not lines:
+            return
+        text = "".join(lines)
+        if fmt == "csv" and text.count('"') % 2:
+            # A quoted CSV field spans the chunk boundary; read on until its quotes balance
+            quotes = text.count('"')
+            while quotes % 2:
+                line = next(source, None)
+                if line is None:
+                    break
+                lines.append(line)
+                quotes += line.count('"')
+            text = "".join(lines)
+        yield text
+
+def convert_ledger(
+    input_path: str,
+    output_path: str,
+    to_currency: str,
+    fmt: Optional[str] = None,
+    amount_column: str = "amount",
+    currency_column: str = "currency",
+    output_column: str = "converted_amount",
+    chunk_rows: int = LEDGER_CHUNK_ROWS,
+    workers: int = 0,
+    decimals: int = 2,
+) -> Dict[str, Any]:
+    """
+    Streams a CSV or JSONL ledger ("-" for stdin/stdout) in chunks of `chunk_rows`, converting
+    `amount_column` from `currency_column` into `to_currency` with cross rates from one anchor
+    snapshot. Output keeps input order and every input field, plus `output_column` and, for rows
+    that could not be converted, `conversion_error`. With `workers` > 1 chunks are converted
+    in a process pool. Memory stays bounded by a few chunks regardless of file size.
+    Raises RateFetchError if the anchor rates are unavailable and ValueError for a bad header.
+    """
+    fmt = fmt or ("jsonl" if input_path.endswith((".jsonl", ".ndjson")) else "csv")
+    with upstream_priority(PRIORITY_BATCH):
+        factors = ledger_factors(to_currency.upper())
+    _init_ledger_worker(factors)
+
+    started = time.perf_counter()
+    rows = failed = 0
+    source = sys.stdin if input_path == "-" else open(input_path, newline="", encoding="utf-8")
+    sink = sys.stdout if output_path == "-" else open(output_path, "w", newline="", encoding="utf-8")
+    pool = ProcessPoolExecutor(max_workers=workers, initializer=_init_ledger_process, initargs=(factors,)) if workers > 1 else None
+    try:
+        spec: Dict[str, Any] = {"decimals": decimals, "output_column": output_column,
+                                "amount_column": amount_column, "currency_column": currency_column}
+        if fmt == "csv":
+            header = next(csv.reader(itertools.islice(source, 1)), None)
+            if header is None:
+                raise ValueError("The ledger is empty.")
+            missing = [column for column in (amount_column, currency_column) if column not in header]
+            if missing:
+                raise ValueError(f"Column(s) not found in the CSV header: {', '.join(missing)}")
+            spec.update(amount_index=header.index(amount_column), currency_index=header.index(currency_column))
+            csv.writer(sink).writerow(header + [output_column, LEDGER_ERROR_COLUMN])
+
+        def write(result: Tuple[str, int, int]) -> None:
+            nonlocal rows, failed
+            text, chunk_rows_done, chunk_failed = result
+            sink.write(text)
+            rows += chunk_rows_done
+            failed += chunk_failed
+
+        chunks = _ledger_chunks(fmt, source, max(1, chunk_rows))
+        if pool is None:
+            for chunk in chunks:
+                write(_process_ledger_chunk(fmt, chunk, spec))
+        else:
+            # Keep a couple of chunks per worker in flight and write them back in input order
+            pending: "deque[Future]" = deque()
+            for chunk in chunks:
+                pending.append(pool.submit(_process_ledger_chunk, fmt, chunk, spec))
+                if len(pending) >= workers * 2:
+                    write(pending.popleft().result())
+            while pending:
+                write(pending.popleft().result())
+    finally:
+        if pool is not None:
+            pool.shutdown(cancel_futures=True)
+        if source is not sys.stdin:
+            source.close()
+        if sink is not sys.stdout:
+            sink.close()
+        else:
+            sink.flush()
+
+    elapsed = time.perf_counter() - started
+    return {"rows": rows, "failed_rows": failed, "seconds": elapsed, "rows_per_second": rows / elapsed if elapsed else 0.0}
+
+################ Piped Query Runner ######################
+PIPED_QUERY_WORKERS = int(os.getenv("PIPED_QUERY_WORKERS", "4"))
+
+def _percentile(sorted_values: Sequence[float], fraction: float) -> float:
+    """Nearest-rank percentile of an already sorted, non-empty sequence."""
+    return sorted_values[max(1, math.ceil(len(sorted_values) * fraction)) - 1]
+
+def _piped_query(line: str, query_field: str) -> Tuple[Optional[str], Optional[str]]:
+    """(query, per-line mode) from a plain-text or JSON line."""
+    if not line.startswith("{"):
+        return line, None
+    try:
+        record = json.loads(line)
+    except json.JSONDecodeError:
+        return line, None
+    if not isinstance(record, dict):
+        return None, None
+    query = record.get(query_field)
+    return (query if isinstance(query, str) and query.strip() else None), record.get("mode")
+
+def _run_piped_line(line_number: int, line: str, mode: Optional[str], query_field: str) -> Dict[str, Any]:
+    query, line_mode = _piped_query(line, query_field)
+    if query is None:
+        return {"line": line_number, "error": f"No '{query_field}' text found on this line"}
+    try:
+        with upstream_priority(PRIORITY_BATCH):
+            result = run_conversion(query, line_mode or mode)
+    except Exception as e:  # one bad line must not stop a replay
+        return {"line": line_number, "query": query, "error": str(e)}
+    return {"line": line_number, "query": query, **result}
+
+def run_piped_queries(
+    input_path: str = "-",
+    mode: Optional[str] = None,
+    workers: int = PIPED_QUERY_WORKERS,
+    query_field: str = "query",
+    output: Optional[Any] = None,
+) -> Dict[str, Dict[str, float]]:
+    """
+    Answers one query per input line ("-" for stdin) on a pool of `workers` threads and writes one
+    JSON result per line to `output` (default stdout) in input order. Lines may be plain text or JSON
+    objects carrying the query in `query_field` and an optional "mode". Returns per-stage latency
+    percentiles: {stage: {"count", "p50", "p95", "p99"}} in seconds. Diagnostics go to the logger
+    (stderr); when `output` is stdout, keep AGENT_VERBOSE off so CrewAI traces do not mix into it.
+    """
+    output = output or sys.stdout
+    source = sys.stdin if input_path == "-" else open(input_path, encoding="utf-8")
+    stage_timings: Dict[str, List[float]] = {}
+
+    def emit(result: Dict[str, Any]) -> None:
+        output.write(json.dumps(result, default=str) + "\n")
+        output.flush()
+        for stage, seconds in result.get("timings", {}).items():
+            stage_timings.setdefault(stage, []).append(seconds)
+
+    workers = max(1, workers)
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="piped-query") as executor:
+        try:
+            pending: "deque[Future]" = deque()
+            lines = ((number, line.strip()) for number, line in enumerate(source, start=1))
+            for line_number, line in lines:
+                if not line:
+                    continue
+                pending.append(executor.submit(_run_piped_line, line_number, line, mode, query_field))
+                # Bounded look-ahead keeps memory flat while results are written in input order
+                while len(pending) > workers * 2 or (pending and pending[0].done()):
+                    emit(pending.popleft().result())
+            while pending:
+                emit(pending.popleft().result())
+        finally:
+            if source is not sys.stdin:
+                source.close()
+
+    summary: Dict[str, Dict[str, float]] = {}
+    for stage, values in stage_timings.items():
+        values.sort()
+        summary[stage] = {
+            "count": len(values),
+            "p50": _percentile(values, 0.50),
+            "p95": _percentile(values, 0.95),
+            "p99": _percentile(values, 0.99),
+        }
+    return summary
+
+###################### Main Execution (for CLI) ######################
+def main(argv: Optional[List[str]] = None): # Renamed from main_cli for conventional Python
+    parser = argparse.ArgumentParser(description="Real-Time Currency Conversion Tool")
+    parser.add_argument(
+        "--mode", choices=RESPONSE_MODES, default=DEFAULT_RESPONSE_MODE,
+        help="direct: rate tool only, insight: full agent answer, auto: agent only for context/trend questions",
+    )
+    parser.add_argument(
+        "--input", help="Answer one query per line from this file (or - for stdin) and print JSONL results; "
+                        "used automatically when stdin is not a terminal",
+    )
+    parser.add_argument("--workers", type=int, default=PIPED_QUERY_WORKERS, help="Concurrent queries in piped mode")
+    parser.add_argument("--query-field", default="query", help="Field holding the query on JSON input lines")
+    subcommands = parser.add_subparsers(dest="command")
+    bulk = subcommands.add_parser("bulk", help="Convert an amount column of a CSV/JSONL ledger into one currency")
+    bulk.add_argument("input", help="CSV or JSONL file to convert, or - for stdin")
+    bulk.add_argument("--to", required=True, dest="to_currency", help="Target currency code, e.g. EUR")
+    bulk.add_argument("-o", "--output", required=True, help="Where to write the converted ledger, or - for stdout")
+    bulk.add_argument("--format", choices=("csv", "jsonl"), help="Input/output format (default: from the file extension)")
+    bulk.add_argument("--amount-column", default="amount")
+    bulk.add_argument("--currency-column", default="currency")
+    bulk.add_argument("--output-column", default="converted_amount")
+    bulk.add_argument("--chunk-rows", type=int, default=LEDGER_CHUNK_ROWS)
+    bulk.add_argument("--workers", type=int, default=0, help="Convert chunks in this many processes (default: in-process)")
+    bulk.add_argument("--decimals", type=int, default=2)
+    args = parser.parse_args(argv)
+
+    try:
+        check_config("direct" if args.command == "bulk" else args.mode)
+    except ConfigError as e:
+        print(f"Critical Error: {e}", file=sys.stderr)
+        return 1
+
+    if args.command == "bulk":
+        try:
+            stats = convert_ledger(
+                args.input, args.output, args.to_currency, fmt=args.format, amount_column=args.amount_column,
+                currency_column=args.currency_column, output_column=args.output_column,
+                chunk_rows=args.chunk_rows, workers=args.workers, decimals=args.decimals,
+            )
+        except (RateFetchError, ValueError, OSError) as e:
+            print(f"Bulk conversion failed: {e}", file=sys.stderr)
+            return 1
+        print(f"Converted {stats['rows']} rows ({stats['failed_rows']} failed) in {stats['seconds']:.2f}s "
+              f"({stats['rows_per_second']:,.0f} rows/sec)", file=sys.stderr)
+        return 0
+
+    if args.input or not sys.stdin.isatty():
+        global AGENT_VERBOSE
+        AGENT_VERBOSE = False  # CrewAI's verbose traces print to stdout, which carries only JSONL here
+        try:
+            summary = run_piped_queries(args.input or "-", args.mode, args.workers, args.query_field)
+        except OSError as e:
+            print(f"Could not read queries: {e}", file=sys.stderr)
+            return 1
+        print("Latency per stage (seconds):", file=sys.stderr)
+        for stage, stats in summary.items():
+            print(f"  {stage:<6} n={stats['count']:<5} p50={stats['p50']:.3f} p95={stats['p95']:.3f} "
+                  f"p99={stats['p99']:.3f}", file=sys.stderr)
+        return 0
 
-###################### Main Execution (for CLI) ######################
-def main(): # Renamed from main_cli for conventional Python
     print("Welcome to the Real-Time Currency Conversion Tool (CLI)!")
     while True:
         user_query = input("\nEnter your currency conversion query (e.g., 'How much is 100 dollars in euros today?') or type 'exit' to quit: ")
         if user_query.lower() == 'exit':
+            stats = get_parser_stats()
+            print(f"Fast-path parser hit rate: {stats['fast_path_hit_rate']:.0%}, parse cache hit rate: "
+                  f"{stats['cache_hit_rate']:.0%} ({stats['fast_path_hits']} local, {stats['cache_hits']} cached, "
+                  f"{stats['llm_fallbacks']} via LLM)")
             break
         if not user_query.strip():
             print("Please enter a valid query.")
             continue
 
-        final_result = get_currency_conversion_response(user_query)
+        final_result = get_currency_conversion_response(user_query, mode=args.mode)
 
         print("\n############################")
         print("## Final Response:")
@@ -247,4 +3755,4 @@ def main(): # Renamed from main_cli for conventional Python
         print(final_result)
 
 if __name__ == "__main__":
-    main()
+    sys.exit(main())
@@ -1,7 +1,19 @@
 import os
-from flask import Flask, render_template, request, jsonify
+import gzip
+import json
+import time
+import hashlib
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from flask import Blueprint, Flask, Response, render_template, request, jsonify, stream_with_context
 import sys
 
+try:
+    import brotli
+except ImportError:  # brotli is optional; /rates then offers gzip only
+    brotli = None
+
 # Ensure the src directory is in the Python path to import currency_converter_app
 # This assumes web_app.py is in the src directory, and currency_converter_app.py is also in src
 # If your project structure is different, this path adjustment might need to change.
@@ -10,58 +22,267 @@ import sys
 # Given both are in 'src' as per current plan:
 sys.path.append(os.path.dirname(os.path.abspath(__file__)))
 
-try:
-    # Attempt to import the core processing function
-    from currency_converter_app import get_currency_conversion_response
-except ImportError as e:
-    print(f"Error importing currency_converter_app: {e}")
-    # Fallback or alternative if direct import fails due to path issues in some environments
-    # This can happen if the currency_converter_app itself has path issues when imported.
-    # For now, we'll rely on the sys.path.append above.
-    # A more robust solution might involve packaging your app or using a project runner that handles PYTHONPATH.
-    def get_currency_conversion_response(query):
-        return "Error: Could not load the currency conversion module. Please check server logs."
-
-app = Flask(__name__, template_folder='../templates', static_folder='../static')
-
-@app.route('/')
+# Fails loudly if the app module cannot be imported; there is nothing useful to serve without it
+from currency_converter_app import (
+    get_currency_conversion_response, stream_currency_conversion, convert_rows, start_rate_refresher,
+    render_metrics, check_config, ConfigError, RESPONSE_MODES, DEFAULT_RESPONSE_MODE,
+    upstream_priority, PRIORITY_BATCH, latency_budget, published_rate_snapshot, RateFetchError
+)
+
+# Child of the app logger, so records go through its queue handler
+logger = logging.getLogger("currency_converter.web")
+
+# Routes live on a blueprint so importing this module has no side effects; create_app() builds the app
+web = Blueprint('web', __name__)
+
+# Keep hot rate tables warm in the background so no request pays for an expired table
+RATE_REFRESH_ENABLED = os.getenv("RATE_REFRESH_ENABLED", "true").lower() == "true"
+
+# Limits for /convert/batch: rows per request and natural-language queries run at once per request
+BATCH_MAX_ROWS = int(os.getenv("BATCH_MAX_ROWS", "10000"))
+BATCH_QUERY_CONCURRENCY = int(os.getenv("BATCH_QUERY_CONCURRENCY", "8"))
+
+def parse_latency_budget(data):
+    """Seconds from an optional positive "latency_budget_ms" field; raises ValueError if it is invalid."""
+    budget_ms = data.get('latency_budget_ms')
+    if budget_ms is None:
+        return None
+    if isinstance(budget_ms, bool) or not isinstance(budget_ms, (int, float)) or budget_ms <= 0:
+        raise ValueError('latency_budget_ms must be a positive number of milliseconds.')
+    return budget_ms / 1000
+
+def is_error_response(response_message):
+    # get_currency_conversion_response signals failures in its text rather than raising
+    return "error" in response_message.lower() or "could not parse" in response_message.lower()
+
+@web.route('/')
 def index():
     return render_template('index.html')
 
-@app.route('/convert', methods=['POST'])
+@web.route('/convert', methods=['POST'])
 def convert():
     if request.method == 'POST':
         try:
             data = request.get_json()
             natural_language_query = data.get('query')
+            mode = data.get('mode')
 
             if not natural_language_query or not natural_language_query.strip():
                 return jsonify({'error': 'Query cannot be empty.'}), 400
+            if mode is not None and mode not in RESPONSE_MODES:
+                return jsonify({'error': f"Invalid mode. Expected one of: {', '.join(RESPONSE_MODES)}."}), 400
+            try:
+                budget = parse_latency_budget(data)
+            except ValueError as e:
+                return jsonify({'error': str(e)}), 400
 
-            print(f"Received query for /convert: {natural_language_query}")
+            logger.info("Received query for /convert (%s mode): %s", mode or 'default', natural_language_query)
             # Call the refactored function from your currency_converter_app
-            response_message = get_currency_conversion_response(natural_language_query)
+            with latency_budget(budget):
+                response_message = get_currency_conversion_response(natural_language_query, mode=mode)
 
             # Basic check if the response indicates an error from the backend processing
             # You might want to refine this based on how get_currency_conversion_response signals errors
-            if "error" in response_message.lower() or "could not parse" in response_message.lower():
-                 print(f"Conversion process returned an error: {response_message}")
+            if is_error_response(response_message):
+                 logger.warning("Conversion process returned an error: %s", response_message)
                  return jsonify({'error': response_message}), 500 # Internal Server Error or a more specific one
 
-            print(f"Conversion successful: {response_message}")
+            logger.debug("Conversion successful: %s", response_message)
             return jsonify({'response': response_message})
 
         except Exception as e:
-            print(f"Exception in /convert: {e}")
-            import traceback
-            traceback.print_exc()
+            logger.exception("Exception in /convert: %s", e)
             # A more generic error for unexpected issues
             return jsonify({'error': 'An unexpected error occurred on the server.'}), 500
     else:
         # Method Not Allowed
         return jsonify({'error': 'Only POST requests are accepted for this endpoint.'}), 405
 
+@web.route('/convert/stream', methods=['POST'])
+def convert_stream():
+    """
+    Server-Sent Events version of /convert. Emits "parsed" and "result" as soon as they are known,
+    then "insight" chunks while the analyst writes, and ends with "done" or "error".
+    """
+    data = request.get_json(silent=True) or {}
+    natural_language_query = data.get('query')
+    mode = data.get('mode')
+
+    if not natural_language_query or not natural_language_query.strip():
+        return jsonify({'error': 'Query cannot be empty.'}), 400
+    if mode is not None and mode not in RESPONSE_MODES:
+        return jsonify({'error': f"Invalid mode. Expected one of: {', '.join(RESPONSE_MODES)}."}), 400
+    try:
+        budget = parse_latency_budget(data)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    logger.info("Received query for /convert/stream (%s mode): %s", mode or 'default', natural_language_query)
+
+    def generate():
+        try:
+            with latency_budget(budget):
+                for event, payload in stream_currency_conversion(natural_language_query, mode=mode):
+                    yield f"event: {event}\ndata: {json.dumps(payload)}\n\n"
+        except Exception as e:
+            logger.exception("Exception in /convert/stream: %s", e)
+            yield f"event: error\ndata: {json.dumps({'error': 'An unexpected error occurred on the server.'})}\n\n"
+
+    return Response(
+        stream_with_context(generate()),
+        mimetype='text/event-stream',
+        # Stop proxies from buffering the stream, which would defeat the point of SSE
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'},
+    )
+
+@web.route('/convert/batch', methods=['POST'])
+def convert_batch():
+    """
+    Accepts a JSON array of rows (or {"rows": [...], "mode": ...}). Each row is either structured,
+    {"amount", "from_currency", "to_currency"}, or natural language, {"query"}. Structured rows share
+    one rate lookup and a vectorized multiply; queries run with bounded concurrency.
+    Results come back in input order, with an "error" key on rows that failed.
+    """
+    try:
+        data = request.get_json(silent=True)
+        mode = None
+        if isinstance(data, dict):
+            mode = data.get('mode')
+            data = data.get('rows')
+        if not isinstance(data, list) or not data:
+            return jsonify({'error': 'Expected a non-empty JSON array of rows, or an object with a "rows" array.'}), 400
+        if len(data) > BATCH_MAX_ROWS:
+            return jsonify({'error': f'A batch may contain at most {BATCH_MAX_ROWS} rows.'}), 413
+        if mode is not None and mode not in RESPONSE_MODES:
+            return jsonify({'error': f"Invalid mode. Expected one of: {', '.join(RESPONSE_MODES)}."}), 400
+
+        results = [None] * len(data)
+        structured, queries = [], []
+        for index, row in enumerate(data):
+            if not isinstance(row, dict):
+                results[index] = {'error': 'Each row must be a JSON object.'}
+            elif 'query' in row:
+                queries.append((index, row['query']))
+            else:
+                structured.append((index, row))
+
+        logger.info("Received batch for /convert/batch: %d structured rows, %d queries", len(structured), len(queries))
+        # Batch work queues behind interactive /convert requests for upstream rate-limit tokens
+        with upstream_priority(PRIORITY_BATCH):
+            structured_results = convert_rows([row for _, row in structured])
+        for (index, _), result in zip(structured, structured_results):
+            results[index] = result
+
+        def run_query(query):
+            if not isinstance(query, str) or not query.strip():
+                return {'query': query, 'error': 'Query cannot be empty.'}
+            try:
+                with upstream_priority(PRIORITY_BATCH):  # executor threads do not inherit the request context
+                    response_message = get_currency_conversion_response(query, mode=mode)
+            except Exception as e:
+                logger.exception("Exception for batch query %r: %s", query, e)
+                return {'query': query, 'error': 'An unexpected error occurred on the server.'}
+            if is_error_response(response_message):
+                return {'query': query, 'error': response_message}
+            return {'query': query, 'response': response_message}
+
+        if queries:
+            with ThreadPoolExecutor(max_workers=max(1, min(BATCH_QUERY_CONCURRENCY, len(queries)))) as executor:
+                for (index, _), result in zip(queries, executor.map(run_query, [query for _, query in queries])):
+                    results[index] = result
+
+        return jsonify({'results': results})
+
+    except Exception as e:
+        logger.exception("Exception in /convert/batch: %s", e)
+        return jsonify({'error': 'An unexpected error occurred on the server.'}), 500
+
+# /rates bodies are built once per rate snapshot: the JSON, its digest and each compressed encoding
+RATES_COMPRESS_MIN_BYTES = 512
+_rates_lock = threading.Lock()
+_rates_bodies = {'version': None, 'digest': None, 'encodings': {}}
+
+def _rates_encoding():
+    """The best encoding the client accepts: br (if brotli is installed), then gzip, else identity."""
+    accepted = request.accept_encodings
+    if brotli is not None and accepted['br']:
+        return 'br'
+    if accepted['gzip']:
+        return 'gzip'
+    return 'identity'
+
+def _rates_body(snapshot, encoding):
+    """
+    (encoding, body, digest) for the snapshot; compresses at most once per snapshot and encoding,
+    and not at all below RATES_COMPRESS_MIN_BYTES. The body holds only base and rates, so every
+    worker with the same table builds the same bytes (fetched_at/expires_at go in headers).
+    """
+    with _rates_lock:
+        if _rates_bodies['version'] != snapshot['version']:
+            payload = {'base': snapshot['base'], 'rates': snapshot['rates']}
+            body = json.dumps(payload, separators=(',', ':'), sort_keys=True).encode('utf-8')
+            _rates_bodies.update(version=snapshot['version'], digest=hashlib.sha256(body).hexdigest()[:32],
+                                 encodings={'identity': body})
+        encodings = _rates_bodies['encodings']
+        if len(encodings['identity']) < RATES_COMPRESS_MIN_BYTES:
+            encoding = 'identity'
+        if encoding not in encodings:
+            identity = encodings['identity']
+            encodings[encoding] = brotli.compress(identity) if encoding == 'br' else gzip.compress(identity, mtime=0)
+        return encoding, encodings[encoding], _rates_bodies['digest']
+
+@web.route('/rates')
+def rates():
+    """
+    The current anchor rate table as compact JSON ({"base", "rates"}), so clients can do plain
+    numeric conversions locally. Carries a strong ETag per table and encoding, answers a matching
+    If-None-Match with 304, and may be cached until the table expires (Expires, Cache-Control).
+    """
+    try:
+        snapshot = published_rate_snapshot()
+    except RateFetchError as e:
+        return jsonify({'error': str(e)}), 503
+
+    encoding, body, digest = _rates_body(snapshot, _rates_encoding())
+    # Strong ETags identify exact bytes, so each encoding of a table gets its own tag
+    etag = digest if encoding == 'identity' else f"{digest}-{encoding}"
+    max_age = max(0, int(snapshot['expires_at'] - time.time()))
+
+    if request.if_none_match.contains(etag) or request.if_none_match.star_tag:
+        response = Response(status=304)
+    else:
+        response = Response(body, content_type='application/json')
+        if encoding != 'identity':
+            response.headers['Content-Encoding'] = encoding
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = f'public, max-age={max_age}'
+    response.headers['Vary'] = 'Accept-Encoding'
+    response.last_modified = snapshot['fetched_at']
+    response.expires = snapshot['expires_at']
+    return response
+
+@web.route('/metrics')
+def metrics():
+    """Stage latency and token histograms plus cache/parser counters in Prometheus text format."""
+    return Response(render_metrics(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+def create_app():
+    """
+    Builds the Flask app: checks the configuration for DEFAULT_RESPONSE_MODE (raising ConfigError,
+    so `python src/web_app.py` and gunicorn workers refuse to start) and starts the rate refresher.
+    """
+    check_config(DEFAULT_RESPONSE_MODE)
+    app = Flask(__name__, template_folder='../templates', static_folder='../static')
+    app.register_blueprint(web)
+    if RATE_REFRESH_ENABLED:
+        start_rate_refresher()
+    return app
+
 if __name__ == '__main__':
+    try:
+        app = create_app()
+    except ConfigError as e:
+        sys.exit(f"Critical Error: {e}")
     # Make sure to set FLASK_ENV=development for debug mode if running with `flask run`
     # For `python src/web_app.py`, debug=True is fine for development.
     app.run(debug=True, port=5000) # Runs on http://127.0.0.1:5000/
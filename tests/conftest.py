@@ -0,0 +1,61 @@
+"""
+Shared test setup. The app reads its configuration at import, so the stub ExchangeRate-API
+server from benchmarks/offline_stubs.py is started and the environment pointed at it before
+any test module imports currency_converter_app. Nothing here reaches the network.
+"""
+import os
+import sys
+from pathlib import Path
+
+import pytest
+
+project_root = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(project_root / "src"))
+sys.path.insert(0, str(project_root / "benchmarks"))
+
+from offline_stubs import FakeCompletion, StubExchangeRateAPI  # noqa: E402
+
+STUB_API = StubExchangeRateAPI().start()
+os.environ["EXCHANGE_RATE_API_BASE_URL"] = STUB_API.base_url
+for key in ("EXCHANGE_RATE_API_KEY", "GROQ_API_KEY"):
+    os.environ.setdefault(key, "test-placeholder")
+os.environ.setdefault("LITELLM_LOCAL_MODEL_COST_MAP", "True")
+os.environ.setdefault("CREWAI_TELEMETRY_OPT_OUT", "true")
+# The stub has no quota; pacing is tested on schedulers the tests build themselves
+os.environ["EXCHANGE_RATE_API_RATE_PER_SECOND"] = "100000"
+os.environ["EXCHANGE_RATE_API_BURST"] = "1000"
+os.environ["GROQ_RATE_PER_SECOND"] = "100000"
+os.environ["GROQ_BURST"] = "1000"
+os.environ["PRODUCTION_MODE"] = "true"
+os.environ["RATE_REFRESH_ENABLED"] = "false"
+os.environ["RATE_ARCHIVE_DIR"] = ""
+for key in ("SHARED_RATE_STORE_DIR", "PARSE_CACHE_DB_PATH", "TRACE_EXPORT_PATH"):
+    os.environ.pop(key, None)
+
+import currency_converter_app  # noqa: E402
+
+
+@pytest.fixture
+def app():
+    """The app module with empty rate, parse and answer caches."""
+    currency_converter_app.RATE_CACHE.clear()
+    currency_converter_app.PARSE_CACHE.clear()
+    if currency_converter_app.ANSWER_CACHE is not None:
+        currency_converter_app.ANSWER_CACHE.clear()
+    return currency_converter_app
+
+
+@pytest.fixture
+def stub_api():
+    """The stub ExchangeRate-API server, back at zero latency and errors after the test."""
+    yield STUB_API
+    STUB_API.latency_ms = STUB_API.jitter_ms = STUB_API.error_rate = 0.0
+
+
+@pytest.fixture
+def fake_completion(app, monkeypatch):
+    """Routes the app's litellm completion/acompletion wrappers to a FakeCompletion."""
+    fake = FakeCompletion()
+    monkeypatch.setattr(app, "completion", fake)
+    monkeypatch.setattr(app, "acompletion", fake.acall)
+    return fake
@@ -0,0 +1,88 @@
+import pytest
+
+RATE = 0.92
+KEY = ("USD", "EUR", "insight", 1)
+
+
+def test_commentary_keeps_only_sentences_without_amount_dependent_figures(app):
+    text = ("100 USD is 92.00 EUR. That covers roughly 25 coffees in Paris! "
+            "The euro is up 3% this month, and at 0.92 EUR per USD (1.087 USD per EUR) it sits near its 2024 high.\n"
+            "Watch for a 2.50 EUR card fee. Rates move daily, so check again before you travel.")
+    assert app.answer_commentary(text, RATE) == (
+        "The euro is up 3% this month, and at 0.92 EUR per USD (1.087 USD per EUR) it sits near its 2024 high.\n"
+        "Rates move daily, so check again before you travel.")
+
+
+def test_commentary_is_none_when_every_sentence_depends_on_the_amount(app):
+    assert app.answer_commentary("You would get about 92 euros for your 100 dollars.", RATE) is None
+
+
+def test_full_answer_only_for_the_same_amount_and_question(app):
+    cache = app.AnswerCache(max_entries=8)
+    text = "100 USD is 92.00 EUR, enough for 25 coffees. The euro is up 3% this month."
+    cache.put(KEY, 100.0, RATE, "Convert 100 USD to EUR?", text)
+
+    assert cache.get(KEY, 100.0, "convert 100 usd  to eur") == (text, True)
+    assert cache.get(KEY, 250.0, "convert 250 usd to eur") == ("The euro is up 3% this month.", False)
+    assert cache.get(KEY, 100.0, "is 100 USD a lot of euros") == ("The euro is up 3% this month.", False)
+    stats = cache.stats()
+    assert (stats["exact_hits"], stats["commentary_hits"], stats["misses"]) == (1, 2, 0)
+
+
+def test_answer_without_commentary_is_only_reused_verbatim(app):
+    cache = app.AnswerCache(max_entries=8)
+    cache.put(KEY, 100.0, RATE, "100 usd to eur", "100 USD is 92.00 EUR.")
+    assert cache.get(KEY, 250.0, "250 usd to eur") is None
+    assert cache.get(KEY, 100.0, "100 usd to eur") == ("100 USD is 92.00 EUR.", True)
+
+
+def test_new_snapshot_drops_latest_rate_answers_but_keeps_past_days(app):
+    cache = app.AnswerCache(max_entries=8)
+    past = ("USD", "EUR", "insight", "2024-03-01")
+    cache.put(KEY, 100.0, RATE, "q", "Rates move daily.")
+    cache.put(past, 100.0, RATE, "q", "Rates were calm that day.")
+    newer = KEY[:-1] + (2,)
+    assert cache.get(newer, 100.0, "q") is None
+    assert cache.get(KEY, 100.0, "q") is None
+    assert cache.get(past, 100.0, "q") == ("Rates were calm that day.", True)
+    assert cache.stats()["invalidations"] == 1
+
+    cache.put(KEY, 100.0, RATE, "q", "Computed before the roll-over.")
+    assert cache.get(KEY, 100.0, "q") is None
+
+
+def test_lru_bound(app):
+    cache = app.AnswerCache(max_entries=2)
+    keys = [("USD", code, "insight", 1) for code in ("EUR", "GBP", "JPY")]
+    for key in keys:
+        cache.put(key, 10.0, RATE, "q", "Rates move daily.")
+    assert cache.get(keys[0], 10.0, "q") is None
+    assert cache.get(keys[2], 10.0, "q") is not None
+
+
+class FixedRates:
+    def versioned_rate(self, from_currency, to_currency, as_of=None):
+        return 1, RATE
+
+    def staleness_note(self):
+        return ""
+
+
+@pytest.mark.parametrize("amount", [1.0, 40.0])
+def test_insight_hit_at_another_amount_rebuilds_the_conversion_line(app, monkeypatch, amount):
+    kickoffs = []
+
+    def kickoff(model, inputs):
+        kickoffs.append(inputs["amount"])
+        return f"{inputs['amount']} USD is {inputs['amount'] * RATE:.2f} EUR, about 25 coffees. The euro is up 3% this month."
+
+    monkeypatch.setattr(app, "_kickoff", kickoff)
+    monkeypatch.setattr(app, "CROSS_RATES", FixedRates())
+    parsed = {"amount": 100.0, "from_currency": "USD", "to_currency": "EUR"}
+
+    first = app.get_insight_response(parsed, False, "100 USD to EUR")
+    assert app.get_insight_response(parsed, False, "100 usd to eur?") == first
+    other = app.get_insight_response({**parsed, "amount": amount}, False, f"{amount:g} usd in euros")
+    assert other == (f"{amount} USD is equal to {amount * RATE:.2f} EUR.\n"
+                     f"Exchange rate: 1 USD = {RATE} EUR.\n\nThe euro is up 3% this month.")
+    assert kickoffs == [100.0]
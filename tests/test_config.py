@@ -0,0 +1,51 @@
+import os
+import subprocess
+import sys
+from pathlib import Path
+
+import pytest
+
+SRC = Path(__file__).resolve().parent.parent / "src"
+
+
+def create_web_app(**env):
+    code = "import web_app, threading; n = threading.active_count(); web_app.create_app(); print(n)"
+    env = {**os.environ, "LOG_LEVEL": "ERROR", **env}  # the missing-.env warning would start the log listener
+    result = subprocess.run([sys.executable, "-c", code], cwd=SRC, env=env,
+                            capture_output=True, text=True, timeout=60)
+    return result.returncode, result.stdout, result.stderr
+
+
+def test_unknown_response_mode_is_a_config_error(app):
+    with pytest.raises(app.ConfigError, match="Unknown response mode 'insihgt'"):
+        app.check_config("insihgt")
+
+
+def test_missing_key_is_named(app, monkeypatch):
+    monkeypatch.setattr(app, "GROQ_API_KEY", None)
+    app.check_config("direct")
+    with pytest.raises(app.ConfigError, match="GROQ_API_KEY"):
+        app.check_config("insight")
+
+
+def test_cli_rejects_an_invalid_response_mode_default(app, monkeypatch, capsys):
+    monkeypatch.setattr(app, "DEFAULT_RESPONSE_MODE", "fast")
+    assert app.main(["--input", os.devnull]) == 1
+    assert "Unknown response mode 'fast'" in capsys.readouterr().err
+
+
+def test_web_app_checks_config_when_the_app_is_created():
+    code, stdout, _ = create_web_app(RESPONSE_MODE="insight")
+    assert code == 0 and stdout.strip() == "1"  # importing started no threads
+    code, _, stderr = create_web_app(RESPONSE_MODE="insight", GROQ_API_KEY="")
+    assert code == 1 and "ConfigError: GROQ_API_KEY not set" in stderr
+    code, _, stderr = create_web_app(RESPONSE_MODE="Turbo")
+    assert code == 1 and "ConfigError: Unknown response mode 'turbo'" in stderr
+
+
+def test_importing_the_web_app_checks_nothing(app, monkeypatch):
+    monkeypatch.setattr(app, "GROQ_API_KEY", None)
+    import web_app
+
+    with pytest.raises(app.ConfigError):
+        web_app.create_app()
@@ -0,0 +1,61 @@
+import warnings
+from contextlib import contextmanager
+from types import SimpleNamespace
+
+
+def test_building_a_crew_raises_no_callback_serialization_warning(app):
+    with warnings.catch_warnings(record=True) as caught:
+        warnings.simplefilter("always")
+        crew = app.build_currency_crew()
+    assert crew.step_callback is app.record_agent_step
+    assert not [w for w in caught if "cannot be serialized" in str(w.message)]
+
+
+def test_agent_steps_are_timed_only_inside_a_kickoff(app):
+    app.record_agent_step(object())  # no kickoff in progress: ignored
+
+    with app.request_trace("test") as trace:
+        token = app._agent_step_clock.set({"started": 0.0, "trace": trace})
+        try:
+            app.record_agent_step(object())
+            app.record_agent_step(type("AgentFinish", (), {})())
+        finally:
+            app._agent_step_clock.reset(token)
+    outcomes = [entry["outcome"] for entry in trace["spans"] if entry["stage"] == "agent_step"]
+    assert outcomes == ["action", "finish"]
+
+
+class CumulativeCrew:
+    """Stands in for a pooled crew whose LLM usage totals keep growing across kickoffs."""
+
+    def __init__(self):
+        self.prompt_tokens = self.completion_tokens = 0
+
+    def calculate_usage_metrics(self):
+        return SimpleNamespace(prompt_tokens=self.prompt_tokens, completion_tokens=self.completion_tokens)
+
+    def kickoff(self, inputs):
+        self.prompt_tokens += 100
+        self.completion_tokens += 20
+        return SimpleNamespace(token_usage=self.calculate_usage_metrics())
+
+
+class OneCrewPool:
+    def __init__(self, crew):
+        self.crew = crew
+
+    @contextmanager
+    def acquire(self):
+        yield self.crew
+
+
+def test_each_kickoff_records_only_its_own_tokens(app, monkeypatch):
+    pool = OneCrewPool(CumulativeCrew())
+    monkeypatch.setattr(app, "crew_pool", lambda model: pool)
+    monkeypatch.setattr(app, "scheduler_for_model", lambda model: None)
+
+    for _ in range(3):
+        with app.request_trace("test") as trace:
+            app._kickoff("groq/test-model", {})
+        assert trace["tokens"]["prompt_tokens"] == 100
+        assert trace["tokens"]["completion_tokens"] == 20
@@ -0,0 +1,89 @@
+import csv
+import json
+
+import pytest
+
+from offline_stubs import STUB_RATES
+
+LEDGER = (
+    "id,amount,currency,memo\n"
+    "1,100,USD,plain\n"
+    '2,50,EUR,"a memo\nspanning lines"\n'
+    "3,abc,GBP,bad amount\n"
+    "4,10,XXX,bad code\n"
+    "5,1000,JPY,\n"
+)
+
+
+def expected_eur(amount, currency):
+    return round(amount * STUB_RATES["EUR"] / STUB_RATES[currency], 2)
+
+
+@pytest.mark.parametrize("chunk_rows", [1, 2, 50000])
+def test_csv_chunks_keep_quoted_fields_and_row_order(app, tmp_path, chunk_rows):
+    source, target = tmp_path / "ledger.csv", tmp_path / "out.csv"
+    source.write_text(LEDGER, encoding="utf-8")
+    stats = app.convert_ledger(str(source), str(target), "eur", chunk_rows=chunk_rows)
+
+    with open(target, newline="", encoding="utf-8") as f:
+        rows = list(csv.DictReader(f))
+    assert [row["id"] for row in rows] == ["1", "2", "3", "4", "5"]
+    assert rows[1]["memo"] == "a memo\nspanning lines"
+    assert float(rows[0]["converted_amount"]) == expected_eur(100, "USD")
+    assert float(rows[4]["converted_amount"]) == expected_eur(1000, "JPY")
+    assert rows[2]["conversion_error"].startswith("Invalid amount")
+    assert rows[3]["conversion_error"].startswith("Invalid or unsupported currency code")
+    assert stats["rows"] == 5 and stats["failed_rows"] == 2
+
+
+def test_jsonl_in_a_process_pool(app, tmp_path):
+    source, target = tmp_path / "ledger.jsonl", tmp_path / "out.jsonl"
+    records = [{"id": i, "amount": 10 * i, "currency": "GBP"} for i in range(1, 41)] + ["not an object"]
+    source.write_text("\n".join(json.dumps(record) for record in records) + "\n", encoding="utf-8")
+    stats = app.convert_ledger(str(source), str(target), "EUR", chunk_rows=7, workers=2)
+
+    lines = [json.loads(line) for line in target.read_text(encoding="utf-8").splitlines()]
+    assert [line.get("id") for line in lines[:40]] == list(range(1, 41))
+    assert lines[39]["converted_amount"] == expected_eur(400, "GBP")
+    assert lines[40]["conversion_error"] == "Invalid JSON object"
+    assert stats["rows"] == 41 and stats["failed_rows"] == 1
+
+
+def test_missing_column_is_reported(app, tmp_path):
+    source = tmp_path / "ledger.csv"
+    source.write_text("id,value,currency\n1,5,USD\n", encoding="utf-8")
+    with pytest.raises(ValueError, match="amount"):
+        app.convert_ledger(str(source), str(tmp_path / "out.csv"), "EUR")
+
+
+@pytest.mark.parametrize("use_numpy", [True, False])
+def test_non_finite_amounts_are_row_errors_and_negatives_convert(app, tmp_path, monkeypatch, use_numpy):
+    if not use_numpy:
+        monkeypatch.setattr(app, "np", None)
+    source, target = tmp_path / "ledger.csv", tmp_path / "out.csv"
+    source.write_text("amount,currency\nnan,USD\ninf,USD\n-inf,EUR\n-25,USD\n1e3,USD\n", encoding="utf-8")
+    stats = app.convert_ledger(str(source), str(target), "EUR")
+
+    with open(target, newline="", encoding="utf-8") as f:
+        rows = list(csv.DictReader(f))
+    assert [row["conversion_error"] for row in rows[:3]] == ["Invalid amount: 'nan'", "Invalid amount: 'inf'",
+                                                            "Invalid amount: '-inf'"]
+    assert all(row["converted_amount"] == "" for row in rows[:3])
+    assert float(rows[3]["converted_amount"]) == expected_eur(-25, "USD")
+    assert float(rows[4]["converted_amount"]) == expected_eur(1000, "USD")
+    assert stats["failed_rows"] == 3
+
+
+@pytest.mark.parametrize("use_numpy", [True, False])
+def test_json_booleans_are_not_amounts(app, tmp_path, monkeypatch, use_numpy):
+    if not use_numpy:
+        monkeypatch.setattr(app, "np", None)
+    source, target = tmp_path / "ledger.jsonl", tmp_path / "out.jsonl"
+    records = [{"amount": True, "currency": "USD"}, {"amount": False, "currency": "USD"}, {"amount": 10, "currency": "USD"}]
+    source.write_text("\n".join(json.dumps(record) for record in records) + "\n", encoding="utf-8")
+    stats = app.convert_ledger(str(source), str(target), "EUR")
+
+    lines = [json.loads(line) for line in target.read_text(encoding="utf-8").splitlines()]
+    assert [line.get("conversion_error") for line in lines] == ["Invalid amount: True", "Invalid amount: False", None]
+    assert lines[2]["converted_amount"] == expected_eur(10, "USD")
+    assert stats["failed_rows"] == 2
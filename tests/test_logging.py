@@ -0,0 +1,63 @@
+import logging
+import multiprocessing
+import os
+import subprocess
+import sys
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+import pytest
+
+import currency_converter_app
+
+fork_only = pytest.mark.skipif(not hasattr(os, "fork"), reason="needs fork")
+
+
+def log_from_worker(message):
+    currency_converter_app.logger.warning(message)
+    return os.getpid()
+
+
+@pytest.fixture
+def log_file(app, tmp_path):
+    """Points the app logger's queue listener at a file, and back at stderr after the test."""
+    path = tmp_path / "app.log"
+    handler = logging.FileHandler(path)
+    handler.setFormatter(logging.Formatter("%(process)d %(message)s"))
+    app.configure_logging("INFO", handler)
+    yield path
+    app.configure_logging()
+    handler.close()
+
+
+def test_importing_the_app_starts_no_listener_thread():
+    code = ("import threading, currency_converter_app as app; "
+            "print(app._log_handler.listener is None, any('_monitor' in t.name for t in threading.enumerate()))")
+    env = {**os.environ, "LOG_LEVEL": "ERROR"}  # the missing-.env warning would otherwise start it
+    src = str(Path(__file__).resolve().parent.parent / "src")
+    result = subprocess.run([sys.executable, "-c", code], cwd=src, env=env, capture_output=True, text=True, timeout=60)
+    assert result.stdout.split() == ["True", "False"], result.stderr
+
+
+@fork_only
+def test_a_forked_child_gets_its_own_listener(app, log_file):
+    app.logger.warning("parent before fork")
+    pid = os.fork()
+    if pid == 0:
+        try:
+            app.logger.warning("from the child")
+            app._stop_log_listener()
+        finally:
+            os._exit(0)
+    os.waitpid(pid, 0)
+    app._stop_log_listener()
+    assert f"{pid} from the child" in log_file.read_text()
+
+
+@fork_only
+def test_ledger_pool_workers_log_synchronously(app, log_file):
+    with ProcessPoolExecutor(max_workers=2, mp_context=multiprocessing.get_context("fork"),
+                             initializer=app._init_ledger_process, initargs=({},)) as pool:
+        pids = set(pool.map(log_from_worker, ["from a ledger worker"] * 4))
+    lines = log_file.read_text().splitlines()
+    assert {f"{pid} from a ledger worker" for pid in pids} <= set(lines)
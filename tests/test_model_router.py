@@ -0,0 +1,91 @@
+import asyncio
+import time
+
+import pytest
+
+SMALL, LARGE = "groq/small", "groq/large"
+
+
+def warmed_router(app, small_seconds=0.01, large_seconds=0.01, samples=5):
+    router = app.ModelRouter(min_samples=samples, max_workers=4)
+    for _ in range(samples):
+        router.record_latency("agent", SMALL, small_seconds)
+        router.record_latency("agent", LARGE, large_seconds)
+    return router
+
+
+def test_small_model_unless_depth_is_needed(app):
+    router = app.ModelRouter(min_samples=5)
+    assert router.choose("agent", (SMALL, LARGE)) == (SMALL, "small")
+    assert router.choose("agent", (SMALL, LARGE), needs_depth=True) == (LARGE, "depth")
+
+
+def test_budget_steers_depth_requests_to_a_faster_model(app):
+    router = warmed_router(app, small_seconds=0.2, large_seconds=3.0)
+    with app.latency_budget(1.0):
+        assert router.choose("agent", (SMALL, LARGE), needs_depth=True) == (SMALL, "budget")
+    with app.latency_budget(5.0):
+        assert router.choose("agent", (SMALL, LARGE), needs_depth=True) == (LARGE, "depth")
+    assert router.choose("agent", (SMALL, LARGE), needs_depth=True) == (LARGE, "depth")
+
+
+def test_p95_needs_min_samples(app):
+    router = app.ModelRouter(min_samples=3)
+    router.record_latency("parse", SMALL, 0.1)
+    assert router.p95("parse", SMALL) is None
+    router.record_latency("parse", SMALL, 0.2)
+    router.record_latency("parse", SMALL, 0.3)
+    assert router.p95("parse", SMALL) == pytest.approx(0.3)
+
+
+def test_slow_call_is_hedged_and_the_fallback_wins(app):
+    router = warmed_router(app)
+
+    def call(model):
+        time.sleep(1.0 if model == SMALL else 0.01)
+        return model
+
+    started = time.perf_counter()
+    assert router.call("agent", (SMALL, LARGE), call) == LARGE
+    assert time.perf_counter() - started < 0.5
+    assert router.stats()["hedges"]["agent"]["fallback_won"] == 1
+
+
+def test_fast_call_is_not_hedged(app):
+    router = warmed_router(app, small_seconds=0.5, large_seconds=0.5)
+    assert router.call("agent", (SMALL, LARGE), lambda model: model) == SMALL
+    assert router.stats()["hedges"] == {}
+
+
+def test_hedge_survives_a_failed_primary(app):
+    router = warmed_router(app)
+
+    def call(model):
+        if model == SMALL:
+            time.sleep(0.1)
+            raise RuntimeError("primary failed")
+        time.sleep(0.2)
+        return model
+
+    assert router.call("agent", (SMALL, LARGE), call) == LARGE
+
+
+def test_async_hedge_cancels_the_loser(app):
+    router = warmed_router(app)
+    cancelled = []
+
+    async def call(model):
+        try:
+            await asyncio.sleep(1.0 if model == SMALL else 0.01)
+        except asyncio.CancelledError:
+            cancelled.append(model)
+            raise
+        return model
+
+    assert asyncio.run(router.call_async("agent", (SMALL, LARGE), call)) == LARGE
+    assert cancelled == [SMALL]
+
+
+def test_disabled_router_uses_the_first_candidate(app):
+    router = app.ModelRouter(enabled=False)
+    assert router.call("agent", (SMALL, LARGE), lambda model: model, needs_depth=True) == SMALL
@@ -0,0 +1,51 @@
+import pytest
+
+
+def test_fast_path_parses_common_phrasings(app):
+    parsed = app.parse_query_fast("convert 100 USD to EUR")
+    assert (parsed["amount"], parsed["from_currency"], parsed["to_currency"]) == (100.0, "USD", "EUR")
+    assert app.parse_query_fast("how much is 75.5 euros in yen")["to_currency"] == "JPY"
+    assert app.parse_query_fast("what would a hundred quid get me in euros") is None
+
+
+def test_same_template_at_another_amount_reuses_the_parse(app):
+    cache = app.ParseCache(max_entries=16, db_path=None)
+    cache.put("Send 50 bucks to Lagos", {"amount": 50.0, "from_currency": "USD", "to_currency": "NGN"})
+    assert cache.get("send 50 bucks to lagos?")["amount"] == 50.0
+    reused = cache.get("send 80 bucks to lagos")
+    assert (reused["amount"], reused["from_currency"], reused["to_currency"]) == (80.0, "USD", "NGN")
+    assert cache.stats()["exact_hits"] == 1 and cache.stats()["template_hits"] == 1
+
+
+def test_template_is_skipped_when_the_number_was_not_the_amount(app):
+    cache = app.ParseCache(max_entries=16, db_path=None)
+    cache.put("a hundred quid to 3 friends in euros", {"amount": 100.0, "from_currency": "GBP", "to_currency": "EUR"})
+    assert cache.get("a hundred quid to 4 friends in euros") is None
+
+
+def test_least_recently_used_parse_is_evicted(app):
+    cache = app.ParseCache(max_entries=2, db_path=None)
+    for query in ("one quid in euros", "one buck in yen", "one franc in rupees"):
+        cache.put(query, {"amount": 1.0, "from_currency": "GBP", "to_currency": "EUR"})
+    assert cache.get("one quid in euros") is None
+    assert cache.get("one franc in rupees") is not None
+
+
+def test_parses_persist_in_sqlite(app, tmp_path):
+    db_path = str(tmp_path / "parses.db")
+    app.ParseCache(db_path=db_path).put("a tenner in euros", {"amount": 10.0, "from_currency": "GBP", "to_currency": "EUR"})
+    assert app.ParseCache(db_path=db_path).get("a tenner in euros")["from_currency"] == "GBP"
+
+
+def test_llm_parse_is_cached(app, fake_completion):
+    query = "what would a hundred quid get me in euros"
+    parsed = app.parse_query(query)
+    assert (parsed["amount"], parsed["from_currency"], parsed["to_currency"]) == (100.0, "GBP", "EUR")
+    assert app.parse_query(query)["from_currency"] == "GBP"
+    assert fake_completion.calls == 1
+
+
+@pytest.mark.parametrize("query", ["convert 100 USD to EUR", "250 GBP to JPY"])
+def test_fast_path_queries_never_reach_the_llm(app, fake_completion, query):
+    assert app.parse_query(query) is not None
+    assert fake_completion.calls == 0
@@ -0,0 +1,32 @@
+import io
+import json
+import sys
+
+
+def test_results_come_back_in_input_order_as_jsonl(app, tmp_path):
+    source = tmp_path / "queries.txt"
+    source.write_text("convert 100 USD to EUR\n\n{\"query\": \"250 GBP to JPY\"}\n{\"text\": \"no query\"}\n",
+                      encoding="utf-8")
+    output = io.StringIO()
+    summary = app.run_piped_queries(str(source), "direct", workers=3, output=output)
+
+    results = [json.loads(line) for line in output.getvalue().splitlines()]
+    assert [result["line"] for result in results] == [1, 3, 4]
+    assert results[0]["parsed"]["to_currency"] == "EUR" and results[1]["parsed"]["from_currency"] == "GBP"
+    assert "error" in results[2]
+    assert summary["total"]["count"] == 2
+
+
+def test_stdout_is_left_alone_while_queries_run(app, tmp_path, monkeypatch):
+    seen = []
+
+    def run_conversion(query, mode):
+        seen.append(sys.stdout)
+        return {"response": "ok", "mode": "direct", "parsed": None, "timings": {}}
+
+    monkeypatch.setattr(app, "run_conversion", run_conversion)
+    source = tmp_path / "queries.txt"
+    source.write_text("a\nb\n", encoding="utf-8")
+    stdout = sys.stdout
+    app.run_piped_queries(str(source), "direct", workers=2, output=io.StringIO())
+    assert seen == [stdout, stdout]
@@ -0,0 +1,101 @@
+from datetime import date
+from pathlib import Path
+
+import pytest
+
+DAY = date(2024, 3, 1)
+
+
+def test_recorded_day_answers_cross_rates(app, tmp_path):
+    archive = app.RateArchive(tmp_path)
+    assert archive.record("USD", {"USD": 1.0, "EUR": 0.9, "JPY": 150.0}, DAY)
+    assert archive.rate("USD", DAY, "EUR", "JPY") == pytest.approx(150.0 / 0.9)
+    assert archive.rate("USD", DAY, "USD", "EUR") == pytest.approx(0.9)
+
+
+def test_unrecorded_days_and_codes_miss(app, tmp_path):
+    archive = app.RateArchive(tmp_path)
+    archive.record("USD", {"USD": 1.0, "EUR": 0.9}, DAY)
+    assert archive.rate("USD", date(2024, 2, 29), "USD", "EUR") is None
+    assert archive.rate("USD", date(2024, 3, 2), "USD", "EUR") is None
+    assert archive.rate("USD", DAY, "USD", "GBP") is None
+    assert archive.rate("EUR", DAY, "EUR", "USD") is None
+    assert archive.stats()["lookup_misses"] == 4
+
+
+def test_new_codes_and_rewrites_are_seen_by_other_readers(app, tmp_path):
+    reader = app.RateArchive(tmp_path)
+    writer = app.RateArchive(tmp_path)
+    writer.record("USD", {"USD": 1.0, "EUR": 0.9}, DAY)
+    assert reader.rate("USD", DAY, "USD", "EUR") == pytest.approx(0.9)
+
+    writer.record("USD", {"USD": 1.0, "EUR": 0.95, "GBP": 0.8}, DAY)
+    assert reader.rate("USD", DAY, "USD", "EUR") == pytest.approx(0.95)
+    assert reader.rate("USD", DAY, "EUR", "GBP") == pytest.approx(0.8 / 0.95)
+
+
+def test_days_before_the_epoch_are_not_archived(app, tmp_path):
+    assert not app.RateArchive(tmp_path).record("USD", {"USD": 1.0}, date(1989, 12, 31))
+
+
+def test_historical_date_validation(app):
+    assert app.historical_date(None) is None
+    assert app.historical_date("2024-03-01") == DAY
+    with pytest.raises(app.RateFetchError):
+        app.historical_date("03/01/2024")
+    with pytest.raises(app.RateFetchError):
+        app.historical_date("2999-01-01")
+    with pytest.raises(app.RateFetchError):
+        app.historical_date("1980-01-01")
+
+
+def test_engine_fetches_a_missing_day_once_then_reads_the_archive(app, stub_api, tmp_path):
+    engine = app.CrossRateEngine(archive=app.RateArchive(tmp_path))
+    before = stub_api.requests
+    first = engine.rate("USD", "EUR", DAY.isoformat())
+    second = engine.rate("EUR", "USD", DAY.isoformat())
+    assert first == pytest.approx(0.92)
+    assert second == pytest.approx(1 / 0.92)
+    assert stub_api.requests - before == 1
+
+
+def test_directory_is_created_on_the_first_write(app, tmp_path):
+    archive = app.RateArchive(tmp_path / "nested" / "archive")
+    assert not (tmp_path / "nested").exists()
+    assert archive.rate("USD", DAY, "USD", "EUR") is None
+    assert archive.record("USD", {"USD": 1.0, "EUR": 0.9}, DAY)
+    assert archive.rate("USD", DAY, "USD", "EUR") == pytest.approx(0.9)
+
+
+def test_unwritable_directory_turns_recording_off(app, tmp_path):
+    blocker = tmp_path / "not-a-directory"
+    blocker.write_text("")
+    archive = app.RateArchive(blocker / "archive")
+    assert not archive.record("USD", {"USD": 1.0, "EUR": 0.9}, DAY)
+    assert not archive.writable
+    assert not archive.record("USD", {"USD": 1.0, "EUR": 0.9}, DAY)
+    assert archive.stats()["rows_written"] == 0
+
+
+def test_growth_closes_the_previous_mapping(app, tmp_path):
+    archive = app.RateArchive(tmp_path)
+    archive.record("USD", {"USD": 1.0, "EUR": 0.9}, DAY)
+    assert archive.rate("USD", DAY, "USD", "EUR") == pytest.approx(0.9)
+    old = archive._views["USD"][3]
+
+    later = date(2024, 4, 1)
+    archive.record("USD", {"USD": 1.0, "EUR": 0.95}, later)
+    assert archive.rate("USD", later, "USD", "EUR") == pytest.approx(0.95)
+    assert old.closed and not archive._views["USD"][3].closed
+    stale_view = (0, 1 << 30, {"USD": 0, "EUR": 1}, old)  # what a concurrent reader may still hold
+    assert archive._read_rate(stale_view, DAY, "USD", "EUR") is None
+
+
+@pytest.mark.skipif(not Path("/proc/self/maps").exists(), reason="needs /proc")
+def test_a_bad_header_leaves_no_mapping_open(app, tmp_path):
+    archive = app.RateArchive(tmp_path)
+    (tmp_path / "USD.codes").write_bytes(b"USD\0")
+    rates_path = tmp_path / "USD.rates"
+    rates_path.write_bytes(b"\0" * 4096)
+    assert archive.rate("USD", DAY, "USD", "USD") is None
+    assert str(rates_path) not in Path("/proc/self/maps").read_text()
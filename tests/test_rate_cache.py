@@ -0,0 +1,97 @@
+import threading
+import time
+
+import pytest
+
+from offline_stubs import STUB_RATES
+
+
+def test_second_lookup_is_served_from_memory(app, stub_api):
+    cache = app.RateTableCache()
+    before = stub_api.requests
+    first = cache.get("usd")
+    second = cache.get("USD")
+    assert first is second
+    assert first["EUR"] == pytest.approx(STUB_RATES["EUR"])
+    assert stub_api.requests - before == 1
+    assert cache.stats()["hits"] == 1 and cache.stats()["misses"] == 1
+
+
+def test_concurrent_misses_make_one_upstream_call(app, stub_api):
+    stub_api.latency_ms = 100
+    cache = app.RateTableCache()
+    before = stub_api.requests
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(cache.get("EUR"))) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(10)
+    assert len(results) == 8
+    assert stub_api.requests - before == 1
+
+
+def test_expired_table_is_fetched_again(app, stub_api):
+    cache = app.RateTableCache(ttl_seconds=0.05, max_staleness_seconds=0)
+    before = stub_api.requests
+    cache.get("USD")
+    assert cache.is_fresh("USD")
+    time.sleep(0.1)
+    assert not cache.is_fresh("USD")
+    cache.get("USD")
+    assert stub_api.requests - before == 2
+
+
+def test_expiry_follows_an_earlier_provider_update(app):
+    cache = app.RateTableCache(ttl_seconds=3600)
+    now = 1_000_000.0
+    assert cache._expiry(now + 60, now) == now + 60
+    assert cache._expiry(now + 7200, now) == now + 3600
+    assert cache._expiry(None, now) == now + 3600
+
+
+def test_stale_table_is_served_while_the_provider_fails(app, stub_api):
+    cache = app.RateTableCache(ttl_seconds=0.05, max_staleness_seconds=60)
+    table = cache.get("USD")
+    time.sleep(0.1)
+    stub_api.error_rate = 1.0
+    assert cache.get("USD") is table
+    assert cache.status("USD")[1] is True  # still marked stale
+    assert cache.stats()["stale_hits"] == 1
+
+
+def test_failure_past_the_staleness_bound_raises(app, stub_api):
+    cache = app.RateTableCache(ttl_seconds=0.05, max_staleness_seconds=0)
+    cache.get("USD")
+    time.sleep(0.1)
+    stub_api.error_rate = 1.0
+    with pytest.raises(app.RateFetchError):
+        cache.get("USD")
+
+
+def test_stale_hit_hands_the_refresh_to_on_stale(app, stub_api):
+    cache = app.RateTableCache(ttl_seconds=0.05, max_staleness_seconds=60)
+    table = cache.get("USD")
+    refreshed = []
+    cache.on_stale = refreshed.append
+    time.sleep(0.1)
+    before = stub_api.requests
+    assert cache.get("USD") is table
+    assert refreshed == ["USD"]
+    assert stub_api.requests == before
+
+
+def test_least_recently_used_table_is_evicted(app):
+    cache = app.RateTableCache(max_entries=2)
+    cache.get("USD")
+    cache.get("EUR")
+    cache.get("USD")
+    cache.get("GBP")
+    assert cache.is_fresh("USD") and cache.is_fresh("GBP")
+    assert not cache.is_fresh("EUR")
+    assert cache.stats()["evictions"] == 1
+
+
+def test_unsupported_base_raises(app):
+    with pytest.raises(app.RateFetchError, match="unsupported"):
+        app.RateTableCache().get("XXX")
@@ -0,0 +1,170 @@
+import asyncio
+import os
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+from email.utils import format_datetime
+from types import SimpleNamespace
+
+import pytest
+
+import currency_converter_app
+
+fcntl = currency_converter_app.fcntl
+
+
+@pytest.fixture
+def fast_backoff(app, monkeypatch):
+    monkeypatch.setattr(app, "UPSTREAM_BACKOFF_BASE_SECONDS", 0.01)
+
+
+def test_waiters_are_served_by_priority(app):
+    scheduler = app.UpstreamScheduler("test", rate_per_second=10, burst=1)
+    scheduler.acquire()  # empty the bucket so everyone below has to queue
+    granted = []
+
+    def wait(priority):
+        scheduler.acquire(priority)
+        granted.append(priority)
+
+    threads = []
+    for priority in (app.PRIORITY_BACKGROUND, app.PRIORITY_BATCH, app.PRIORITY_INTERACTIVE):
+        threads.append(threading.Thread(target=wait, args=(priority,)))
+        threads[-1].start()
+        time.sleep(0.01)  # queue in this order, all before the next token at 100 ms
+    for thread in threads:
+        thread.join(5)
+    assert granted == [app.PRIORITY_INTERACTIVE, app.PRIORITY_BATCH, app.PRIORITY_BACKGROUND]
+
+
+def test_call_retries_429s_and_slows_the_bucket_until_calls_succeed(app, fast_backoff):
+    scheduler = app.UpstreamScheduler("test", rate_per_second=100, burst=10)
+    outcomes = [app.UpstreamRateLimited("429"), app.UpstreamRateLimited("429"), "ok"]
+
+    def flaky():
+        outcome = outcomes.pop(0)
+        if isinstance(outcome, Exception):
+            raise outcome
+        return outcome
+
+    assert scheduler.call(flaky) == "ok"
+    stats = scheduler.stats()
+    assert (stats["throttled"], stats["retries"]) == (2, 2)
+    assert stats["rate_per_second"] == pytest.approx(100 / 4 + 100 / 20)  # halved twice, then one success
+
+
+def test_retries_stop_at_max_retries_and_other_errors_are_not_retried(app, fast_backoff):
+    scheduler = app.UpstreamScheduler("test", rate_per_second=100, burst=10, max_retries=1)
+    calls = []
+
+    def always_limited():
+        calls.append(1)
+        raise app.UpstreamRateLimited("429")
+
+    with pytest.raises(app.UpstreamRateLimited):
+        scheduler.call(always_limited)
+    assert len(calls) == 2
+
+    with pytest.raises(ValueError):
+        scheduler.call(lambda: (_ for _ in ()).throw(ValueError("boom")))
+    assert scheduler.stats()["retries"] == 1
+
+
+def test_retry_after_sets_the_minimum_pause(app, fast_backoff):
+    scheduler = app.UpstreamScheduler("test", rate_per_second=100, burst=10)
+    assert scheduler.record_throttle(0.2) >= 0.2
+    assert scheduler.acquire() >= 0.15
+
+
+def test_retry_after_is_read_from_seconds_dates_and_llm_errors(app):
+    assert app._retry_after_seconds({"retry-after": "3"}) == 3.0
+    soon = format_datetime(datetime.now(timezone.utc) + timedelta(seconds=30), usegmt=True)
+    assert 25 < app._retry_after_seconds({"retry-after": soon}) <= 30
+    assert app._retry_after_seconds({"retry-after": "soon"}) is None
+
+    llm_error = Exception("rate limited")
+    llm_error.status_code = 429
+    llm_error.response = SimpleNamespace(headers={"retry-after": "2"})
+    assert app.rate_limit_retry_after(llm_error) == 2.0
+    assert app.rate_limit_retry_after(app.UpstreamRateLimited("429")) == 0.0
+    assert app.rate_limit_retry_after(ValueError("not a 429")) is None
+
+
+def test_a_full_queue_times_out(app):
+    scheduler = app.UpstreamScheduler("test", rate_per_second=0.01, burst=1, max_wait_seconds=0.05)
+    scheduler.acquire()
+    with pytest.raises(app.UpstreamBusyError):
+        scheduler.acquire()
+    assert scheduler.stats()["timeouts"] == 1
+
+
+@pytest.mark.skipif(fcntl is None, reason="needs flock")
+def test_schedulers_sharing_a_directory_spend_one_budget(app, fast_backoff, tmp_path):
+    first, second = (app.UpstreamScheduler("test", rate_per_second=0.01, burst=2, max_wait_seconds=0.05,
+                                           shared_dir=tmp_path / "shared") for _ in range(2))
+    first.acquire()
+    second.acquire()
+    with pytest.raises(app.UpstreamBusyError):
+        first.acquire()
+    assert first.stats()["shared"] and (tmp_path / "shared" / "upstream-test.bucket").exists()
+
+    third = app.UpstreamScheduler("other", rate_per_second=100, burst=10, shared_dir=tmp_path)
+    fourth = app.UpstreamScheduler("other", rate_per_second=100, burst=10, shared_dir=tmp_path)
+    third.record_throttle(0.2)  # a 429 seen by one process pauses the others
+    assert fourth.acquire() >= 0.15
+
+
+def test_unwritable_shared_directory_falls_back_to_a_local_bucket(app, tmp_path):
+    blocker = tmp_path / "not-a-directory"
+    blocker.write_text("")
+    scheduler = app.UpstreamScheduler("test", rate_per_second=100, burst=10, shared_dir=blocker / "shared")
+    scheduler.acquire()
+    assert not scheduler.stats()["shared"]
+
+
+@pytest.mark.skipif(fcntl is None, reason="needs flock")
+def test_async_acquire_does_not_block_the_loop_while_another_process_holds_the_bucket(app, tmp_path):
+    scheduler = app.UpstreamScheduler("test", rate_per_second=100, burst=10, max_wait_seconds=0.2, shared_dir=tmp_path)
+    scheduler.acquire()
+    fd = scheduler._bucket_fd()
+    other = os.open(scheduler.shared_path, os.O_RDWR)  # another open file, as another worker would have
+    fcntl.flock(other, fcntl.LOCK_EX)
+    ticks = []
+
+    async def ticker():
+        while True:
+            ticks.append(time.monotonic())
+            await asyncio.sleep(0.01)
+
+    async def contended():
+        task = asyncio.ensure_future(ticker())
+        try:
+            with pytest.raises(app.UpstreamBusyError):
+                await scheduler.acquire_async()
+        finally:
+            task.cancel()
+
+    try:
+        asyncio.run(contended())
+    finally:
+        fcntl.flock(other, fcntl.LOCK_UN)
+        os.close(other)
+    assert len(ticks) >= 10  # the loop kept running while the bucket was locked
+    assert scheduler.acquire() < 0.05 and scheduler._bucket_fd() == fd  # the file stays open between calls
+
+
+@pytest.mark.skipif(fcntl is None or not hasattr(os, "fork"), reason="needs fork")
+def test_a_forked_child_reopens_the_bucket_file(app, tmp_path):
+    scheduler = app.UpstreamScheduler("test", rate_per_second=100, burst=10, shared_dir=tmp_path)
+    scheduler.acquire()
+    fd = scheduler._bucket_fd()
+    fcntl.flock(fd, fcntl.LOCK_EX)
+    try:
+        pid = os.fork()
+        if pid == 0:
+            # The inherited file shares the parent's flock; a reopened one must see it as held
+            os._exit(0 if not scheduler._lock_bucket(blocking=False) else 1)
+        _, status = os.waitpid(pid, 0)
+    finally:
+        fcntl.flock(fd, fcntl.LOCK_UN)
+    assert os.waitstatus_to_exitcode(status) == 0
@@ -0,0 +1,55 @@
+import time
+
+import pytest
+
+
+def test_table_published_by_one_process_is_loaded_by_another(app, tmp_path):
+    writer = app.SharedRateStore(tmp_path)
+    reader = app.SharedRateStore(tmp_path)
+    now = time.time()
+    writer.publish("USD", {"USD": 1.0, "EUR": 0.92}, now, now + 60)
+
+    rates, fetched_at, expires_at = reader.load("USD")
+    assert rates == {"USD": 1.0, "EUR": 0.92}
+    assert (fetched_at, expires_at) == (now, now + 60)
+
+
+def test_unchanged_file_is_decoded_once_and_a_replacement_is_seen(app, tmp_path):
+    store = app.SharedRateStore(tmp_path)
+    now = time.time()
+    store.publish("USD", {"EUR": 0.9}, now, now + 60)
+    store.load("USD")
+    store.load("USD")
+    assert store.stats()["decodes"] == 1
+
+    app.SharedRateStore(tmp_path).publish("USD", {"EUR": 0.95}, now + 1, now + 61)
+    assert store.load("USD")[0] == {"EUR": 0.95}
+    assert store.stats()["decodes"] == 2
+
+
+def test_missing_or_corrupt_files_read_as_absent(app, tmp_path):
+    store = app.SharedRateStore(tmp_path)
+    assert store.load("USD") is None
+    (tmp_path / "rates-USD.bin").write_bytes(b"not a rate table")
+    assert store.load("USD") is None
+
+
+def test_cache_adopts_a_fresh_shared_table_without_fetching(app, stub_api, tmp_path):
+    now = time.time()
+    app.SharedRateStore(tmp_path).publish("USD", {"USD": 1.0, "EUR": 0.5}, now, now + 60)
+    cache = app.RateTableCache(shared_store=app.SharedRateStore(tmp_path))
+    before = stub_api.requests
+    assert cache.get("USD")["EUR"] == 0.5
+    assert stub_api.requests == before
+    assert cache.stats()["shared_hits"] == 1
+
+
+def test_expired_shared_table_is_refetched_and_republished(app, stub_api, tmp_path):
+    now = time.time()
+    app.SharedRateStore(tmp_path).publish("USD", {"USD": 1.0, "EUR": 0.5}, now - 120, now - 60)
+    store = app.SharedRateStore(tmp_path)
+    cache = app.RateTableCache(shared_store=store)
+    before = stub_api.requests
+    assert cache.get("USD")["EUR"] == pytest.approx(0.92)
+    assert stub_api.requests - before == 1
+    assert app.SharedRateStore(tmp_path).load("USD")[0]["EUR"] == pytest.approx(0.92)
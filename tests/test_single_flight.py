@@ -0,0 +1,97 @@
+import asyncio
+import threading
+import time
+
+import pytest
+
+
+def test_concurrent_calls_share_one_execution(app):
+    flight = app.SingleFlight("test")
+    calls = []
+    release = threading.Event()
+
+    def slow():
+        calls.append(1)
+        release.wait(5)
+        return "table"
+
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(flight.do("USD", slow))) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    time.sleep(0.1)
+    release.set()
+    for thread in threads:
+        thread.join(5)
+
+    assert results == ["table"] * 8
+    assert len(calls) == 1
+    assert flight.stats()["executed"] == 1 and flight.stats()["collapsed"] == 7
+    assert flight.stats()["in_flight"] == 0
+
+
+def test_waiters_share_the_leaders_error(app):
+    flight = app.SingleFlight("test")
+    started = threading.Event()
+
+    def failing():
+        started.set()
+        time.sleep(0.1)
+        raise app.RateFetchError("upstream down")
+
+    errors = []
+
+    def call():
+        try:
+            flight.do("USD", failing)
+        except app.RateFetchError as e:
+            errors.append(str(e))
+
+    leader = threading.Thread(target=call)
+    leader.start()
+    started.wait(5)
+    follower = threading.Thread(target=call)
+    follower.start()
+    leader.join(5)
+    follower.join(5)
+    assert errors == ["upstream down", "upstream down"]
+
+
+def test_keys_do_not_coalesce_and_later_calls_run_again(app):
+    flight = app.SingleFlight("test")
+    assert flight.do("USD", lambda: 1) == 1
+    assert flight.do("EUR", lambda: 2) == 2
+    assert flight.do("USD", lambda: 3) == 3
+    assert flight.stats()["executed"] == 3
+
+
+def test_async_calls_coalesce(app):
+    flight = app.SingleFlight("test")
+    calls = []
+
+    async def fetch():
+        calls.append(1)
+        await asyncio.sleep(0.05)
+        return "table"
+
+    async def main():
+        return await asyncio.gather(*(flight.do_async("USD", fetch) for _ in range(5)))
+
+    assert asyncio.run(main()) == ["table"] * 5
+    assert len(calls) == 1
+
+
+def test_async_error_reaches_every_waiter(app):
+    flight = app.SingleFlight("test")
+
+    async def fetch():
+        await asyncio.sleep(0.05)
+        raise app.RateFetchError("bad")
+
+    async def main():
+        return await asyncio.gather(*(flight.do_async("USD", fetch) for _ in range(3)), return_exceptions=True)
+
+    results = asyncio.run(main())
+    assert all(isinstance(result, app.RateFetchError) for result in results)
+    with pytest.raises(app.RateFetchError):
+        asyncio.run(flight.do_async("USD", fetch))
@@ -0,0 +1,34 @@
+def run_stream(app, query, mode="insight"):
+    return list(app.stream_currency_conversion(query, mode))
+
+
+def test_stream_emits_the_result_before_the_commentary(app, monkeypatch):
+    monkeypatch.setattr(app, "stream_insight", lambda parsed, text, needs_context: iter(["100 USD ", "is ", "92.00 EUR."]))
+    events = run_stream(app, "convert 100 USD to EUR")
+    assert [event for event, _ in events] == ["parsed", "result", "insight", "insight", "insight", "done"]
+    result = dict(events)["result"]
+    assert result["converted_amount"] == result["rate"] * 100
+
+
+def test_streamed_commentary_is_cached_and_replayed_in_one_chunk(app, monkeypatch):
+    streams = []
+
+    def stream_insight(parsed, text, needs_context):
+        streams.append(parsed["amount"])
+        yield f"{parsed['amount']:g} USD "
+        yield f"is {parsed['amount'] * 0.92:.2f} EUR. "
+        yield "The euro is up 3% this month."
+
+    monkeypatch.setattr(app, "stream_insight", stream_insight)
+    run_stream(app, "convert 100 USD to EUR")
+    replay = run_stream(app, "convert 100 USD to EUR")
+    assert [payload["text"] for event, payload in replay if event == "insight"] == ["100 USD is 92.00 EUR. The euro is up 3% this month."]
+    other = dict(run_stream(app, "how much is 250 USD in EUR"))
+    assert other["result"]["converted_amount"] == other["result"]["rate"] * 250
+    assert other["insight"]["text"] == "The euro is up 3% this month."
+    assert streams == [100.0]
+
+
+def test_direct_mode_stream_has_no_commentary(app):
+    events = run_stream(app, "convert 100 USD to EUR", mode="direct")
+    assert [event for event, _ in events] == ["parsed", "result", "done"]
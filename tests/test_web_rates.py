@@ -0,0 +1,58 @@
+import time
+
+import pytest
+
+RATES = {"USD": 1.0, "EUR": 0.92, "GBP": 0.79, "JPY": 151.2}
+
+
+@pytest.fixture
+def snapshot():
+    return {"base": "USD", "version": 1, "rates": dict(RATES), "fetched_at": time.time(),
+            "expires_at": time.time() + 600}
+
+
+@pytest.fixture
+def client(app, snapshot, monkeypatch):
+    """A test client for web_app serving `snapshot` from /rates, with a fresh body cache."""
+    import web_app
+
+    monkeypatch.setattr(web_app, "published_rate_snapshot", lambda: dict(snapshot))
+    monkeypatch.setattr(web_app, "_rates_bodies", {"version": None, "digest": None, "encodings": {}})
+    return web_app.create_app().test_client()
+
+
+def test_matching_if_none_match_gets_a_304(client, snapshot):
+    first = client.get("/rates")
+    assert first.status_code == 200 and first.json == {"base": "USD", "rates": RATES}
+    assert first.headers["ETag"].startswith('"')  # strong
+    assert 590 <= int(first.headers["Cache-Control"].rsplit("=", 1)[1]) <= 600
+    assert first.expires.timestamp() == pytest.approx(snapshot["expires_at"], abs=1)
+    assert first.last_modified.timestamp() == pytest.approx(snapshot["fetched_at"], abs=1)
+
+    again = client.get("/rates", headers={"If-None-Match": first.headers["ETag"]})
+    assert again.status_code == 304 and again.data == b""
+    assert again.headers["ETag"] == first.headers["ETag"]
+
+
+def test_body_and_etag_ignore_per_process_timestamps_but_follow_the_rates(client, snapshot):
+    first = client.get("/rates")
+
+    # Another worker's snapshot of the same table: different version and times, same rates
+    snapshot.update(version=7, fetched_at=snapshot["fetched_at"] + 42, expires_at=snapshot["expires_at"] + 42)
+    assert client.get("/rates").data == first.data
+    assert client.get("/rates", headers={"If-None-Match": first.headers["ETag"]}).status_code == 304
+
+    snapshot.update(version=8, rates={**RATES, "EUR": 0.93})
+    changed = client.get("/rates", headers={"If-None-Match": first.headers["ETag"]})
+    assert changed.status_code == 200 and changed.headers["ETag"] != first.headers["ETag"]
+
+
+def test_each_encoding_has_its_own_strong_tag(client, snapshot):
+    snapshot["rates"].update({f"C{n:02d}": float(n) for n in range(60)})  # over RATES_COMPRESS_MIN_BYTES
+    plain = client.get("/rates", headers={"Accept-Encoding": "identity"})
+    gzipped = client.get("/rates", headers={"Accept-Encoding": "gzip"})
+    assert gzipped.headers["Content-Encoding"] == "gzip"
+    assert gzipped.headers["ETag"] == plain.headers["ETag"][:-1] + '-gzip"'
+
+    assert client.get("/rates", headers={"Accept-Encoding": "gzip", "If-None-Match": gzipped.headers["ETag"]}).status_code == 304
+    assert client.get("/rates", headers={"Accept-Encoding": "gzip", "If-None-Match": plain.headers["ETag"]}).status_code == 200